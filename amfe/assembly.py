@@ -124,6 +124,63 @@ if use_fortran:
 
 
 
+def k_and_f_deim_stacked(ele_obj, proj_stack, X_stack, V_stack=None,
+                         u_red=None, t=0, symmetric=False):
+    '''
+    Evaluate the reduced DEIM stiffness matrix and force vector for element
+    data stored in contiguous 3-D arrays.
+
+    Parameters
+    ----------
+    ele_obj : list
+        Element objects of the sampled elements.
+    proj_stack : ndarray, shape (no_of_elements, n_red, ele_dofs)
+        Oblique projectors of the sampled elements.
+    X_stack : ndarray, shape (no_of_elements, ele_dofs)
+        Nodal coordinates of the sampled elements in voigt notation.
+    V_stack : ndarray, shape (no_of_elements, ele_dofs, n_red), optional
+        Rows of the basis belonging to the element dofs. Not needed for the
+        symmetric variant.
+    u_red : ndarray, optional
+        Reduced displacement. Default is `None`, i.e. zero displacement.
+    t : float, optional
+        Time. Default value 0.
+    symmetric : bool, optional
+        Flag for the symmetric DEIM variant, where the element displacements
+        are given by proj.T @ u_red. Default False.
+
+    Returns
+    -------
+    K : ndarray, shape (n_red, n_red)
+        Reduced DEIM stiffness matrix.
+    f : ndarray, shape (n_red, )
+        Reduced DEIM force vector.
+
+    '''
+    no_of_elements, ndim_red, ele_dofs = proj_stack.shape
+    if u_red is None:
+        u_red = np.zeros(ndim_red)
+
+    if symmetric:
+        U_local = np.einsum('end,n->ed', proj_stack, u_red)
+    else:
+        U_local = V_stack @ u_red
+
+    K_stack = np.zeros((no_of_elements, ele_dofs, ele_dofs))
+    f_stack = np.zeros((no_of_elements, ele_dofs))
+    for k, element in enumerate(ele_obj):
+        K_stack[k], f_stack[k] = element.k_and_f_int(X_stack[k], U_local[k], t)
+
+    f = np.einsum('end,ed->n', proj_stack, f_stack)
+    if symmetric:
+        K = np.einsum('end,edk,emk->nm', proj_stack, K_stack, proj_stack,
+                      optimize=True)
+    else:
+        K = np.einsum('end,edk,ekm->nm', proj_stack, K_stack, V_stack,
+                      optimize=True)
+    return K, f
+
+
 class Assembly():
     '''
     Class for the more fancy assembly of meshes with non-heterogeneous
@@ -173,6 +230,8 @@ class Assembly():
         self.nodes_voigt = sp.array([])
         self.elements_on_node = None
         self.C_deim = None
+        self.unassembled_offsets = None
+        self.K0_unassembled = None
 
     def preallocate_csr(self):
         '''
@@ -197,7 +256,7 @@ class Assembly():
 
         '''
         print('Preallocating the stiffness matrix')
-        t1 = time.clock()
+        t1 = time.time()
         # computation of all necessary variables:
         no_of_elements = self.mesh.no_of_elements
         no_of_dofs = self.mesh.no_of_dofs
@@ -236,7 +295,7 @@ class Assembly():
         # will be filled in assembly
         self.C_csr = sp.sparse.csr_matrix((vals_global, (row_global, col_global)),
                                           shape=(no_of_dofs, no_of_dofs), dtype=float)
-        t2 = time.clock()
+        t2 = time.time()
         print('Done preallocating stiffness matrix with', no_of_elements,
               'elements and', no_of_dofs, 'dofs.')
         print('Time taken for preallocation: {0:2.2f} seconds.'.format(t2 - t1))
@@ -305,6 +364,12 @@ class Assembly():
                    for i in nodes], dtype=int).reshape(-1)
          for nodes in nm_connectivity]
 
+        # offsets of the elements in unassembled vectors as used in DEIM; the
+        # cached linear element stiffness matrices belong to the old indices
+        self.unassembled_offsets = np.cumsum(
+            [0] + [len(indices) for indices in self.element_indices])
+        self.K0_unassembled = None
+
         # compute nodes_frequency for stress recovery
         nodes_vec = np.concatenate(self.mesh.connectivity)
         self.elements_on_node = np.bincount(nodes_vec)
@@ -355,6 +420,41 @@ class Assembly():
         return K_csr, f_glob
 
 
+    def assemble_dk_dv(self, u, v, t=0):
+        '''
+        Assembles the directional derivative of the tangential stiffness matrix
+        dK/du @ v of the given mesh and element in one assembly pass.
+
+        Parameters
+        -----------
+        u : ndarray
+            nodal displacement of the nodes in Voigt-notation
+        v : ndarray
+            direction of the derivative in Voigt-notation
+        t : float, optional
+            time. Default: 0.
+
+        Returns
+        --------
+        dK : sparse.csr_matrix
+            unconstrained assembled directional derivative of the stiffness
+            matrix in sparse matrix csr format.
+        '''
+        if u is None:
+            u = np.zeros_like(self.nodes_voigt)
+
+        dK_csr = self.C_csr.copy()
+
+        for i, indices in enumerate(self.element_indices):
+            X_local = self.nodes_voigt[indices]
+            dK = self.mesh.ele_obj[i].dk_dv_int(X_local, u[indices],
+                                                v[indices], t)
+            fill_csr_matrix(dK_csr.indptr, dK_csr.indices, dK_csr.data, dK,
+                            indices)
+
+        return dK_csr
+
+
     def assemble_m(self, u=None, t=0):
         '''
         Assembles the mass matrix of the given mesh and element.
@@ -472,7 +572,8 @@ class Assembly():
 
         return K_csr, f_glob, E_global, S_global
 
-    def assemble_g_and_b(self, V, S, verbose=False):
+    def assemble_g_and_b(self, V, S, verbose=False, row_compression=None,
+                         elements=None, chunk_size=100):
         '''
         Assembles the element contributin matrix G for the given basis V and
         the snapshots S.
@@ -487,13 +588,26 @@ class Assembly():
         S : ndarray, shape (N_unconstr, m)
             Snapshots gathered as column vectors.
         verbose : print dots for the
+        row_compression : instance of RowCompression, optional
+            If given, the rows of G are compressed while the element columns
+            are computed, so the full matrix G is never stored. The
+            compression object is reset and gets blocks of chunk_size columns
+            via its update method. Default is `None`, i.e. G is not
+            compressed.
+        elements : ndarray, optional
+            Indices of the elements whose columns are assembled. Default is
+            `None`, i.e. all elements.
+        chunk_size : int, optional
+            Number of element columns which are passed to row_compression at
+            once. Default value 100.
 
         Returns
         -------
         G : ndarray, shape (n*m, no_of_elements)
             Contribution matrix of internal forces. The columns form the
             internal force contributions on the basis V for the m snapshots
-            gathered in S.
+            gathered in S. If row_compression is given, G has the compressed
+            number of rows.
         b : ndarray, shape (n*m, )
             summed force contribution
 
@@ -511,29 +625,150 @@ class Assembly():
 
         N_unconstr, n = V.shape
         __, m = S.shape
+        if elements is None:
+            elements = np.arange(len(self.element_indices))
 
         if verbose:
             print('Start building large selection matrix G.',
                   'In total {0:d} elements are treated:'.format(
-                      len(self.element_indices)))
-        G = np.zeros((n*m, len(self.element_indices)))
+                      len(elements)))
+        if row_compression is None:
+            G = np.zeros((n*m, len(elements)))
+        else:
+            G = np.zeros((n*m, min(chunk_size, len(elements))))
+            row_compression.reset()
 
         # loop over all elements
-        for i, indices in enumerate(self.element_indices):
+        for k, i in enumerate(elements):
+            indices = self.element_indices[i]
             # node_indices = self.mesh.connectivity[i]
             X_local = self.nodes_voigt[indices]
             V_ele = V[indices, :]
             if verbose:
                 print('.', sep='', end='')
+            col = k if row_compression is None else k % chunk_size
             # loop over all snapshots
             for j, u in enumerate(S.T):
                 u_local = u[indices]
                 f = self.mesh.ele_obj[i].f_int(X_local, u_local)
-                G[j*n:(j+1)*n,i] = V_ele.T @ f
+                G[j*n:(j+1)*n,col] = V_ele.T @ f
+            # pass the full buffer or the last columns to the compression
+            if row_compression is not None and \
+                    (col == chunk_size - 1 or k == len(elements) - 1):
+                row_compression.update(G[:,:col+1])
+
+        if row_compression is not None:
+            G = row_compression.compressed_matrix()
+        b = np.sum(G, axis=1)
+        return G, b
+
+    def assemble_g_and_b_qm(self, V, Theta, U_red, verbose=False):
+        '''
+        Assembles the element contribution matrix G for a quadratic manifold
+        with the basis V and the packed quadratic tensor Theta.
+
+        The test basis is the tangent P(u) = V + Theta @ u of the manifold,
+        i.e. the columns of G contain the element contributions
+        P_e(u_j).T @ f_e(u_j) for the reduced snapshots u_j. The displacements
+        are lifted on the element dofs only.
+
+        Parameters
+        ----------
+        V : ndarray, shape (N_unconstr, n)
+            unconstrained linear basis
+        Theta : ndarray, shape (N_unconstr, n*(n+1)/2)
+            unconstrained packed quadratic tensor
+        U_red : ndarray, shape (n, m)
+            reduced snapshots gathered as column vectors
+        verbose : bool, optional
+            print dots for every element
+
+        Returns
+        -------
+        G : ndarray, shape (n*m, no_of_elements)
+            Contribution matrix of internal forces.
+        b : ndarray, shape (n*m, )
+            summed force contribution
+
+        '''
+        # imported here, as the quadratic manifold module depends on assembly
+        from .quadratic_manifold.qm_methods import theta_dot, theta_quadratic
+        n, m = U_red.shape
+
+        if verbose:
+            print('Start building large selection matrix G.',
+                  'In total {0:d} elements are treated:'.format(
+                      len(self.element_indices)))
+        G = np.zeros((n*m, len(self.element_indices)))
+
+        for i, indices in enumerate(self.element_indices):
+            X_local = self.nodes_voigt[indices]
+            V_ele = V[indices, :]
+            Theta_ele = Theta[indices, :]
+            if verbose:
+                print('.', sep='', end='')
+            for j, u in enumerate(U_red.T):
+                u_local = V_ele @ u + 1/2*theta_quadratic(Theta_ele, u)
+                P_ele = V_ele + theta_dot(Theta_ele, u)
+                f = self.mesh.ele_obj[i].f_int(X_local, u_local)
+                G[j*n:(j+1)*n,i] = P_ele.T @ f
 
         b = np.sum(G, axis=1)
         return G, b
 
+    def assemble_k_and_f_hyper_qm(self, V, Theta, idxs, xi, u, t):
+        '''
+        Assembly routine for a hyper reduced quadratic manifold system.
+
+        Only the dofs of the elements in the active set are lifted to the
+        manifold, so the cost does not depend on the size of the mesh.
+
+        Parameters
+        ----------
+        V : ndarray, shape: (N_unconstr, n_red)
+            unconstrained linear basis
+        Theta : ndarray, shape: (N_unconstr, n_red*(n_red+1)/2)
+            unconstrained packed quadratic tensor
+        idxs : ndarray, shape (n_ele_hyper, )
+            indices of the elements in the active element set.
+        xi : ndarray, shape (n_ele_hyper, )
+            array of weights for the hyper reduced system
+        u : ndarray, shape: (n_red,)
+            reduced displacement
+        t : ndarray
+            current time
+
+        Returns
+        -------
+        K : ndarray, shape: (n_red, n_red)
+            reduced tangential stiffness matrix P.T @ K @ P + Theta.T @ f_int
+        f_int : ndarray, shape (n_red,)
+            reduced internal force vector P.T @ f_int
+
+        '''
+        from .quadratic_manifold.qm_methods import theta_dot, theta_quadratic, \
+            theta_transpose_dot
+        n_red = V.shape[1]
+        K_red = np.zeros((n_red, n_red))
+        f_red = np.zeros(n_red)
+        if u is None:
+            u = np.zeros(n_red)
+
+        for i, idx in enumerate(idxs):
+            indices = self.element_indices[idx]
+            X_loc = self.nodes_voigt[indices]
+            V_ele = V[indices,:]
+            Theta_ele = Theta[indices,:]
+            u_loc = V_ele @ u + 1/2*theta_quadratic(Theta_ele, u)
+            P_ele = V_ele + theta_dot(Theta_ele, u)
+            K_ele, f_ele = self.mesh.ele_obj[idx].k_and_f_int(X_loc, u_loc, t)
+
+            f_red += P_ele.T @ f_ele * xi[i]
+            K_red += (P_ele.T @ K_ele @ P_ele
+                      + theta_transpose_dot(Theta_ele, f_ele)) * xi[i]
+
+        return K_red, f_red
+
     def assemble_k_and_f_red(self, V, u, t):
         '''
         Assembly routine for reduces systems. Note, that V has to be
@@ -578,6 +813,39 @@ class Assembly():
 
         return K_red, f_red
 
+    def assemble_f_neumann_red(self, V, u, t):
+        '''
+        Assembly routine for the reduced external force of the Neumann skin
+        elements. Only the rows of V belonging to the skin elements are used,
+        so no vector of the full size is built.
+
+        Parameters
+        ----------
+        V : ndarray, shape: (N_unconstr, n_red)
+            unconstrained reduction basis
+        u : ndarray, shape: (n_red,)
+            reduced displacement field
+        t : float
+            current time
+
+        Returns
+        -------
+        f_ext : ndarray, shape (n_red,)
+            reduced external force vector
+
+        '''
+        f_red = np.zeros(V.shape[1])
+        if u is None:
+            u = np.zeros(V.shape[1])
+
+        for i, indices in enumerate(self.neumann_indices):
+            V_ele = V[indices,:]
+            X_local = self.nodes_voigt[indices]
+            K, f = self.mesh.neumann_obj[i].k_and_f_int(X_local, V_ele @ u, t)
+            f_red += V_ele.T @ f
+
+        return f_red
+
 
     def assemble_k_and_f_hyper(self, V, idxs, xi, u, t):
         '''
@@ -691,6 +959,28 @@ class Assembly():
 
         return K_red, f_red
 
+    def compute_k0_unassembled(self):
+        '''
+        Compute the linear element stiffness matrices, i.e. the element
+        stiffness matrices at zero displacement and time t=0, and cache them
+        for the DEIM force snapshots.
+
+        Returns
+        -------
+        K0_unassembled : list of ndarrays
+            Linear stiffness matrix of every element.
+
+        '''
+        if self.K0_unassembled is None:
+            self.K0_unassembled = []
+            for i, indices in enumerate(self.element_indices):
+                X_local = self.nodes_voigt[indices]
+                K0_ele, __ = self.mesh.ele_obj[i].k_and_f_int(
+                    X_local, np.zeros(len(indices)), 0)
+                # the element objects are shared, so the matrix is copied
+                self.K0_unassembled.append(K0_ele.copy())
+        return self.K0_unassembled
+
     def f_nl_unassembled(self, u=None, t=0):
         '''
         Computes the unassemebled nonlinear force for DEIM.
@@ -708,30 +998,50 @@ class Assembly():
             Unassembled nonlinear internal force
 
         '''
-#         #this works with inhomogeneous meshes
-        dofs_unassembled = len(np.concatenate(self.element_indices))
-        f = np.zeros(dofs_unassembled)
-
         if u is None:
             u = np.zeros(self.mesh.no_of_dofs)
+        return self.f_nl_unassembled_snapshots(u.reshape((-1,1)), t)[:,0]
+
+    def f_nl_unassembled_snapshots(self, U, t=0, out=None):
+        '''
+        Computes the unassembled nonlinear forces for DEIM for a batch of
+        displacement snapshots.
+
+        The linear element stiffness matrices are taken from the cache of
+        compute_k0_unassembled, so only the nonlinear force is evaluated for
+        every snapshot and element.
 
-        dof_idx = 0 # necessary to work with inhomogeneous meshes
+        Parameters
+        ----------
+        U : ndarray, shape (ndof_unconstr, no_of_snapshots)
+            Displacement snapshots gathered as column vectors.
+        t : float
+            Time
+        out : ndarray, shape (ndof_unassembled, no_of_snapshots), optional
+            Preallocated (e.g. memory mapped) array the forces are written
+            to. Default is `None`, i.e. a new array is allocated.
+
+        Returns
+        -------
+        F : ndarray, shape (ndof_unassembled, no_of_snapshots)
+            Unassembled nonlinear internal forces. F[:,j] belongs to U[:,j].
+
+        '''
+        K0_unassembled = self.compute_k0_unassembled()
+        offsets = self.unassembled_offsets
+        if out is None:
+            out = np.zeros((offsets[-1], U.shape[1]))
 
         # Loop over all elements
         for i, indices in enumerate(self.element_indices):
-
             X_local = self.nodes_voigt[indices]
-            u_local = u[indices]
-            K_ele, f_ele = self.mesh.ele_obj[i].k_and_f_int(X_local, u_local, t)
-            K0_ele, __    = self.mesh.ele_obj[i].k_and_f_int(X_local, u_local*0, t)
-            f_ele_nl = f_ele - K0_ele @ u_local
-
-            # assemble the force into the global force vector
-            dofs_ele = indices.shape[0]
-            f[dof_idx : dof_idx+dofs_ele] = f_ele_nl
-            dof_idx += dofs_ele
+            U_local = U[indices, :]
+            F_ele = -K0_unassembled[i] @ U_local
+            for j, u_local in enumerate(U_local.T):
+                F_ele[:,j] += self.mesh.ele_obj[i].f_int(X_local, u_local, t)
+            out[offsets[i]:offsets[i+1], :] = F_ele
 
-        return f
+        return out
 
     def assemble_k_and_f_DEIM(self, E_tilde, proj_list, V, u_red=None, t=0,
                                 symmetric=False):
@@ -739,46 +1049,61 @@ class Assembly():
         Assemble the DEIM matrix and vector. This function is suited for large
         systems, as only hte proj list is used.
 
-        '''
-        ndim_red, ele_dofs = proj_list[0].shape
-#        ndim_red, no_of_force_modes = oblique_proj.shape
-#        ele_dofs = len(self.mesh_class.element_indices[0])
+        The element data is gathered on every call; for repeated evaluations
+        use assemble_k_and_f_DEIM_stacked with precomputed stacks.
 
-        f = np.zeros(ndim_red)
-        K = np.zeros((ndim_red, ndim_red))
+        '''
+        E_tilde = np.asarray(E_tilde, dtype=int)
+        X_stack = np.array([self.nodes_voigt[self.element_indices[ele]]
+                            for ele in E_tilde])
+        V_stack = None
+        if not symmetric:
+            V_stack = np.array([V[self.element_indices[ele], :]
+                                for ele in E_tilde])
+        return self.assemble_k_and_f_DEIM_stacked(E_tilde, proj_list, X_stack,
+                                                  V_stack, u_red, t, symmetric)
+
+    def assemble_k_and_f_DEIM_stacked(self, E_tilde, proj_stack, X_stack,
+                                      V_stack=None, u_red=None, t=0,
+                                      symmetric=False):
+        '''
+        Assemble the DEIM matrix and vector with the element data stored in
+        contiguous 3-D arrays.
 
-        if u_red is None and not symmetric:
-            u_full = np.zeros(V.shape[0])
-        elif not symmetric:
-            u_full = V @ u_red
+        The element matrices and forces of the sampled elements are written
+        into stacks which are reduced with one einsum for K and f, so the cost
+        per call does not depend on the size of the mesh.
 
-        if u_red is None and symmetric:
-            u_red = np.zeros(V.shape[1])
+        Parameters
+        ----------
+        E_tilde : ndarray, shape (no_of_active_elements, )
+            Indices of the sampled elements.
+        proj_stack : ndarray, shape (no_of_active_elements, n_red, ele_dofs)
+            Oblique projectors of the sampled elements.
+        X_stack : ndarray, shape (no_of_active_elements, ele_dofs)
+            Nodal coordinates of the sampled elements in voigt notation.
+        V_stack : ndarray, shape (no_of_active_elements, ele_dofs, n_red)
+            Rows of the unconstrained basis V belonging to the element dofs.
+            Not needed for the symmetric variant.
+        u_red : ndarray, optional
+            Reduced displacement. Default is `None`, i.e. zero displacement.
+        t : float, optional
+            Time. Default value 0.
+        symmetric : bool, optional
+            Flag for the symmetric DEIM variant, where the element
+            displacements are given by proj.T @ u_red. Default False.
 
-#        if u_red is None:
-#            u_full = np.zeros(V.shape[0])
-#        elif symmetric:
-#            u_unass = P @ oblique_proj.T @ u_red
-#        else:
-#            u_full = V @ u_red
+        Returns
+        -------
+        K : ndarray, shape (n_red, n_red)
+            Reduced DEIM stiffness matrix.
+        f : ndarray, shape (n_red, )
+            Reduced DEIM force vector.
 
-        for i, ele in enumerate(E_tilde):
-            indices = self.element_indices[ele]
-            X_local = self.nodes_voigt[indices]
-            proj = proj_list[i]
-            if symmetric:
-                u_local = proj.T @ u_red
-                K_ele, f_ele = self.mesh.ele_obj[i].k_and_f_int(X_local,
-                                                                u_local, t)
-                f += proj @ f_ele
-                K += proj @ K_ele @ proj.T
-            else:
-                u_local = u_full[indices]
-                K_ele, f_ele = self.mesh.ele_obj[i].k_and_f_int(X_local,
-                                                                u_local, t)
-                f += proj @ f_ele
-                K += proj @ K_ele @ V[indices, :]
-        return K, f
+        '''
+        ele_obj = [self.mesh.ele_obj[ele] for ele in E_tilde]
+        return k_and_f_deim_stacked(ele_obj, proj_stack, X_stack, V_stack,
+                                    u_red, t, symmetric)
 
 
     def compute_c_deim(self):
@@ -152,6 +152,63 @@ if use_fortran:
     scatter_matrix = amfe.f90_element.scatter_matrix
 
 
+def _dk_dv_gauss_point(B0_tilde, u_mat, v_mat, material):
+    '''
+    Compute the directional derivative of the tangential stiffness matrix at
+    a Gauss point (without integration weight).
+
+    The tangential stiffness matrix is K = scatter(B0_tilde S B0_tilde^T)
+    + B0^T C_SE B0; its derivative in the direction v is
+
+    dK = scatter(B0_tilde dS B0_tilde^T) + dB0^T C_SE B0 + B0^T C_SE dB0
+    + B0^T dC_SE B0
+
+    with dS = C_SE dE, dB0 = B(dH) and dE = sym(F^T dH).
+
+    Parameters
+    ----------
+    B0_tilde : ndarray
+        Matrix of the spatial derivative of the shape functions: dN_dX
+    u_mat : ndarray
+        nodal displacements, shape (no_of_nodes, ndim)
+    v_mat : ndarray
+        nodal direction of the derivative, shape (no_of_nodes, ndim)
+    material : instance of amfe.HyperelasticMaterial
+        material of the element
+
+    Returns
+    -------
+    dK : ndarray
+        directional derivative of the tangential stiffness matrix
+    '''
+    ndim = B0_tilde.shape[1]
+    H = u_mat.T @ B0_tilde
+    dH = v_mat.T @ B0_tilde
+    F = H + np.eye(ndim)
+    E = 1/2*(H + H.T + H.T @ H)
+    dE = 1/2*(F.T @ dH + dH.T @ F)
+    if ndim == 2:
+        S, S_v, C_SE = material.S_Sv_and_C_2d(E)
+        dC_SE = material.dC_SE_2d(E, dE)
+        dS_v = C_SE @ np.array([dE[0,0], dE[1,1], 2*dE[0,1]])
+        dS = np.array([[dS_v[0], dS_v[2]], [dS_v[2], dS_v[1]]])
+    else:
+        S, S_v, C_SE = material.S_Sv_and_C(E)
+        dC_SE = material.dC_SE(E, dE)
+        dS_v = C_SE @ np.array([  dE[0,0],   dE[1,1],   dE[2,2],
+                                2*dE[1,2], 2*dE[0,2], 2*dE[0,1]])
+        dS = np.array([[dS_v[0], dS_v[5], dS_v[4]],
+                       [dS_v[5], dS_v[1], dS_v[3]],
+                       [dS_v[4], dS_v[3], dS_v[2]]])
+    B0 = compute_B_matrix(B0_tilde, F)
+    # B is linear in F, hence its derivative is B evaluated with dH
+    dB0 = compute_B_matrix(B0_tilde, dH)
+    dK_geo = scatter_matrix(B0_tilde @ dS @ B0_tilde.T, ndim)
+    dB0_C_B0 = dB0.T @ C_SE @ B0
+    dK_mat = dB0_C_B0 + dB0_C_B0.T + B0.T @ dC_SE @ B0
+    return dK_geo + dK_mat
+
+
 class Element():
     '''
     Anonymous baseclass for all elements. It contains the methods needed
@@ -197,6 +254,15 @@ class Element():
         '''
         pass
 
+    def _gauss_point_data(self, X):
+        '''
+        Virtual function returning a list of tuples (B0_tilde, det_w) with the
+        derivatives of the shape functions with respect to the undeformed
+        coordinates and the integration weight for every Gauss point.
+        '''
+        raise NotImplementedError('The element ' + str(self.name) + ' provides '
+                                  + 'no Gauss point data.')
+
     def k_and_f_int(self, X, u, t=0):
         '''
         Returns the tangential stiffness matrix and the internal nodal force
@@ -322,6 +388,61 @@ class Element():
         '''
         return self._m_int(X, u, t)
 
+    def dk_dv_int(self, X, u, v, t=0):
+        '''
+        Returns the directional derivative of the tangential stiffness matrix
+        dK/du @ v of the Element in the direction v.
+
+        The derivative is exact, i.e. no finite difference step is involved,
+        if the element provides its Gauss point data. Otherwise it falls back
+        to a central finite difference of the tangential stiffness matrix.
+
+        Parameters
+        ----------
+        X : ndarray
+            nodal coordinates given in Voigt notation (i.e. a 1-D-Array
+            of type [x_1, y_1, z_1, x_2, y_2, z_2 etc.])
+        u : ndarray
+            nodal displacements given in Voigt notation
+        v : ndarray
+            direction of the derivative given in Voigt notation
+        t : float
+            time
+
+        Returns
+        -------
+        dK : ndarray
+            The directional derivative of the tangential stiffness matrix
+            (ndarray of dimension (ndim, ndim))
+
+        '''
+        try:
+            gauss_point_data = self._gauss_point_data(X)
+        except NotImplementedError:
+            return self._dk_dv_finite_difference(X, u, v, t)
+        dK = 0
+        for B0_tilde, det_w in gauss_point_data:
+            ndim = B0_tilde.shape[1]
+            dK += _dk_dv_gauss_point(B0_tilde, u.reshape(-1, ndim),
+                                     v.reshape(-1, ndim), self.material)*det_w
+        return dK
+
+    def _dk_dv_finite_difference(self, X, u, v, t=0, h=1E-6):
+        '''
+        Central finite difference approximation of the directional derivative
+        of the tangential stiffness matrix for elements without Gauss point
+        data.
+        '''
+        # the step is scaled to the size of the element and the direction
+        v_norm = np.linalg.norm(v)
+        if v_norm == 0:
+            return np.zeros((len(X), len(X)))
+        h_v = h*max(np.max(abs(X)), 1.)/v_norm
+        # copies needed as the element stores K in place
+        K_plus = self.k_int(X, u + h_v*v, t).copy()
+        K_minus = self.k_int(X, u - h_v*v, t).copy()
+        return (K_plus - K_minus)/(2*h_v)
+
     def k_f_S_E_int(self, X, u, t=0):
         '''
         Returns the tangential stiffness matrix, the internal nodal force,
@@ -412,26 +533,33 @@ class Tri3(Element):
                 2. Piola-Kirchhoff stress tensor, using Kirchhoff material
                 (2x2-Matrix)
         '''
-        d = self.material.thickness
-        X1, Y1, X2, Y2, X3, Y3 = X
         u_mat = u.reshape((-1,2))
-        det = (X3-X2)*(Y1-Y2) - (X1-X2)*(Y3-Y2)
-        A0       = 0.5*det
-        dN_dX = 1/det*np.array([[Y2-Y3, X3-X2], [Y3-Y1, X1-X3], [Y1-Y2, X2-X1]])
+        (dN_dX, det_w), = self._gauss_point_data(X)
         H = u_mat.T @ dN_dX
         F = H + np.eye(2)
         E = 1/2*(H + H.T + H.T @ H)
         S, S_v, C_SE = self.material.S_Sv_and_C_2d(E)
         B0 = compute_B_matrix(dN_dX, F)
-        K_geo_small = dN_dX @ S @ dN_dX.T * det/2 * d
+        K_geo_small = dN_dX @ S @ dN_dX.T * det_w
         K_geo = scatter_matrix(K_geo_small, 2)
-        K_mat = B0.T @ C_SE @ B0 * det/2 * d
+        K_mat = B0.T @ C_SE @ B0 * det_w
         self.K = (K_geo + K_mat)
-        self.f = B0.T @ S_v * det/2 * d
+        self.f = B0.T @ S_v * det_w
         self.E = np.ones((3,1)) @ np.array([[E[0,0], E[0,1], 0, E[1,1], 0, 0]])
         self.S = np.ones((3,1)) @ np.array([[S[0,0], S[0,1], 0, S[1,1], 0, 0]])
         return
 
+    def _gauss_point_data(self, X):
+        '''
+        Return the derivatives of the shape functions with respect to X and
+        the integration weight (area times thickness) of the single Gauss
+        point.
+        '''
+        X1, Y1, X2, Y2, X3, Y3 = X
+        det = (X3-X2)*(Y1-Y2) - (X1-X2)*(Y3-Y2)
+        dN_dX = 1/det*np.array([[Y2-Y3, X3-X2], [Y3-Y1, X1-X3], [Y1-Y2, X2-X1]])
+        return [(dN_dX, det/2 * self.material.thickness)]
+
     def _m_int(self, X, u, t=0):
         '''
         Compute the mass matrix.
@@ -521,16 +649,38 @@ class Tri6(Element):
         '''
         Tensor computation the same way as in the Tri3 element
         '''
-        X1, Y1, X2, Y2, X3, Y3, X4, Y4, X5, Y5, X6, Y6 = X
         u_mat = u.reshape((-1,2))
-        # X_mat = X.reshape((-1,2))
-        d = self.material.thickness
 
         self.K *= 0
         self.f *= 0
         self.E *= 0
         self.S *= 0
-        for n_gauss, (L1, L2, L3, w) in enumerate(self.gauss_points):
+        for n_gauss, (B0_tilde, det_w) in enumerate(self._gauss_point_data(X)):
+            H = u_mat.T @ B0_tilde
+            F = H + np.eye(2)
+            E = 1/2*(H + H.T + H.T @ H)
+            S, S_v, C_SE = self.material.S_Sv_and_C_2d(E)
+            B0 = compute_B_matrix(B0_tilde, F)
+            K_geo_small = B0_tilde @ S @ B0_tilde.T * det_w
+            K_geo = scatter_matrix(K_geo_small, 2)
+            K_mat = B0.T @ C_SE @ B0 * det_w
+            self.K += (K_geo + K_mat)
+            self.f += B0.T @ S_v * det_w
+            # extrapolation of gauss element
+            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
+            self.S += extrapol @ np.array([[S[0,0], S[0,1], 0, S[1,1], 0, 0]])
+            self.E += extrapol @ np.array([[E[0,0], E[0,1], 0, E[1,1], 0, 0]])
+        return
+
+    def _gauss_point_data(self, X):
+        '''
+        Return the derivatives of the shape functions with respect to X and
+        the integration weights of all Gauss points.
+        '''
+        X1, Y1, X2, Y2, X3, Y3, X4, Y4, X5, Y5, X6, Y6 = X
+        d = self.material.thickness
+        gauss_point_data = []
+        for L1, L2, L3, w in self.gauss_points:
 
             dN_dL = np.array([  [4*L1 - 1,        0,        0],
                                 [       0, 4*L2 - 1,        0],
@@ -555,22 +705,8 @@ class Tri6(Element):
                                     [ Jy1 - Jy2, -Jx1 + Jx2]])
 
             B0_tilde = dN_dL @ dL_dX
-
-            H = u_mat.T @ B0_tilde
-            F = H + np.eye(2)
-            E = 1/2*(H + H.T + H.T @ H)
-            S, S_v, C_SE = self.material.S_Sv_and_C_2d(E)
-            B0 = compute_B_matrix(B0_tilde, F)
-            K_geo_small = B0_tilde @ S @ B0_tilde.T * det / 2 * d
-            K_geo = scatter_matrix(K_geo_small, 2)
-            K_mat = B0.T @ C_SE @ B0 * det / 2 * d
-            self.K += (K_geo + K_mat) * w
-            self.f += B0.T @ S_v * det / 2*d*w
-            # extrapolation of gauss element
-            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
-            self.S += extrapol @ np.array([[S[0,0], S[0,1], 0, S[1,1], 0, 0]])
-            self.E += extrapol @ np.array([[E[0,0], E[0,1], 0, E[1,1], 0, 0]])
-        return
+            gauss_point_data.append((B0_tilde, det / 2 * d * w))
+        return gauss_point_data
 
     def _m_int(self, X, u, t=0):
         X1, Y1, X2, Y2, X3, Y3, X4, Y4, X5, Y5, X6, Y6 = X
@@ -654,9 +790,7 @@ class Quad4(Element):
         '''
         Compute the tensors.
         '''
-        X_mat = X.reshape(-1, 2)
         u_e = u.reshape(-1, 2)
-        t = self.material.thickness
 
         # Empty former values because they are properties and a new calculation
         # for another element or displacement than before is called
@@ -665,7 +799,32 @@ class Quad4(Element):
         self.S *= 0
         self.E *= 0
 
-        for n_gauss, (xi, eta, w) in enumerate(self.gauss_points):
+        for n_gauss, (B0_tilde, det_w) in enumerate(self._gauss_point_data(X)):
+            H = u_e.T @ B0_tilde
+            F = H + np.eye(2)
+            E = 1/2*(H + H.T + H.T @ H)
+            S, S_v, C_SE = self.material.S_Sv_and_C_2d(E)
+            B0 = compute_B_matrix(B0_tilde, F)
+            K_geo_small = B0_tilde @ S @ B0_tilde.T * det_w
+            K_geo = scatter_matrix(K_geo_small, 2)
+            K_mat = B0.T @ C_SE @ B0 * det_w
+            self.K += (K_geo + K_mat)
+            self.f += B0.T @ S_v * det_w
+            # extrapolation of gauss element
+            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
+            self.S += extrapol @ np.array([[S[0,0], S[0,1], 0, S[1,1], 0, 0]])
+            self.E += extrapol @ np.array([[E[0,0], E[0,1], 0, E[1,1], 0, 0]])
+        return
+
+    def _gauss_point_data(self, X):
+        '''
+        Return the derivatives of the shape functions with respect to X and
+        the integration weights of all Gauss points.
+        '''
+        X_mat = X.reshape(-1, 2)
+        t = self.material.thickness
+        gauss_point_data = []
+        for xi, eta, w in self.gauss_points:
 
             dN_dxi = np.array([ [ eta/4 - 1/4,  xi/4 - 1/4],
                                 [-eta/4 + 1/4, -xi/4 - 1/4],
@@ -678,21 +837,8 @@ class Quad4(Element):
                                        [-dX_dxi[1,0],  dX_dxi[0,0]]])
 
             B0_tilde = dN_dxi @ dxi_dX
-            H = u_e.T @ B0_tilde
-            F = H + np.eye(2)
-            E = 1/2*(H + H.T + H.T @ H)
-            S, S_v, C_SE = self.material.S_Sv_and_C_2d(E)
-            B0 = compute_B_matrix(B0_tilde, F)
-            K_geo_small = B0_tilde @ S @ B0_tilde.T * det*t
-            K_geo = scatter_matrix(K_geo_small, 2)
-            K_mat = B0.T @ C_SE @ B0 *det*t
-            self.K += (K_geo + K_mat)*w
-            self.f += B0.T @ S_v*det*t*w
-            # extrapolation of gauss element
-            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
-            self.S += extrapol @ np.array([[S[0,0], S[0,1], 0, S[1,1], 0, 0]])
-            self.E += extrapol @ np.array([[E[0,0], E[0,1], 0, E[1,1], 0, 0]])
-        return
+            gauss_point_data.append((B0_tilde, det*t*w))
+        return gauss_point_data
 
     def _m_int(self, X, u, t=0):
         X1, Y1, X2, Y2, X3, Y3, X4, Y4 = X
@@ -763,18 +909,39 @@ class Quad8(Element):
          [ 0, 0, 0, 0, 0, -sqrt(15)/6 + 5/6, 0, sqrt(15)/6 + 5/6, -2/3]])
 
     def _compute_tensors(self, X, u, t):
-#        X1, Y1, X2, Y2, X3, Y3, X4, Y4, X5, Y5, X6, Y6, X7, Y7, X8, Y8 = X
-        X_mat = X.reshape(-1, 2)
         u_e = u.reshape(-1, 2)
-        t = self.material.thickness
-
 
         self.K *= 0
         self.f *= 0
         self.S *= 0
         self.E *= 0
 
-        for n_gauss, (xi, eta, w) in enumerate(self.gauss_points):
+        for n_gauss, (B0_tilde, det_w) in enumerate(self._gauss_point_data(X)):
+            H = u_e.T @ B0_tilde
+            F = H + np.eye(2)
+            E = 1/2*(H + H.T + H.T @ H)
+            S, S_v, C_SE = self.material.S_Sv_and_C_2d(E)
+            B0 = compute_B_matrix(B0_tilde, F)
+            K_geo_small = B0_tilde @ S @ B0_tilde.T * det_w
+            K_geo = scatter_matrix(K_geo_small, 2)
+            K_mat = B0.T @ C_SE @ B0 * det_w
+            self.K += (K_geo + K_mat)
+            self.f += B0.T @ S_v * det_w
+            # extrapolation of gauss element
+            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
+            self.S += extrapol @ np.array([[S[0,0], S[0,1], 0, S[1,1], 0, 0]])
+            self.E += extrapol @ np.array([[E[0,0], E[0,1], 0, E[1,1], 0, 0]])
+        return
+
+    def _gauss_point_data(self, X):
+        '''
+        Return the derivatives of the shape functions with respect to X and
+        the integration weights of all Gauss points.
+        '''
+        X_mat = X.reshape(-1, 2)
+        t = self.material.thickness
+        gauss_point_data = []
+        for xi, eta, w in self.gauss_points:
             # this is now the standard procedure for Total Lagrangian behavior
             dN_dxi = np.array([
                 [-(eta - 1)*(eta + 2*xi)/4, -(2*eta + xi)*(xi - 1)/4],
@@ -791,21 +958,8 @@ class Quad8(Element):
                                      [-dX_dxi[1,0],  dX_dxi[0,0]]])
 
             B0_tilde = dN_dxi @ dxi_dX
-            H = u_e.T @ B0_tilde
-            F = H + np.eye(2)
-            E = 1/2*(H + H.T + H.T @ H)
-            S, S_v, C_SE = self.material.S_Sv_and_C_2d(E)
-            B0 = compute_B_matrix(B0_tilde, F)
-            K_geo_small = B0_tilde @ S @ B0_tilde.T * det*t
-            K_geo = scatter_matrix(K_geo_small, 2)
-            K_mat = B0.T @ C_SE @ B0 * det * t
-            self.K += w*(K_geo + K_mat)
-            self.f += B0.T @ S_v*det*t*w
-            # extrapolation of gauss element
-            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
-            self.S += extrapol @ np.array([[S[0,0], S[0,1], 0, S[1,1], 0, 0]])
-            self.E += extrapol @ np.array([[E[0,0], E[0,1], 0, E[1,1], 0, 0]])
-        return
+            gauss_point_data.append((B0_tilde, det*t*w))
+        return gauss_point_data
 
     def _m_int(self, X, u, t=0):
         '''
@@ -860,9 +1014,29 @@ class Tet4(Element):
 
 
     def _compute_tensors(self, X, u, t):
-        X1, Y1, Z1, X2, Y2, Z2, X3, Y3, Z3, X4, Y4, Z4 = X
         u_mat = u.reshape(-1, 3)
-        X_mat = X.reshape(-1, 3)
+        (B0_tilde, det_w), = self._gauss_point_data(X)
+        H = u_mat.T @ B0_tilde
+        F = H + np.eye(3)
+        E = 1/2*(H + H.T + H.T @ H)
+        S, S_v, C_SE = self.material.S_Sv_and_C(E)
+        B0 = compute_B_matrix(B0_tilde, F)
+        K_geo_small = B0_tilde @ S @ B0_tilde.T * det_w
+        K_geo = scatter_matrix(K_geo_small, 3)
+        K_mat = B0.T @ C_SE @ B0 * det_w
+        self.K = K_geo + K_mat
+        self.f = B0.T @ S_v * det_w
+        self.E = np.ones((4,1)) @ np.array([[E[0,0], E[0,1], E[0,2],
+                                             E[1,1], E[1,2], E[2,2]]])
+        self.S = np.ones((4,1)) @ np.array([[S[0,0], S[0,1], S[0,2],
+                                             S[1,1], S[1,2], S[2,2]]])
+
+    def _gauss_point_data(self, X):
+        '''
+        Return the derivatives of the shape functions with respect to X and
+        the integration weight (volume) of the single Gauss point.
+        '''
+        X1, Y1, Z1, X2, Y2, Z2, X3, Y3, Z3, X4, Y4, Z4 = X
 
         det = -X1*Y2*Z3 + X1*Y2*Z4 + X1*Y3*Z2 - X1*Y3*Z4 - X1*Y4*Z2 + X1*Y4*Z3 \
              + X2*Y1*Z3 - X2*Y1*Z4 - X2*Y3*Z1 + X2*Y3*Z4 + X2*Y4*Z1 - X2*Y4*Z3 \
@@ -882,21 +1056,7 @@ class Tet4(Element):
             [ Y1*Z2 - Y1*Z3 - Y2*Z1 + Y2*Z3 + Y3*Z1 - Y3*Z2,
              -X1*Z2 + X1*Z3 + X2*Z1 - X2*Z3 - X3*Z1 + X3*Z2,
               X1*Y2 - X1*Y3 - X2*Y1 + X2*Y3 + X3*Y1 - X3*Y2]])
-
-        H = u_mat.T @ B0_tilde
-        F = H + np.eye(3)
-        E = 1/2*(H + H.T + H.T @ H)
-        S, S_v, C_SE = self.material.S_Sv_and_C(E)
-        B0 = compute_B_matrix(B0_tilde, F)
-        K_geo_small = B0_tilde @ S @ B0_tilde.T * det/6
-        K_geo = scatter_matrix(K_geo_small, 3)
-        K_mat = B0.T @ C_SE @ B0 * det/6
-        self.K = K_geo + K_mat
-        self.f = B0.T @ S_v*det/6
-        self.E = np.ones((4,1)) @ np.array([[E[0,0], E[0,1], E[0,2],
-                                             E[1,1], E[1,2], E[2,2]]])
-        self.S = np.ones((4,1)) @ np.array([[S[0,0], S[0,1], S[0,2],
-                                             S[1,1], S[1,2], S[2,2]]])
+        return [(B0_tilde, det/6)]
 
 
 
@@ -997,7 +1157,38 @@ class Tet10(Element):
 
 
     def _compute_tensors(self, X, u, t):
+        u_mat = u.reshape((10,3))
+        self.K *= 0
+        self.f *= 0
+        self.S *= 0
+        self.E *= 0
+
+        for n_gauss, (B0_tilde, det_w) in enumerate(self._gauss_point_data(X)):
+            H = u_mat.T @ B0_tilde
+            F = H + np.eye(3)
+            E = 1/2*(H + H.T + H.T @ H)
+            S, S_v, C_SE = self.material.S_Sv_and_C(E)
+            B0 = compute_B_matrix(B0_tilde, F)
+            K_geo_small = B0_tilde @ S @ B0_tilde.T * det_w
+            K_geo = scatter_matrix(K_geo_small, 3)
+            K_mat = B0.T @ C_SE @ B0 * det_w
 
+            self.K += K_geo + K_mat
+            self.f += B0.T @ S_v * det_w
+
+            # extrapolation of gauss element
+            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
+            self.S += extrapol @ np.array([[S[0,0], S[0,1], S[0,2],
+                                            S[1,1], S[1,2], S[2,2]]])
+            self.E += extrapol @ np.array([[E[0,0], E[0,1], E[0,2],
+                                            E[1,1], E[1,2], E[2,2]]])
+        return
+
+    def _gauss_point_data(self, X):
+        '''
+        Return the derivatives of the shape functions with respect to X and
+        the integration weights of all Gauss points.
+        '''
         X1, Y1, Z1, \
         X2, Y2, Z2, \
         X3, Y3, Z3, \
@@ -1009,13 +1200,8 @@ class Tet10(Element):
         X9, Y9, Z9, \
         X10, Y10, Z10 = X
 
-        u_mat = u.reshape((10,3))
-        self.K *= 0
-        self.f *= 0
-        self.S *= 0
-        self.E *= 0
-
-        for n_gauss, (L1, L2, L3, L4, w) in enumerate(self.gauss_points):
+        gauss_point_data = []
+        for L1, L2, L3, L4, w in self.gauss_points:
 
             Jx1 = 4*L2*X5 + 4*L3*X7 + 4*L4*X8  + X1*(4*L1 - 1)
             Jx2 = 4*L1*X5 + 4*L3*X6 + 4*L4*X9  + X2*(4*L2 - 1)
@@ -1061,26 +1247,8 @@ class Tet10(Element):
                 [4*L1*a4 + 4*L4*a1, 4*L1*b4 + 4*L4*b1, 4*L1*c4 + 4*L4*c1],
                 [4*L2*a4 + 4*L4*a2, 4*L2*b4 + 4*L4*b2, 4*L2*c4 + 4*L4*c2],
                 [4*L3*a4 + 4*L4*a3, 4*L3*b4 + 4*L4*b3, 4*L3*c4 + 4*L4*c3]])
-
-            H = u_mat.T @ B0_tilde
-            F = H + np.eye(3)
-            E = 1/2*(H + H.T + H.T @ H)
-            S, S_v, C_SE = self.material.S_Sv_and_C(E)
-            B0 = compute_B_matrix(B0_tilde, F)
-            K_geo_small = B0_tilde @ S @ B0_tilde.T * det/6
-            K_geo = scatter_matrix(K_geo_small, 3)
-            K_mat = B0.T @ C_SE @ B0 * det/6
-
-            self.K += (K_geo + K_mat) * w
-            self.f += B0.T @ S_v * det/6 * w
-
-            # extrapolation of gauss element
-            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
-            self.S += extrapol @ np.array([[S[0,0], S[0,1], S[0,2],
-                                            S[1,1], S[1,2], S[2,2]]])
-            self.E += extrapol @ np.array([[E[0,0], E[0,1], E[0,2],
-                                            E[1,1], E[1,2], E[2,2]]])
-        return
+            gauss_point_data.append((B0_tilde, det/6 * w))
+        return gauss_point_data
 
     def _m_int(self, X, u, t=0):
         '''
@@ -1198,7 +1366,6 @@ class Hexa8(Element):
 
 
     def _compute_tensors(self, X, u, t):
-        X_mat = X.reshape(8, 3)
         u_mat = u.reshape(8, 3)
 
         self.K *= 0
@@ -1206,32 +1373,18 @@ class Hexa8(Element):
         self.S *= 0
         self.E *= 0
 
-        for n_gauss, (xi, eta, zeta, w) in enumerate(self.gauss_points):
-
-            dN_dxi = 1/8*np.array([
-                [-(-eta+1)*(-zeta+1), -(-xi+1)*(-zeta+1), -(-eta+1)*(-xi+1)],
-                [ (-eta+1)*(-zeta+1),  -(xi+1)*(-zeta+1),  -(-eta+1)*(xi+1)],
-                [  (eta+1)*(-zeta+1),   (xi+1)*(-zeta+1),   -(eta+1)*(xi+1)],
-                [ -(eta+1)*(-zeta+1),  (-xi+1)*(-zeta+1),  -(eta+1)*(-xi+1)],
-                [ -(-eta+1)*(zeta+1),  -(-xi+1)*(zeta+1),  (-eta+1)*(-xi+1)],
-                [  (-eta+1)*(zeta+1),   -(xi+1)*(zeta+1),   (-eta+1)*(xi+1)],
-                [   (eta+1)*(zeta+1),    (xi+1)*(zeta+1),    (eta+1)*(xi+1)],
-                [  -(eta+1)*(zeta+1),   (-xi+1)*(zeta+1),   (eta+1)*(-xi+1)]])
-            dX_dxi = X_mat.T @ dN_dxi
-            dxi_dX = np.linalg.inv(dX_dxi)
-            det = np.linalg.det(dX_dxi)
-            B0_tilde = dN_dxi @ dxi_dX
+        for n_gauss, (B0_tilde, det_w) in enumerate(self._gauss_point_data(X)):
             H = u_mat.T @ B0_tilde
             F = H + np.eye(3)
             E = 1/2*(H + H.T + H.T @ H)
             S, S_v, C_SE = self.material.S_Sv_and_C(E)
             B0 = compute_B_matrix(B0_tilde, F)
-            K_geo_small = B0_tilde @ S @ B0_tilde.T * det
+            K_geo_small = B0_tilde @ S @ B0_tilde.T * det_w
             K_geo = scatter_matrix(K_geo_small, 3)
-            K_mat = B0.T @ C_SE @ B0 * det
+            K_mat = B0.T @ C_SE @ B0 * det_w
 
-            self.K += (K_geo + K_mat) * w
-            self.f += B0.T @ S_v * det * w
+            self.K += K_geo + K_mat
+            self.f += B0.T @ S_v * det_w
 
             # extrapolation of gauss element
             extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
@@ -1241,6 +1394,31 @@ class Hexa8(Element):
                                             E[1,1], E[1,2], E[2,2]]])
         return
 
+    def _gauss_point_data(self, X):
+        '''
+        Return the derivatives of the shape functions with respect to X and
+        the integration weights of all Gauss points.
+        '''
+        X_mat = X.reshape(8, 3)
+        gauss_point_data = []
+        for xi, eta, zeta, w in self.gauss_points:
+
+            dN_dxi = 1/8*np.array([
+                [-(-eta+1)*(-zeta+1), -(-xi+1)*(-zeta+1), -(-eta+1)*(-xi+1)],
+                [ (-eta+1)*(-zeta+1),  -(xi+1)*(-zeta+1),  -(-eta+1)*(xi+1)],
+                [  (eta+1)*(-zeta+1),   (xi+1)*(-zeta+1),   -(eta+1)*(xi+1)],
+                [ -(eta+1)*(-zeta+1),  (-xi+1)*(-zeta+1),  -(eta+1)*(-xi+1)],
+                [ -(-eta+1)*(zeta+1),  -(-xi+1)*(zeta+1),  (-eta+1)*(-xi+1)],
+                [  (-eta+1)*(zeta+1),   -(xi+1)*(zeta+1),   (-eta+1)*(xi+1)],
+                [   (eta+1)*(zeta+1),    (xi+1)*(zeta+1),    (eta+1)*(xi+1)],
+                [  -(eta+1)*(zeta+1),   (-xi+1)*(zeta+1),   (eta+1)*(-xi+1)]])
+            dX_dxi = X_mat.T @ dN_dxi
+            dxi_dX = np.linalg.inv(dX_dxi)
+            det = np.linalg.det(dX_dxi)
+            B0_tilde = dN_dxi @ dxi_dX
+            gauss_point_data.append((B0_tilde, det * w))
+        return gauss_point_data
+
     def _m_int(self, X, u, t=0):
         X_mat = X.reshape(8, 3)
 
@@ -1382,7 +1560,6 @@ class Hexa20(Element):
 
 
     def _compute_tensors(self, X, u, t):
-        X_mat = X.reshape(20, 3)
         u_mat = u.reshape(20, 3)
 
         self.K *= 0
@@ -1390,7 +1567,35 @@ class Hexa20(Element):
         self.S *= 0
         self.E *= 0
 
-        for n_gauss, (xi, eta, zeta, w) in enumerate(self.gauss_points):
+        for n_gauss, (B0_tilde, det_w) in enumerate(self._gauss_point_data(X)):
+            H = u_mat.T @ B0_tilde
+            F = H + np.eye(3)
+            E = 1/2*(H + H.T + H.T @ H)
+            S, S_v, C_SE = self.material.S_Sv_and_C(E)
+            B0 = compute_B_matrix(B0_tilde, F)
+            K_geo_small = B0_tilde @ S @ B0_tilde.T * det_w
+            K_geo = scatter_matrix(K_geo_small, 3)
+            K_mat = B0.T @ C_SE @ B0 * det_w
+
+            self.K += K_geo + K_mat
+            self.f += B0.T @ S_v * det_w
+
+            # extrapolation of gauss element
+            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
+            self.S += extrapol @ np.array([[S[0,0], S[0,1], S[0,2],
+                                            S[1,1], S[1,2], S[2,2]]])
+            self.E += extrapol @ np.array([[E[0,0], E[0,1], E[0,2],
+                                            E[1,1], E[1,2], E[2,2]]])
+        return
+
+    def _gauss_point_data(self, X):
+        '''
+        Return the derivatives of the shape functions with respect to X and
+        the integration weights of all Gauss points.
+        '''
+        X_mat = X.reshape(20, 3)
+        gauss_point_data = []
+        for xi, eta, zeta, w in self.gauss_points:
 
             dN_dxi = 1/8*np.array([
                                 [ (eta-1)*(zeta-1)*(eta+2*xi+zeta+1),
@@ -1446,25 +1651,8 @@ class Hexa20(Element):
             dxi_dX = np.linalg.inv(dX_dxi)
             det = np.linalg.det(dX_dxi)
             B0_tilde = dN_dxi @ dxi_dX
-            H = u_mat.T @ B0_tilde
-            F = H + np.eye(3)
-            E = 1/2*(H + H.T + H.T @ H)
-            S, S_v, C_SE = self.material.S_Sv_and_C(E)
-            B0 = compute_B_matrix(B0_tilde, F)
-            K_geo_small = B0_tilde @ S @ B0_tilde.T * det
-            K_geo = scatter_matrix(K_geo_small, 3)
-            K_mat = B0.T @ C_SE @ B0 * det
-
-            self.K += (K_geo + K_mat) * w
-            self.f += B0.T @ S_v * det * w
-
-            # extrapolation of gauss element
-            extrapol = self.extrapolation_points[:,n_gauss:n_gauss+1]
-            self.S += extrapol @ np.array([[S[0,0], S[0,1], S[0,2],
-                                            S[1,1], S[1,2], S[2,2]]])
-            self.E += extrapol @ np.array([[E[0,0], E[0,1], E[0,2],
-                                            E[1,1], E[1,2], E[2,2]]])
-        return
+            gauss_point_data.append((B0_tilde, det * w))
+        return gauss_point_data
 
     def _m_int(self, X, u, t=0):
         X_mat = X.reshape(20, 3)
@@ -1576,6 +1764,10 @@ class Prism6(Element):
         print('Warning! the Prism6 element has no mass!')
         return self.M
 
+    def dk_dv_int(self, X, u, v, t=0):
+        # the element has no stiffness, hence no derivative either
+        return np.zeros((18,18))
+
 class Bar2Dlumped(Element):
     '''
     Bar-Element with 2 nodes and lumped stiffness matrix
@@ -1628,6 +1820,10 @@ class Bar2Dlumped(Element):
         k_el, m_el = self._k_and_m_int(X, u, t)
         return m_el
 
+    def dk_dv_int(self, X, u, v, t=0):
+        # linear element: the stiffness matrix does not depend on u
+        return np.zeros((4,4))
+
 #%%
 def f_proj_a(f_mat, direction):
     '''
@@ -1713,6 +1909,10 @@ class BoundaryElement(Element):
         'normal' means that force acts normal to the current surface
         numpy.array is a vector in which the force should act (with global coordinate system as reference)
     
+    shadow_area : bool
+        flag, if the force is proportional to the shadow area of the surface
+        with respect to direct.
+    
     f : numpy.array
         local external force vector of the element
     
@@ -1758,6 +1958,7 @@ class BoundaryElement(Element):
         self.K = np.zeros((ndof, ndof))
         self.M = np.zeros((ndof, ndof))
         self.direct = direct
+        self.shadow_area = shadow_area
 
         # select the correct f_proj function in order to fulfill the direct
         # and shadow area specification
@@ -3,7 +3,9 @@ Hyper reduction module
 '''
 
 # from .poly_reduction import *
-# from .poly_system import *
+from .sampled_mesh import *
 from .ecsw import *
 from .deim import *
+from .poly_system import *
 from .training_set_generation import *
+from .rom_artifact import *
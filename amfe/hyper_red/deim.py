@@ -5,12 +5,16 @@ Discrete Empirical Interpolation Method (DEIM) hyper-reduction
 
 import time
 import copy
+import multiprocessing as mp
 import numpy as np
 import scipy as sp
 
 from ..mechanical_system import ReducedSystem
+from .sampled_mesh import SampledMesh
+from ..reduced_basis import pod
 
 __all__ = ['DEIMSystem',
+           'deim_selection',
            'reduce_mechanical_system_deim',
           ]
 
@@ -41,6 +45,111 @@ def force_surrogate(F_u, no_of_elements):
     return F_s
 
 
+def deim_selection(U_f, group=None, method='greedy'):
+    '''
+    Select the interpolation indices for the force basis U_f.
+
+    The greedy DEIM selection keeps the selected rows as an index array and
+    updates the triangular factor of the QR decomposition of U_f[p, :] with
+    every new collocation group instead of solving the normal equations from
+    scratch. Q-DEIM takes the indices from a column-pivoted QR decomposition
+    of U_f.T.
+
+    Parameters
+    ----------
+    U_f : ndarray, shape (ndim, no_of_force_modes)
+        Force basis.
+    group : callable, optional
+        Function mapping a selected index p to the array of indices which are
+        collocated together with p, e.g. all dofs of a node. Default is `None`,
+        i.e. only p is selected.
+    method : {'greedy', 'qdeim'}, optional
+        Selection method. Default 'greedy'.
+
+    Returns
+    -------
+    colloc_dofs : ndarray
+        Sorted array of the selected indices.
+
+    References
+    ----------
+    Drmac, Z. and Gugercin, S., 2016. A new selection operator for the
+    discrete empirical interpolation method---improved a priori error bound
+    and extensions. SIAM Journal on Scientific Computing, 38(2),
+    pp.A631-A648.
+
+    '''
+    if group is None:
+        group = lambda p: np.array([p])
+    ndim, no_of_force_modes = U_f.shape
+
+    if method == 'qdeim':
+        __, piv = sp.linalg.qr(U_f.T, mode='r', pivoting=True)
+        p_list = [group(p) for p in piv[:no_of_force_modes]]
+        return np.unique(np.concatenate(p_list))
+
+    if method != 'greedy':
+        raise ValueError('The selection method ' + str(method)
+                         + " is not known. Choose 'greedy' or 'qdeim'.")
+
+    # Only the triangular factor R of the QR decomposition of U_f[p, :] is
+    # kept. As U_f[p, :l] = Q[:, :l] @ R[:l, :l], the least squares fit of
+    # mode l on the selected rows reduces to R[:l, :l] @ c = R[:l, l].
+    tpqrt = sp.linalg.get_lapack_funcs('tpqrt', (U_f,))
+    R = np.zeros((no_of_force_modes, no_of_force_modes), dtype=U_f.dtype)
+    selected = np.zeros(ndim, dtype=bool)
+    colloc_dofs = np.zeros(0, dtype=int)
+    for l in range(no_of_force_modes):
+        if l == 0:
+            res = U_f[:,l].copy()
+        else:
+            c = sp.linalg.solve_triangular(R[:l,:l], R[:l,l])
+            res = U_f[:,l] - U_f[:,:l] @ c
+        res[selected] = 0
+        p = np.argmax(np.absolute(res))
+        p_new = np.setdiff1d(group(p), colloc_dofs)
+        selected[p_new] = True
+        colloc_dofs = np.concatenate((colloc_dofs, p_new))
+
+        # update R with the new rows
+        R, __, __, info = tpqrt(0, 1, R, U_f[p_new,:])
+        if info != 0:
+            raise ValueError('QR update of the collocated force basis '
+                             + 'failed with info ' + str(info) + '.')
+
+    return np.sort(colloc_dofs)
+
+
+def _collocation_matrix(colloc_dofs, ndim):
+    '''
+    Return the boolean collocation matrix P with P[colloc_dofs[i], i] = 1.
+    '''
+    n_coll = len(colloc_dofs)
+    return sp.sparse.csr_matrix((np.ones(n_coll, dtype=bool),
+                                 (colloc_dofs, np.arange(n_coll))),
+                                shape=(ndim, n_coll), dtype=bool)
+
+
+# assembly of the worker processes computing the force snapshots
+_worker_assembly = None
+
+
+def _init_force_worker(assembly):
+    '''
+    Initializer of the worker processes of DEIMSystem.force_basis.
+    '''
+    global _worker_assembly
+    _worker_assembly = assembly
+
+
+def _force_snapshots_worker(U):
+    '''
+    Compute the unassembled nonlinear forces of the snapshots U in a worker
+    process.
+    '''
+    return _worker_assembly.f_nl_unassembled_snapshots(U)
+
+
 class DEIMSystem(ReducedSystem):
     r'''
     Hyper-reduction technique inherited from ReducedSystem class.
@@ -73,6 +182,13 @@ class DEIMSystem(ReducedSystem):
         the active elements onto the kinematic subspace. The i-th element has
         the projector proj_list[i] as oblique projector to give the
         contribution of the nonlinear force.
+    X_stack : ndarray, ndim (no_of_active_elements, no_of_dofs_per_element)
+        Nodal coordinates of the active elements.
+    V_stack : ndarray, ndim (no_of_active_elements, no_of_dofs_per_element,
+                             no_of_dofs)
+        Rows of V_unconstr belonging to the dofs of the active elements.
+    sampled_mesh : instance of SampledMesh
+        Mesh of the active elements the online evaluation runs on.
 
     Note
     ----
@@ -113,8 +229,12 @@ class DEIMSystem(ReducedSystem):
         self.K0_deim = None
         self.oblique_proj = None
         self.proj_list = None
+        self.X_stack = None
+        self.V_stack = None
+        self.sampled_mesh = None
         self.V_unconstr = None
         self.DEIM_type = ''
+        self.selection_method = 'greedy'
 
 
     def preprocess_DEIM(self, DEIM_type='unassem-deim-dof'):
@@ -154,6 +274,12 @@ class DEIMSystem(ReducedSystem):
         if 'sym' in deim_type:
             self.sym_flag = True
 
+        # Q-DEIM selection with a pivoted QR instead of the greedy loop
+        if 'qdeim' in deim_type:
+            self.selection_method = 'qdeim'
+        else:
+            self.selection_method = 'greedy'
+
         # This is a little verbose but clear; ele collocation is default.
         if 'ele' in deim_type:
             self.collocation_type = 'ele'
@@ -176,7 +302,8 @@ class DEIMSystem(ReducedSystem):
 
 
     def reduce_mesh(self, U_snapshots, no_of_force_modes=10,
-                          DEIM_type='unassem-deim-dof'):
+                          DEIM_type='unassem-deim-dof', no_of_processes=1,
+                          filename=None):
         '''
         Reduce the mesh using an interpolation gathered from the snapshots.
 
@@ -202,9 +329,19 @@ class DEIMSystem(ReducedSystem):
             - surrogate: {'surr'}
                 If this keyword is there, a surrogate technique for avoiding a
                 large SVD is used. This is the so-called surrogate DEIM.
+            - selection: {'qdeim'}
+                If this keyword is there, the collocation points are selected
+                by a column-pivoted QR decomposition of the force basis
+                (Q-DEIM) instead of the greedy DEIM algorithm.
             The string can then be composed in arbitrary order, ie.
             'dof-symm-surr' to make a surrogate symemtric DEIM with dof
             collocation.
+        no_of_processes : int, optional
+            Number of processes the force snapshots are computed in. Default
+            value 1.
+        filename : str, optional
+            Filename of a memory mapped file for the unassembled force
+            snapshots. Default is `None`, i.e. they are kept in RAM.
 
         Returns
         -------
@@ -261,14 +398,18 @@ class DEIMSystem(ReducedSystem):
         U_snapshots_unconstr = self.unconstrain_vec(U_snapshots)
         if self.unassem_flag: # UDEIM
             U_f_u = self.force_basis(U_snapshots_unconstr,no_of_force_modes,
-                                     unassembled=True)
+                                     unassembled=True,
+                                     no_of_processes=no_of_processes,
+                                     filename=filename)
             P_u, self.E_tilde = self.collocate_UDEIM(U_f_u)
             self.oblique_proj = self.V_unconstr.T @ self.C_deim @ U_f_u \
                                 @ sp.linalg.pinv(P_u.T @ U_f_u)
             self.P = P_u
         else: # DEIM
             U_f = self.force_basis(U_snapshots_unconstr,no_of_force_modes,
-                                     unassembled=False)
+                                     unassembled=False,
+                                     no_of_processes=no_of_processes,
+                                     filename=filename)
             P, self.E_tilde = self.collocate_DEIM(U_f)
             self.oblique_proj = self.V_unconstr.T @ U_f \
                                 @ sp.linalg.pinv(P.T @ U_f)
@@ -281,7 +422,19 @@ class DEIMSystem(ReducedSystem):
         proj_full = proj_full.T.reshape((no_of_elements, dofs_per_element,
                                          no_of_modes))
 
-        self.proj_list = proj_full[self.E_tilde, :, :].transpose((0,2,1))
+        self.proj_list = np.ascontiguousarray(
+            proj_full[self.E_tilde, :, :].transpose((0,2,1)))
+        # sampled mesh and contiguous element data of the active elements for
+        # the online phase
+        self.sampled_mesh = SampledMesh(self.mesh_class, self.E_tilde,
+                                        self.V_unconstr)
+        self.X_stack, self.V_stack = self.sampled_mesh.element_stacks()
+
+        # linear correction; the only evaluation of the full mesh
+        K0_red, _ = ReducedSystem.K_and_f(self, u=None, t=0)
+        K0_deim_diff, _ = self.sampled_mesh.assemble_k_and_f_DEIM(
+            self.proj_list, self.X_stack, self.V_stack, symmetric=self.sym_flag)
+        self.K0_deim = K0_red - K0_deim_diff
 
         print('Finished (U)DEIM mesh reduction. \n' +
               '{} collocation nodes were selected for '.format(self.P.shape[1]) +
@@ -293,7 +446,8 @@ class DEIMSystem(ReducedSystem):
 
 
     def force_basis(self, U_snapshots_unconstr, no_of_force_modes,
-                    unassembled=True):
+                    unassembled=True, no_of_processes=1, chunk_size=50,
+                    filename=None):
         '''
         Compute the unassembled or assembled force modes based on an SVD of
         the force snapshots generated by the displacement vectors.
@@ -307,6 +461,16 @@ class DEIMSystem(ReducedSystem):
         unassembled : bool, optional
             Flag setting, if unassembled (True) or assembled (False) force basis
             is computed
+        no_of_processes : int, optional
+            Number of processes the force snapshots are computed in. Default
+            value 1.
+        chunk_size : int, optional
+            Number of snapshots evaluated in one batch or job. Default value
+            50.
+        filename : str, optional
+            If given, the unassembled force snapshots are written to a memory
+            mapped file with this name instead of an array in RAM. Default is
+            `None`.
 
 
         Returns
@@ -318,28 +482,55 @@ class DEIMSystem(ReducedSystem):
         # get all dimensions
         no_of_assbld_dofs, no_of_snapshots = U_snapshots_unconstr.shape
         no_of_elements = self.mesh_class.no_of_elements
-        no_of_unassbld_dofs = \
-            len(np.concatenate(self.assembly_class.element_indices))
+        assembly = self.assembly_class
+        assembly.compute_k0_unassembled()
+        no_of_unassbld_dofs = int(assembly.unassembled_offsets[-1])
 
         t1 = time.time()
 
-        # compute forces corresponding to displacements
-        F_snapshots = np.zeros((no_of_unassbld_dofs, no_of_snapshots))
-        for i, u in enumerate(U_snapshots_unconstr.T):
-            F_snapshots[:,i] = self.assembly_class.f_nl_unassembled(u, t=0)
+        # compute forces corresponding to displacements in batches
+        shape = (int(no_of_unassbld_dofs), int(no_of_snapshots))
+        if filename is None:
+            F_snapshots = np.zeros(shape)
+        else:
+            F_snapshots = np.lib.format.open_memmap(filename, mode='w+',
+                                                   shape=shape)
+        chunks = [slice(i, i + chunk_size)
+                  for i in range(0, no_of_snapshots, chunk_size)]
+        if no_of_processes > 1:
+            # the assembly is sent once per process, the jobs only carry the
+            # displacement snapshots
+            with mp.Pool(no_of_processes, initializer=_init_force_worker,
+                         initargs=(assembly,)) as pool:
+                jobs = [pool.apply_async(_force_snapshots_worker,
+                                         (U_snapshots_unconstr[:,chunk],))
+                        for chunk in chunks]
+                for chunk, job in zip(chunks, jobs):
+                    F_snapshots[:,chunk] = job.get()
+        else:
+            for chunk in chunks:
+                assembly.f_nl_unassembled_snapshots(
+                    U_snapshots_unconstr[:,chunk], out=F_snapshots[:,chunk])
 
         # assemble snapshots if necessary
         if not unassembled:
-            C_deim = self.assembly_class.compute_c_deim()
+            C_deim = assembly.compute_c_deim()
             F_snapshots = C_deim @ F_snapshots
 
         t2 = time.time()
 
-        # perform the SVD
-        if not self.surr_flag: # regular SVD
-            F_mode, sigma, _ = sp.linalg.svd(F_snapshots, full_matrices=False)
+        # perform the SVD; a randomized SVD is sufficient, if only a few force
+        # modes are requested
+        if not self.surr_flag:
+            if no_of_force_modes < min(F_snapshots.shape) // 2:
+                __, F_mode = pod(F_snapshots, n=no_of_force_modes,
+                                 method='randomized', chunk_size=chunk_size,
+                                 no_of_power_iter=2)
+            else: # regular SVD
+                F_mode, sigma, _ = sp.linalg.svd(F_snapshots,
+                                                 full_matrices=False)
 
-        elif self.unassembled: # surrogate SVD
+        elif unassembled: # surrogate SVD
             F_s_snapshots = force_surrogate(F_snapshots, no_of_elements)
             F_s_mode, sigma, V_s = sp.linalg.svd(F_s_snapshots,
                                                  full_matrices=False)
@@ -374,54 +565,23 @@ class DEIMSystem(ReducedSystem):
             Collocation matrix
 
         '''
-
         ndim, no_of_force_modes = U_f.shape
         dofs_per_node = self.mesh_class.no_of_dofs_per_node
         dofs_per_element = self.assembly_class.element_indices[0].shape[0]
         C_deim = self.C_deim
 
-        # this is more or less some nonsense but the linter is quiet then
-        P = None
-        colloc_dofs = np.array([], dtype=int)
-
-        # Selection loop
-        for l in range(no_of_force_modes):
-
-            # Compute the unassembled residual res by doing a least square
-            # take care of l == 0:
-            if l == 0:
-                res = U_f[:,l]
-            else:
-                A = P.T @ U_f[:,:l]
-                b = P.T @ U_f[:,l]
-
-                c = np.linalg.solve(A.T @ A, A.T @ b)
-                res = U_f[:,l] - U_f[:,:l] @ c
-
-            p = np.argmax(np.absolute(res))
-
-            # select all dofs of the selected node
-            if self.collocation_type == 'node':
-                node = p // dofs_per_node
-                p = node * dofs_per_node + np.arange(dofs_per_node)
-
-            colloc_dofs = np.append(colloc_dofs, p)
-            colloc_dofs = np.unique(colloc_dofs)
+        group = None
+        # select all dofs of the selected node
+        if self.collocation_type == 'node':
+            group = lambda p: (p // dofs_per_node) * dofs_per_node \
+                              + np.arange(dofs_per_node)
 
-            # Build P:
-            n_coll = len(colloc_dofs)
-            P = sp.sparse.csr_matrix((np.ones(n_coll, dtype=bool),
-                                      (colloc_dofs, np.arange(n_coll))),
-                                     shape=(ndim, n_coll), dtype=bool)
+        colloc_dofs = deim_selection(U_f, group, self.selection_method)
+        P = _collocation_matrix(colloc_dofs, ndim)
 
         # Handle element set
-        E_tilde = np.array([], dtype=int)
-
-        for dof in colloc_dofs:
-            p_all = C_deim.indices[C_deim.indptr[dof]:C_deim.indptr[dof+1]]
-            E_tilde = np.append(E_tilde, p_all // dofs_per_element)
-
-        E_tilde = np.unique(E_tilde)
+        C_deim_rows = C_deim[colloc_dofs]
+        E_tilde = np.unique(C_deim_rows.indices // dofs_per_element)
 
         return P, E_tilde
 
@@ -434,59 +594,28 @@ class DEIMSystem(ReducedSystem):
         dofs_per_node = self.mesh_class.no_of_dofs_per_node
         dofs_per_element = self.assembly_class.element_indices[0].shape[0]
         nodes_per_element = dofs_per_element // dofs_per_node
-        # this is more or less some nonsense but the linter is quiet then
-        P = None
-
-        E_tilde = np.array([], dtype=int)
-        colloc_dofs = np.array([], dtype=int)
-
-        for l in range(no_of_force_modes):
 
-            # Compute the unassembled residual res by doing a least square
-            # take care of l == 0:
-            if l == 0:
-                res = U_f_u[:,l]
-            else:
-                A = P.T @ U_f_u[:,:l]
-                b = P.T @ U_f_u[:,l]
-
-                c = np.linalg.solve(A.T @ A, A.T @ b)
-                res = U_f_u[:,l] - U_f_u[:,:l] @ c
-
-            p = np.argmax(np.absolute(res))
+        def group(p):
             element = p // dofs_per_element
-
-            E_tilde = np.append(E_tilde, element)
-
+            loc_dof = p - element*dofs_per_element
             # define the loc_in depending on the collocation method
             if self.collocation_type == 'dof':
-                # do the inverse of what is done below to keep colloc_dofs_temp
-                # equal to p
-                loc_ind = p - element*dofs_per_element
-
+                loc_ind = np.array([loc_dof])
             elif self.collocation_type == 'node':
-                loc_dof = p - element*dofs_per_element
                 node_num = loc_dof // dofs_per_node
                 loc_ind = node_num*dofs_per_node + np.arange(dofs_per_node)
-
             elif self.collocation_type == 'component':
-                loc_dof = p - element*dofs_per_element
                 component = loc_dof % dofs_per_node
                 loc_ind = np.arange(nodes_per_element)*dofs_per_node + component
-
             else:
                 loc_ind = self.ele_colloc_dict[self.collocation_type]
+            return element*dofs_per_element + loc_ind
 
-            colloc_dofs_temp = element*dofs_per_element + loc_ind
-            colloc_dofs = np.unique(np.append(colloc_dofs, colloc_dofs_temp))
-
-            n_coll = len(colloc_dofs)
-            P = sp.sparse.csr_matrix((np.ones(n_coll, dtype=bool),
-                                      (colloc_dofs, np.arange(n_coll))),
-                                     shape=(ndim, n_coll), dtype=bool)
+        colloc_dofs = deim_selection(U_f_u, group, self.selection_method)
+        P = _collocation_matrix(colloc_dofs, ndim)
 
         # Element set has to be unique
-        E_tilde = np.unique(E_tilde)
+        E_tilde = np.unique(colloc_dofs // dofs_per_element)
 
         return P, E_tilde
 
@@ -514,19 +643,9 @@ class DEIMSystem(ReducedSystem):
         if u is None:
             u = np.zeros(self.V_unconstr.shape[1])
 
-        if self.K0_deim is None:
-            K0_red, _ = ReducedSystem.K_and_f(self,u=None,t=0)
-            K0_deim_diff, _ = self.assembly_class.assemble_k_and_f_DEIM(
-                                    self.E_tilde, self.proj_list,
-                                    self.V_unconstr, u_red=u*0, t=t,
-                                    symmetric=self.sym_flag)
-
-            self.K0_deim = K0_red - K0_deim_diff
-
-        K_deim, f_deim = self.assembly_class.assemble_k_and_f_DEIM(
-                                    self.E_tilde, self.proj_list,
-                                    self.V_unconstr, u_red=u, t=t,
-                                    symmetric=self.sym_flag)
+        K_deim, f_deim = self.sampled_mesh.assemble_k_and_f_DEIM(
+            self.proj_list, self.X_stack, self.V_stack, u_red=u, t=t,
+            symmetric=self.sym_flag)
 
         K = K_deim + self.K0_deim
         f_int = f_deim + self.K0_deim @ u
@@ -595,8 +714,16 @@ def reduce_mechanical_system_deim(mechanical_system, V, overwrite=False,
     reduced_sys.V_unconstr = reduced_sys.dirichlet_class.unconstrain_vec(V)
     reduced_sys.u_red_output = []
     reduced_sys.M_constr = None
+    reduced_sys.K0_red = None
+    # reduce Rayleigh damping matrix
+    if reduced_sys.D_constr is not None:
+        reduced_sys.D_constr = V.T @ reduced_sys.D_constr @ V
 
     reduced_sys.E_tilde = None
+    reduced_sys.proj_list = None
+    reduced_sys.X_stack = None
+    reduced_sys.V_stack = None
+    reduced_sys.sampled_mesh = None
     reduced_sys.K0_deim = None
     reduced_sys.DEIM_type = None
     reduced_sys.assembly_type = assembly
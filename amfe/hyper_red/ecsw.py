@@ -4,24 +4,36 @@ TODO: Write introduction to ECSW
 
 import time
 import copy
+import warnings
 import numpy as np
 import scipy as sp
 
 from ..mechanical_system import ReducedSystem
+from .sampled_mesh import SampledMesh
+from ..quadratic_manifold.qm_system import QMSystem, \
+    reduce_mechanical_system_qm
 
 __all__ = ['ECSWSystem',
            'reduce_mechanical_system_ecsw',
+           'QMECSWSystem',
+           'reduce_mechanical_system_qm_ecsw',
            'sparse_nnls',
+           'RowCompression',
           ]
 
 
-def sparse_nnls(G, b, tau, conv_stats=False, verbose=True):
+def sparse_nnls(G, b, tau, conv_stats=None, verbose=True, no_of_candidates=1,
+                max_no_of_elements=None, stagnation_tol=None, xi0=None):
     r'''
     Run the sparse NNLS-solver in order to find a sparse vector xi satisfying
 
     .. math::
         || G \xi - b ||_2 \leq \tau ||b||_2 \quad\text{with}\quad \min||\xi||_0
 
+    The least squares problems on the active set are solved with a thin QR
+    decomposition of the active columns of G which is updated when columns
+    are added or removed.
+
     Parameters
     ----------
     G : ndarray, shape: (n*m, no_of_elements)
@@ -30,9 +42,25 @@ def sparse_nnls(G, b, tau, conv_stats=False, verbose=True):
         force contribution vector
     tau : float
         tolerance
-    conv_info : bool
-        Flag for setting, that more detailed output is produced with
-        convergence information.
+    conv_stats : bool, optional
+        Deprecated and without effect, as the convergence statistics are
+        always returned. Passing it raises a DeprecationWarning.
+    verbose : bool, optional
+        Flag for printing a summary of the solution process. Default True.
+    no_of_candidates : int, optional
+        Maximum number of elements added to the active set per outer
+        iteration. Default value 1.
+    max_no_of_elements : int, optional
+        The iteration is stopped when the active set reaches this size.
+        Default is `None`, i.e. no limit.
+    stagnation_tol : float, optional
+        The iteration is stopped when an outer iteration decreases the
+        residual by less than stagnation_tol times the residual. Default is
+        `None`, i.e. no stagnation check.
+    xi0 : ndarray, shape: (no_of_elements,), optional
+        Non-negative weight vector used as a warm start, e.g. from a
+        previous training. Default is `None`, i.e. the iteration starts with
+        an empty active set.
 
     Returns
     -------
@@ -41,9 +69,10 @@ def sparse_nnls(G, b, tau, conv_stats=False, verbose=True):
     xi_red : ndarray, shape: (k,)
         The values of the non-zero elements.
     stats : ndarray
-        Infos about the convergence of the system. The first column shows the
-        size of the active set, the second column the residual. If conv_info is
-        set to False, an empty array is returned.
+        Structured array with one entry per outer iteration and the fields
+        'no_of_elements' (size of the active set), 'residual' (norm of the
+        residual), 'no_of_removed' (number of elements removed from the
+        active set in the iteration) and 'time' (time since start).
 
     References
     ----------
@@ -55,65 +84,273 @@ def sparse_nnls(G, b, tau, conv_stats=False, verbose=True):
             International Journal for Numerical Methods in Engineering, 2016.
 
     '''
+    if conv_stats is not None:
+        warnings.warn('The parameter conv_stats of sparse_nnls is deprecated '
+                      + 'and will be removed. The convergence statistics are '
+                      + 'always returned.', DeprecationWarning, stacklevel=2)
+    t0 = time.time()
     no_of_elements = G.shape[1]
     norm_b = np.linalg.norm(b)
-    r = b
-
-    xi = np.zeros(no_of_elements) # the resulting vector
-    zeta = np.zeros(no_of_elements) # the trial vector which is iterated over
-
-    # Boolean active set; allows quick and easys indexing through masking with
-    # high performance at the same time
-    active_set = np.zeros(no_of_elements, dtype=bool)
 
+    def G_col(idx):
+        col = G[:,idx]
+        return col.toarray().ravel() if sp.sparse.issparse(col) else col
+
+    # active elements in the order of the columns of the QR decomposition
+    # G[:, active] = Q @ R
+    active = []
+    Q = np.zeros((len(b), 0))
+    R = np.zeros((0, 0))
+    xi_active = np.zeros(0) # the resulting vector on the active set
+
+    def add_column(Q, R, idx):
+        col = G_col(idx)
+        if R.shape[1] >= Q.shape[0]: # no further independent column
+            return None
+        try:
+            Q, R = sp.linalg.qr_insert(Q, R, col, R.shape[1], which='col')
+        except sp.linalg.LinAlgError: # column is linearly dependent
+            return None
+        if abs(R[-1,-1]) <= 1E-12*np.linalg.norm(col):
+            return None
+        return Q, R
+
+    if xi0 is not None:
+        for idx in np.where(xi0 > 0)[0]:
+            QR = add_column(Q, R, idx)
+            if QR is not None:
+                Q, R = QR
+                active.append(idx)
+        xi_active = xi0[active].astype(float)
+
+    dtype = [('no_of_elements', int), ('residual', float),
+             ('no_of_removed', int), ('time', float)]
     stats = []
-    while np.linalg.norm(r) > tau * norm_b:
+    r = b - Q @ (R @ xi_active)
+    norm_r = np.linalg.norm(r)
+    while norm_r > tau * norm_b:
+        if max_no_of_elements is not None \
+                and len(active) >= max_no_of_elements:
+            break
         mu = G.T @ r
-        idx = np.argmax(mu)
-        active_set[idx] = True
-        print('Added element {}'.format(idx))
+        mu[active] = -np.inf
+        candidates = np.argsort(mu)[::-1][:no_of_candidates]
+        candidates = candidates[mu[candidates] > 0]
+        no_of_added = 0
+        for idx in candidates:
+            QR = add_column(Q, R, idx)
+            if QR is not None:
+                Q, R = QR
+                active.append(idx)
+                xi_active = np.append(xi_active, 0.)
+                no_of_added += 1
+        if no_of_added == 0: # no element can decrease the residual
+            break
+
+        no_of_removed = 0
         while True:
             # Trial vector zeta is solved for the sparse solution
-            zeta[~active_set] = 0
-            G_red = G[:,active_set]
-            zeta[active_set] = sp.linalg.solve(G_red.T @ G_red, G_red.T @ b)
+            zeta = sp.linalg.solve_triangular(R, Q.T @ b)
 
             # check, if gathered solution is full positive
-            if np.min(zeta[active_set]) >= 0:
-                xi[:] = zeta[:]
+            if len(zeta) == 0 or np.min(zeta) > 0:
+                xi_active = zeta
                 break
-            else: # remove the negative elements from the active set
-                # Get all elements which violate the constraint, i.e. are in the
-                # active set and are smaller than zero
-                mask = np.logical_and(zeta <= 0, active_set)
-
-                ele_const = np.argmin(xi[mask] / (xi[mask] - zeta[mask]))
-                const_idx = np.where(mask)[0][ele_const]
-                print('Remove element {} '.format(const_idx) +
-                       'violating the constraint.')
-                # Amplify xi with the difference of zeta and xi such, that the
-                # largest mismatching negative point becomes zero.
-                alpha = np.min(xi[mask] / (xi[mask] - zeta[mask]))
-                xi += alpha * (zeta - xi)
-                # Set active set manually as otherwise floating point roundoff
-                # errors are not considered.
-                # active_set = xi != 0
-                active_set[const_idx] = False
-
-        r = b - G[:,active_set] @ xi[active_set]
-        if verbose:
-            print('snnls: residual', np.linalg.norm(r),
-                  'No of active elements:', len(np.where(xi)[0]))
-        if conv_stats:
-            stats.append((len(np.where(xi)[0]), np.linalg.norm(r)))
-
-    # sp.optimize.nnls(A, b)
-    indices = np.where(xi)[0] # remove the nasty tupel from np.where()
-    xi_red = xi[active_set]
-    stats = np.array(stats)
+            # Amplify xi with the difference of zeta and xi such, that the
+            # largest mismatching negative point becomes zero.
+            mask = zeta <= 0
+            # columns added in this iteration have xi = 0; for zeta = 0 the
+            # step length is zero instead of 0/0
+            denom = xi_active[mask] - zeta[mask]
+            alpha = np.min(np.where(denom > 0, xi_active[mask]
+                                    / np.where(denom > 0, denom, 1.), 0.))
+            xi_active += alpha * (zeta - xi_active)
+            # remove the elements violating the constraint; at least the one
+            # which determined alpha
+            remove = np.where(np.logical_and(mask, xi_active <= 0))[0]
+            if len(remove) == 0:
+                remove = np.where(mask)[0][[np.argmin(xi_active[mask])]]
+            for k in remove[::-1]:
+                Q, R = sp.linalg.qr_delete(Q, R, k, which='col')
+                del active[k]
+            # a square Q is treated as full QR by qr_delete; cut back to the
+            # economic decomposition
+            Q, R = Q[:,:R.shape[1]], R[:R.shape[1],:]
+            xi_active = np.delete(xi_active, remove)
+            no_of_removed += len(remove)
+
+        if not active:
+            r = b
+            norm_r = norm_b
+            stats.append((0, norm_r, no_of_removed, time.time() - t0))
+            break
+        r = b - Q @ (R @ xi_active)
+        norm_r_old, norm_r = norm_r, np.linalg.norm(r)
+        stats.append((len(active), norm_r, no_of_removed, time.time() - t0))
+        if stagnation_tol is not None \
+                and norm_r_old - norm_r < stagnation_tol * norm_r_old:
+            break
+
+    order = np.argsort(active)
+    indices = np.array(active, dtype=int)[order]
+    xi_red = xi_active[order]
+    stats = np.array(stats, dtype=dtype)
+    if verbose:
+        print('snnls: residual {0:3.4} after {1} iterations with {2} active '
+              'elements.'.format(norm_r / norm_b, len(stats), len(indices)))
+        if norm_r > tau * norm_b:
+            print('snnls: tolerance tau={0:3.4} not reached.'.format(tau))
     return indices, xi_red, stats
 
 
+class RowCompression():
+    r'''
+    Compression of the rows of the ECSW contribution matrix G which is fed
+    block wise with columns of G.
+
+    Since b = G @ 1 lies in the range of G, the compressed matrix
+    G_c = Omega @ G approximately preserves the residual norm of the sparse
+    NNLS problem:
+
+    .. math::
+        || G_c \xi - G_c 1 ||_2 \approx || G \xi - b ||_2
+
+    The random sketches (Gaussian or sparse sign matrix Omega) preserve the
+    norm in the Johnson-Lindenstrauss sense. The SVD-based compression
+    builds an orthonormal basis of the range of G while the columns are
+    streamed and finally truncates it to the leading left singular vectors.
+    Without truncation it preserves the residual norm exactly.
+
+    The object holds the state of one compressed matrix only. It is reset at
+    the beginning of every assembly of G, so it can be reused for several
+    assemblies.
+
+    Attributes
+    ----------
+    b_full : ndarray
+        Uncompressed force contribution vector b, i.e. the sum of all columns
+        of G.
+
+    '''
+
+    def __init__(self, no_of_rows=None, method='gaussian', tol=1E-12,
+                 nnz_per_column=8):
+        '''
+        Parameters
+        ----------
+        no_of_rows : int, optional
+            Number of rows of the compressed matrix. Required for the random
+            sketches; for method 'svd', `None` keeps all directions above tol.
+        method : {'gaussian', 'sparse_sign', 'svd'}, optional
+            Compression technique. Default 'gaussian'.
+        tol : float, optional
+            Relative tolerance for dropping directions in the range of G for
+            method 'svd'. Default value 1E-12.
+        nnz_per_column : int, optional
+            Number of non-zero entries per column of the sparse sign sketch.
+            Default value 8.
+
+        '''
+        if method not in ('gaussian', 'sparse_sign', 'svd'):
+            raise ValueError('The row compression method ' + str(method)
+                             + " is not known. Choose 'gaussian', "
+                             + "'sparse_sign' or 'svd'.")
+        if no_of_rows is None and method != 'svd':
+            raise ValueError('The number of rows is required for a random '
+                             + 'sketch.')
+        self.no_of_rows = no_of_rows
+        self.method = method
+        self.tol = tol
+        self.nnz_per_column = nnz_per_column
+        self.reset()
+
+    def reset(self):
+        '''
+        Drop the compressed columns, the sketch and b_full in order to
+        compress a new matrix G.
+        '''
+        self.Omega = None
+        self.Q = None
+        self.b_full = None
+        self._blocks = []
+        self._max_norm = 0.
+
+    def _build_sketch(self, no_of_full_rows):
+        k = self.no_of_rows
+        if self.method == 'gaussian':
+            return np.random.standard_normal((k, no_of_full_rows)) / np.sqrt(k)
+        # sparse sign matrix with nnz_per_column entries +-1/sqrt(s) per column
+        s = min(self.nnz_per_column, k)
+        # s distinct rows per column; drawn with replacement and the
+        # duplicates are redrawn, so no dense k x N array is built
+        if s == k:
+            rows = np.tile(np.arange(k), (no_of_full_rows, 1))
+        else:
+            rows = np.random.randint(k, size=(no_of_full_rows, s))
+            while True:
+                rows.sort(axis=1)
+                duplicate = rows[:,1:] == rows[:,:-1]
+                if not np.any(duplicate):
+                    break
+                rows[:,1:][duplicate] = np.random.randint(
+                    k, size=np.count_nonzero(duplicate))
+        vals = np.random.choice((-1., 1.), s*no_of_full_rows) / np.sqrt(s)
+        indptr = np.arange(0, s*no_of_full_rows + 1, s)
+        return sp.sparse.csc_matrix((vals, rows.ravel(), indptr),
+                                    shape=(k, no_of_full_rows))
+
+    def update(self, G_chunk):
+        '''
+        Compress the next columns G_chunk of G.
+        '''
+        if self.b_full is None:
+            self.b_full = np.zeros(G_chunk.shape[0])
+            if self.method == 'svd':
+                self.Q = np.zeros((G_chunk.shape[0], 0))
+            else:
+                self.Omega = self._build_sketch(G_chunk.shape[0])
+        elif G_chunk.shape[0] != self.b_full.shape[0]:
+            raise ValueError('The number of rows of G_chunk does not match '
+                             + 'the previous columns. Call reset before '
+                             + 'compressing a new matrix.')
+        self.b_full += np.sum(G_chunk, axis=1)
+
+        if self.method != 'svd':
+            self._blocks.append(self.Omega @ G_chunk)
+            return
+
+        # block Gram-Schmidt with reorthogonalization; the new directions are
+        # taken from the SVD of the residual in order to drop negligible ones
+        self._max_norm = max(self._max_norm,
+                             np.max(np.linalg.norm(G_chunk, axis=0)))
+        P = self.Q.T @ G_chunk
+        R = G_chunk - self.Q @ P
+        P_corr = self.Q.T @ R
+        R -= self.Q @ P_corr
+        P += P_corr
+        U_R, sigma_R, Vt_R = sp.linalg.svd(R, full_matrices=False)
+        keep = sigma_R > self.tol*self._max_norm
+        self.Q = np.hstack((self.Q, U_R[:,keep]))
+        self._blocks.append(np.vstack((P, sigma_R[keep,None]*Vt_R[keep])))
+
+    def compressed_matrix(self):
+        '''
+        Return the compressed matrix of all columns passed to update.
+        '''
+        if self.method != 'svd':
+            return np.hstack(self._blocks)
+        r = self.Q.shape[1]
+        G_c = np.zeros((r, sum(C.shape[1] for C in self._blocks)))
+        col = 0
+        for C in self._blocks:
+            G_c[:C.shape[0], col:col+C.shape[1]] = C
+            col += C.shape[1]
+        if self.no_of_rows is not None and self.no_of_rows < r:
+            U_c, sigma_c, __ = sp.linalg.svd(G_c, full_matrices=False)
+            G_c = U_c[:,:self.no_of_rows].T @ G_c
+        return G_c
+
+
 class ECSWSystem(ReducedSystem):
     '''
     Hyper Reduced system using ECSW for the redcution.
@@ -127,8 +364,17 @@ class ECSWSystem(ReducedSystem):
         # values to be computed in reduce_mesh
         self.weights = None
         self.weight_idx = None
-
-    def reduce_mesh(self, W_red, tau=0.001, verbose=True):
+        self.sampled_mesh = None
+        self.training_error = None
+        # persisted training data for the incremental retraining
+        self.G_train = None
+        self.b_train = None
+        self.b_train_full = None
+        self.W_train = None
+        self.G_train_compressed = False
+
+    def reduce_mesh(self, W_red, tau=0.001, verbose=True,
+                    row_compression=None, incremental=False, **nnls_options):
         '''
         Compute a reduced mesh using a sparse NNLS solver for gaining the
         weights.
@@ -139,6 +385,22 @@ class ECSWSystem(ReducedSystem):
             Snapshot training matrix for which the energy equality is ensured.
         tau : float, optional
             tolerance for fitting the best solution
+        row_compression : instance of RowCompression, optional
+            If given, the rows of G are compressed while G is assembled and
+            the sparse NNLS problem is solved for the compressed matrix.
+            Default is `None`.
+        incremental : bool, optional
+            If True, G and b of the training set are kept, so the training
+            can be extended by later calls. If the mesh has been reduced
+            incrementally before, W_red contains only the new snapshots. Their
+            rows are appended to the persisted G and b and the sparse NNLS
+            solver is warm started with the current weights, so the active
+            set only grows where the new snapshots need it. If False, the
+            training data is not kept and persisted data is released.
+            Default False.
+        **nnls_options : optional
+            Further keyword arguments of sparse_nnls, e.g. no_of_candidates,
+            stagnation_tol or xi0.
 
         Returns
         -------
@@ -147,39 +409,95 @@ class ECSWSystem(ReducedSystem):
         weights : ndarray
             weights for reduced mesh
         stats : ndarray
-            statistics about the convergence of the sparse NNLS solver. The
-            first column shows the size of the active set, the secont column
-            the residual. If `verbose=False`, an empty array is returned.
+            statistics about the convergence of the sparse NNLS solver. See
+            sparse_nnls for the fields of the structured array.
 
         Note
         ----
-        The indices and weights of the reduced mesh are also internally saved.
+        The indices and weights of the reduced mesh are also internally saved
+        together with the sampled sub-mesh the online evaluation runs on.
+        The relative energy conservation error ||G xi - b|| / ||b|| on the
+        uncompressed training set is saved in training_error. For an
+        incremental training, G and b of the whole training set are kept in
+        G_train and b_train until release_training_data is called.
         '''
         print('Start reducing mesh with tolerance tau={0:3.4}'.format(tau))
         t1 = time.time()
         W_unconstr = self.V_unconstr @ W_red
         print('Assemble matrices G and b...')
-        G, b = self.assembly_class.assemble_g_and_b(self.V_unconstr,
-                                                    W_unconstr,
-                                                    verbose=verbose)
+        G, b = self.assembly_class.assemble_g_and_b(
+            self.V_unconstr, W_unconstr, verbose=verbose,
+            row_compression=row_compression)
+        b_full = b if row_compression is None else row_compression.b_full
+        compressed = row_compression is not None
+        if incremental and self.G_train is not None:
+            G = np.vstack((self.G_train, G))
+            b = np.concatenate((self.b_train, b))
+            b_full = np.concatenate((self.b_train_full, b_full))
+            W_red = np.hstack((self.W_train, W_red))
+            W_unconstr = self.V_unconstr @ W_red
+            compressed = compressed or self.G_train_compressed
+            xi0 = np.zeros(G.shape[1])
+            xi0[self.weight_idx] = self.weights
+            nnls_options.setdefault('xi0', xi0)
+        if incremental:
+            self.G_train, self.b_train, self.b_train_full = G, b, b_full
+            self.W_train = W_red
+            self.G_train_compressed = compressed
+        else:
+            self.release_training_data()
         print('') # newline as dots are written without newline
         print('Solve sparse NNLS problem')
         xi_indices, xi, stats = sparse_nnls(G, b, tau, verbose=verbose,
-                                            conv_stats=verbose)
+                                            **nnls_options)
         self.weight_idx = xi_indices
         self.weights = xi
+        # the online evaluation runs on the mesh of the sampled elements
+        self.sampled_mesh = SampledMesh(self.mesh_class, xi_indices,
+                                        self.V_unconstr)
+
+        # energy conservation error on the uncompressed training set; only
+        # the columns of the selected elements are needed
+        if compressed:
+            G_red, __ = self.assembly_class.assemble_g_and_b(
+                self.V_unconstr, W_unconstr, elements=xi_indices)
+        else:
+            G_red = G[:,xi_indices]
+        self.training_error = np.linalg.norm(G_red @ xi - b_full) \
+                              / np.linalg.norm(b_full)
         t2 = time.time()
 
         print('Mesh successfully reduced to', len(xi), 'Elements.')
+        print('Energy conservation error on the training set: '
+              + '{0:3.4}'.format(self.training_error))
         print('Full mesh size is', self.mesh_class.no_of_elements, 'Elements.')
         print('Time taken for mesh reduction: {0:3.4} seconds.'.format(t2-t1))
         return xi_indices, xi, stats
 
+    def release_training_data(self):
+        '''
+        Release G and b of an incremental training. The mesh cannot be reduced
+        incrementally afterwards.
+
+        Returns
+        -------
+        None
+        '''
+        self.G_train = None
+        self.b_train = None
+        self.b_train_full = None
+        self.W_train = None
+        self.G_train_compressed = False
+        return
+
     def K_and_f(self, u=None, t=0):
         if u is None:
             u = np.zeros(self.V.shape[1])
 
-        if self.assembly_type == 'direct':
+        if self.sampled_mesh is not None:
+            K, f_int = self.sampled_mesh.assemble_k_and_f_hyper(self.weights,
+                                                                u, t)
+        elif self.assembly_type == 'direct':
             K, f_int = self.assembly_class.assemble_k_and_f_hyper(
                           self.V_unconstr,self.weight_idx, self.weights, u, t)
         elif self.assembly_type == 'indirect':
@@ -191,34 +509,10 @@ class ECSWSystem(ReducedSystem):
         return K, f_int
 
     def K(self, u=None, t=0):
-        if u is None:
-            u = np.zeros(self.V.shape[1])
-
-        if self.assembly_type == 'direct':
-            K, f_int = self.assembly_class.assemble_k_and_f_hyper(
-                          self.V_unconstr,self.weight_idx, self.weights, u, t)
-        elif self.assembly_type == 'indirect':
-            K, f_int = self.assembly_class.assemble_k_and_f_hyper_no_inplace(
-                          self.V_unconstr,self.weight_idx, self.weights, u, t)
-        else:
-            raise ValueError('The given assembly type for a reduced system '
-                             + 'is not valid.')
-        return K
+        return self.K_and_f(u, t)[0]
 
     def f_int(self, u, t=0):
-        if u is None:
-            u = np.zeros(self.V.shape[1])
-
-        if self.assembly_type == 'direct':
-            K, f_int = self.assembly_class.assemble_k_and_f_hyper(
-                          self.V_unconstr,self.weight_idx, self.weights, u, t)
-        elif self.assembly_type == 'indirect':
-            K, f_int = self.assembly_class.assemble_k_and_f_hyper_no_inplace(
-                          self.V_unconstr,self.weight_idx, self.weights, u, t)
-        else:
-            raise ValueError('The given assembly type for a reduced system '
-                             + 'is not valid.')
-        return f_int
+        return self.K_and_f(u, t)[1]
 
     def export_paraview(self, filename, field_list=None):
 
@@ -283,8 +577,16 @@ def reduce_mechanical_system_ecsw(mechanical_system, V, overwrite=False,
     reduced_sys.V_unconstr = reduced_sys.dirichlet_class.unconstrain_vec(V)
     reduced_sys.weights = None
     reduced_sys.weight_idx = None
+    reduced_sys.sampled_mesh = None
+    reduced_sys.training_error = None
+    reduced_sys.G_train = None
+    reduced_sys.b_train = None
+    reduced_sys.b_train_full = None
+    reduced_sys.W_train = None
+    reduced_sys.G_train_compressed = False
     reduced_sys.u_red_output = []
     reduced_sys.M_constr = None
+    reduced_sys.K0_red = None
     # reduce Rayleigh damping matrix
     if reduced_sys.D_constr is not None:
         reduced_sys.D_constr = V.T @ reduced_sys.D_constr @ V
@@ -292,3 +594,142 @@ def reduce_mechanical_system_ecsw(mechanical_system, V, overwrite=False,
     print('The system is hyper reduced now. It still needs to build the ' +
           'reduced mesh.')
     return reduced_sys
+
+
+class QMECSWSystem(QMSystem):
+    '''
+    Hyper reduced Quadratic Manifold system using ECSW for the reduction.
+
+    The element weights are trained with the tangent P(u) = V + Theta @ u of
+    the manifold as test basis. In the online phase, the displacements are
+    lifted on the dofs of the sampled elements only.
+    '''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.V_unconstr = None
+        self.Theta_unconstr = None
+        # values to be computed in reduce_mesh
+        self.weights = None
+        self.weight_idx = None
+
+    def reduce_mesh(self, W_red, tau=0.001, verbose=True, **nnls_options):
+        '''
+        Compute a reduced mesh using a sparse NNLS solver for gaining the
+        weights.
+
+        Parameters
+        ----------
+        W_red : ndarray, shape(n_red, no_of_snapshots)
+            Snapshot training matrix in reduced coordinates of the manifold
+            for which the energy equality is ensured.
+        tau : float, optional
+            tolerance for fitting the best solution
+        **nnls_options : optional
+            Further keyword arguments of sparse_nnls, e.g. no_of_candidates,
+            stagnation_tol or xi0.
+
+        Returns
+        -------
+        weight_indices : ndarray
+            indices of members in the reduced mesh
+        weights : ndarray
+            weights for reduced mesh
+        stats : ndarray
+            statistics about the convergence of the sparse NNLS solver.
+
+        '''
+        print('Start reducing mesh with tolerance tau={0:3.4}'.format(tau))
+        t1 = time.time()
+        print('Assemble matrices G and b...')
+        G, b = self.assembly_class.assemble_g_and_b_qm(self.V_unconstr,
+                                                       self.Theta_unconstr,
+                                                       W_red, verbose=verbose)
+        print('') # newline as dots are written without newline
+        print('Solve sparse NNLS problem')
+        xi_indices, xi, stats = sparse_nnls(G, b, tau, verbose=verbose,
+                                            **nnls_options)
+        self.weight_idx = xi_indices
+        self.weights = xi
+        t2 = time.time()
+
+        print('Mesh successfully reduced to', len(xi), 'Elements.')
+        print('Full mesh size is', self.mesh_class.no_of_elements, 'Elements.')
+        print('Time taken for mesh reduction: {0:3.4} seconds.'.format(t2-t1))
+        return xi_indices, xi, stats
+
+    def K_and_f(self, u=None, t=0):
+        K, f_int = self.assembly_class.assemble_k_and_f_hyper_qm(
+            self.V_unconstr, self.Theta_unconstr, self.weight_idx,
+            self.weights, u, t)
+        return K, f_int
+
+    def K(self, u=None, t=0):
+        return self.K_and_f(u, t)[0]
+
+    def f_int(self, u, t=0):
+        return self.K_and_f(u, t)[1]
+
+    def export_paraview(self, filename, field_list=None):
+
+        # take care of None field lists
+        if field_list is None:
+            new_field_list = []
+        else:
+            new_field_list = field_list.copy()
+
+        # the h5 dictionary
+        h5_xi_dict = {'ParaView':True,
+             'AttributeType':'Scalar',
+             'Center':'Cell',
+             'Name':'weights_hyper_red',
+             'NoOfComponents':1,
+             }
+
+        xi = np.zeros(self.mesh_class.no_of_elements)
+        xi[self.weight_idx] = self.weights
+
+        new_field_list.append((xi, h5_xi_dict))
+
+        QMSystem.export_paraview(self, filename, new_field_list)
+        return
+
+
+def reduce_mechanical_system_qm_ecsw(mechanical_system, V, Theta,
+                                     overwrite=False):
+    '''
+    Reduce the given mechanical system to a hyper reduced QM system with the
+    basis V and the quadratic part Theta.
+
+    Parameters
+    ----------
+    mechanical_system : instance of MechanicalSystem
+        Mechanical system which will be transformed to a QMECSWSystem.
+    V : ndarray, shape (N_constrained, n_red)
+        Linear part of the manifold
+    Theta : ndarray
+        Quadratic tensor of the manifold, either full with shape
+        (N_constrained, n_red, n_red) or packed with shape
+        (N_constrained, n_red*(n_red+1)/2).
+    overwrite : bool, optional
+        switch, if mechanical system should be overwritten (is less memory
+        intensive for large systems) or not.
+
+    Returns
+    -------
+    reduced_system : instance of QMECSWSystem
+        Quadratic manifold system, which still needs to build the reduced mesh
+        with reduce_mesh.
+
+    '''
+    reduced_sys = reduce_mechanical_system_qm(mechanical_system, V, Theta,
+                                              overwrite=overwrite)
+    reduced_sys.__class__ = QMECSWSystem
+    reduced_sys.V_unconstr = reduced_sys.dirichlet_class.unconstrain_vec(V)
+    reduced_sys.Theta_unconstr = \
+        reduced_sys.dirichlet_class.unconstrain_vec(reduced_sys.Theta)
+    reduced_sys.weights = None
+    reduced_sys.weight_idx = None
+    print('The system is hyper reduced now. It still needs to build the ' +
+          'reduced mesh.')
+    return reduced_sys
@@ -0,0 +1,204 @@
+"""
+Polynomial reduced systems for St. Venant-Kirchhoff materials.
+
+For the Kirchhoff material the reduced internal force is a cubic polynomial
+in the reduced coordinates q:
+
+    f_a(q) = K1_ab q_b + A_abc q_b q_c + B_abcd q_b q_c q_d
+
+with the tensors A and B being symmetric in the indices b, c (, d). The
+tensors are computed offline with the stiffness evaluation procedure (STEP)
+from tangential stiffness matrices, so the online evaluation does not need
+the mesh.
+"""
+
+import time
+import copy
+import numpy as np
+
+from ..mechanical_system import ReducedSystem
+from ..material import KirchhoffMaterial
+from ..quadratic_manifold.qm_methods import pack_theta, theta_dot, \
+    theta_quadratic
+
+__all__ = ['PolynomialSystem',
+           'reduce_mechanical_system_polynomial',
+          ]
+
+
+class PolynomialSystem(ReducedSystem):
+    '''
+    Reduced system with a cubic polynomial internal force for
+    St. Venant-Kirchhoff materials.
+
+    Attributes
+    ----------
+    K1 : ndarray, shape (n_red, n_red)
+        Linear stiffness tensor.
+    K2 : ndarray, shape (n_red, n_red*(n_red+1)/2)
+        Quadratic stiffness tensor A_abc packed in the last two indices (b, c)
+        in the order of np.triu_indices(n_red).
+    K3 : ndarray, shape (n_red, n_red, n_red*(n_red+1)/2)
+        Cubic stiffness tensor B_abcd packed in the last two indices (c, d)
+        in the order of np.triu_indices(n_red).
+    '''
+
+    def __init__(self, **kwargs):
+        '''
+        Parameters
+        ----------
+        **kwargs : dict, optional
+            Keyword arguments to be passed to the mother class ReducedSystem.
+        '''
+        super().__init__(**kwargs)
+        # tensors to be computed in compute_step_tensors
+        self.K1 = None
+        self.K2 = None
+        self.K3 = None
+
+    def compute_step_tensors(self, displacement=None, verbose=True):
+        r'''
+        Compute the linear, quadratic and cubic stiffness tensors with the
+        stiffness evaluation procedure.
+
+        The tangential stiffness matrix of the cubic internal force is
+
+        .. math::
+            K_{ab}(q) = K1_{ab} + 2 A_{abc} q_c + 3 B_{abcd} q_c q_d
+
+        The tensors follow exactly from the tangential stiffness matrices at
+        the displacements :math:`\pm s_i e_i` and :math:`s_i e_i + s_j e_j`,
+        i.e. from 1 + 2n + n(n-1)/2 assemblies of the full system.
+
+        Parameters
+        ----------
+        displacement : float, optional
+            Maximum nodal displacement of the reduction vectors during the
+            evaluation, i.e. :math:`s_i = displacement / max|V_i|`. As the
+            force is a cubic polynomial, the value only affects the round-off.
+            Default is the largest extent of the mesh.
+        verbose : bool, optional
+            Flag for printing the progress. Default True.
+
+        Returns
+        -------
+        None
+        '''
+        for ele in self.mesh_class.ele_obj:
+            if not isinstance(ele.material, KirchhoffMaterial):
+                raise ValueError('The stiffness evaluation procedure is only '
+                                 + 'exact for the KirchhoffMaterial.')
+        t1 = time.time()
+        print('Compute the polynomial stiffness tensors with STEP...')
+        n = self.V.shape[1]
+        if displacement is None:
+            nodes = self.mesh_class.nodes
+            displacement = np.max(nodes.max(axis=0) - nodes.min(axis=0))
+        s = displacement / np.max(abs(self.V), axis=0)
+
+        def K(q):
+            return ReducedSystem.K(self, q)
+
+        K1 = K(np.zeros(n))
+        A = np.zeros((n, n, n))
+        B_diag = np.zeros((n, n, n))
+        for i in range(n):
+            q = np.zeros(n)
+            q[i] = s[i]
+            K_p = K(q)
+            K_m = K(-q)
+            A[:,:,i] = (K_p - K_m) / (4*s[i])
+            B_diag[:,:,i] = (K_p + K_m - 2*K1) / (6*s[i]**2)
+            if verbose:
+                print('.', end='', flush=True)
+
+        i_idx, j_idx = np.triu_indices(n)
+        B = np.zeros((n, n, len(i_idx)))
+        for k, (i, j) in enumerate(zip(i_idx, j_idx)):
+            if i == j:
+                B[:,:,k] = B_diag[:,:,i]
+                continue
+            q = np.zeros(n)
+            q[i], q[j] = s[i], s[j]
+            B[:,:,k] = (K(q) - K1 - 2*(s[i]*A[:,:,i] + s[j]*A[:,:,j])
+                        - 3*(s[i]**2*B_diag[:,:,i] + s[j]**2*B_diag[:,:,j])) \
+                       / (6*s[i]*s[j])
+            if verbose:
+                print('.', end='', flush=True)
+        if verbose:
+            print('')
+
+        self.K1 = K1
+        self.K2 = pack_theta((A + A.transpose(0,2,1))/2, check_symmetry=False)
+        self.K3 = B
+        t2 = time.time()
+        print('Time taken for the STEP tensors: {0:3.4} seconds.'.format(t2-t1))
+        return
+
+    def K_and_f(self, u=None, t=0):
+        if self.K1 is None:
+            raise ValueError('The polynomial tensors are not computed yet. '
+                             + 'Run compute_step_tensors first.')
+        n = self.K1.shape[0]
+        if u is None:
+            u = np.zeros(n)
+        K2_u = theta_dot(self.K2, u)
+        K3_u_u = theta_quadratic(self.K3.reshape((n*n, -1)), u).reshape((n, n))
+        K = self.K1 + 2*K2_u + 3*K3_u_u
+        f_int = (self.K1 + K2_u + K3_u_u) @ u
+        return K, f_int
+
+    def K(self, u=None, t=0):
+        return self.K_and_f(u, t)[0]
+
+    def f_int(self, u, t=0):
+        return self.K_and_f(u, t)[1]
+
+
+def reduce_mechanical_system_polynomial(mechanical_system, V, overwrite=False,
+                                        assembly='indirect'):
+    '''
+    Reduce the given mechanical system with the linear basis V to a system
+    with a polynomial internal force.
+
+    Parameters
+    ----------
+    mechanical_system : instance of MechanicalSystem
+        Mechanical system with KirchhoffMaterial which will be transformed to
+        a PolynomialSystem.
+    V : ndarray, shape (N_constrained, n_red)
+        Reduction Basis for the reduced system
+    overwrite : bool, optional
+        switch, if mechanical system should be overwritten (is less memory
+        intensive for large systems) or not.
+    assembly : str {'direct', 'indirect'}
+        flag setting, if direct or indirect assembly is done in the offline
+        stiffness evaluation.
+
+    Returns
+    -------
+    reduced_system : instance of PolynomialSystem
+        Reduced system with same properties of the mechanical system and
+        reduction basis V
+
+    '''
+    if overwrite:
+        reduced_sys = mechanical_system
+    else:
+        reduced_sys = copy.deepcopy(mechanical_system)
+    reduced_sys.__class__ = PolynomialSystem
+    reduced_sys.V = V.copy()
+    reduced_sys.V_unconstr = reduced_sys.dirichlet_class.unconstrain_vec(V)
+    reduced_sys.K1 = None
+    reduced_sys.K2 = None
+    reduced_sys.K3 = None
+    reduced_sys.u_red_output = []
+    reduced_sys.M_constr = None
+    reduced_sys.K0_red = None
+    # reduce Rayleigh damping matrix
+    if reduced_sys.D_constr is not None:
+        reduced_sys.D_constr = V.T @ reduced_sys.D_constr @ V
+    reduced_sys.assembly_type = assembly
+    print('The system is reduced now. It still needs to compute the '
+          + 'polynomial tensors.')
+    return reduced_sys
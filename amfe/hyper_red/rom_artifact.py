@@ -0,0 +1,497 @@
+"""
+Serialization of reduced models to a versioned hdf5 artifact.
+
+The artifact contains only what the online phase needs: the rows of the
+reduction basis belonging to the sampled sub-mesh, the hyper-reduction data,
+the projected constant operators, the material parameters and the sampled
+sub-mesh. Loading an artifact does not need the mesh files of the full model.
+"""
+
+import time
+import numpy as np
+import h5py
+
+from .. import element as element_module
+from .. import material as material_module
+from ..mechanical_system import MechanicalSystem, ReducedSystem
+from .sampled_mesh import SampledMesh
+from .ecsw import ECSWSystem
+from .deim import DEIMSystem
+
+__all__ = ['OnlineReducedSystem',
+           'save_rom_artifact',
+           'load_rom_artifact',
+           'ROM_ARTIFACT_VERSION',
+          ]
+
+ROM_ARTIFACT_VERSION = 1
+
+# constructor arguments of the materials and the attributes they are stored in
+_MATERIAL_PARAMETERS = {
+    'KirchhoffMaterial' : (('E', 'E_modulus'), ('nu', 'nu'), ('rho', 'rho'),
+                           ('plane_stress', 'plane_stress'),
+                           ('thickness', 'thickness')),
+    'NeoHookean' : (('mu', 'mu'), ('kappa', 'kappa'), ('rho', 'rho'),
+                    ('plane_stress', 'plane_stress'),
+                    ('thickness', 'thickness')),
+    'MooneyRivlin' : (('A10', 'A10'), ('A01', 'A01'), ('kappa', 'kappa'),
+                      ('rho', 'rho'), ('plane_stress', 'plane_stress'),
+                      ('thickness', 'thickness')),
+    }
+
+
+class OnlineReducedSystem(MechanicalSystem):
+    '''
+    Reduced system for the online phase built from a reduced model artifact.
+
+    The system provides the interface of the time integration and static
+    solvers. Only the sampled sub-mesh and the projected operators are
+    evaluated, the full mesh is not needed.
+
+    Attributes
+    ----------
+    system_type : str {'reduced', 'ecsw', 'deim'}
+        Type of the system the artifact was written from.
+    sampled_mesh : instance of SampledMesh
+        Mesh of the sampled elements.
+    weights : ndarray or None
+        Weights of the sampled elements for ECSW and plain reduced systems.
+    proj_stack : ndarray or None
+        DEIM projectors of the sampled elements.
+    X_stack : ndarray or None
+        Nodal coordinates of the sampled elements for DEIM.
+    V_stack : ndarray or None
+        Rows of V of the sampled elements for DEIM.
+    sym_flag : bool
+        Flag for the symmetric DEIM variants.
+    K0_deim : ndarray or None
+        Linear correction of the DEIM stiffness matrix.
+    K0_red : ndarray
+        Reduced stiffness matrix of the undeformed configuration.
+    neumann_mesh : instance of SampledMesh or None
+        Mesh of the Neumann skin elements.
+    load_cases : ndarray
+        Index of the load case of every Neumann skin element.
+    time_funcs : list
+        Time functions of the load cases.
+    V_unconstr : ndarray or None
+        Unconstrained reduction basis, if it is stored in the artifact. It is
+        only used for the export of the full displacements.
+    u_red_output : list
+        Reduced displacements of the written time steps.
+
+    '''
+
+    def __init__(self, sampled_mesh, M_red, K0_red, D_red=None, weights=None,
+                 proj_stack=None, symmetric=False, K0_deim=None,
+                 neumann_mesh=None, load_cases=None, time_funcs=None,
+                 V_unconstr=None, system_type='reduced'):
+        '''
+        Parameters
+        ----------
+        sampled_mesh : instance of SampledMesh
+            Mesh of the sampled elements.
+        M_red : ndarray
+            Reduced mass matrix.
+        K0_red : ndarray
+            Reduced stiffness matrix of the undeformed configuration.
+        D_red : ndarray, optional
+            Reduced damping matrix. Default `None`, i.e. no damping.
+        weights : ndarray, optional
+            Weights of the sampled elements. Necessary, if no DEIM projectors
+            are given.
+        proj_stack : ndarray, optional
+            DEIM projectors of the sampled elements. If given, the system is
+            evaluated with DEIM.
+        symmetric : bool, optional
+            Flag for the symmetric DEIM variants. Default False.
+        K0_deim : ndarray, optional
+            Linear correction of the DEIM stiffness matrix.
+        neumann_mesh : instance of SampledMesh, optional
+            Mesh of the Neumann skin elements. Default `None`, i.e. no
+            external force.
+        load_cases : ndarray, optional
+            Index of the load case of every Neumann skin element.
+        time_funcs : list, optional
+            Time functions of the load cases. Default is a constant function
+            for every load case.
+        V_unconstr : ndarray, optional
+            Unconstrained reduction basis for the export of full displacements.
+        system_type : str, optional
+            Type of the system the artifact was written from.
+
+        Returns
+        -------
+        None
+        '''
+        MechanicalSystem.__init__(self)
+        self.system_type = system_type
+        self.sampled_mesh = sampled_mesh
+        self.weights = weights
+        self.proj_stack = proj_stack
+        self.sym_flag = symmetric
+        self.K0_deim = K0_deim
+        self.K0_red = K0_red
+        self.M_constr = M_red
+        self.D_constr = D_red
+        self.V_unconstr = V_unconstr
+        self.u_red_output = []
+        self.neumann_mesh = neumann_mesh
+        if load_cases is None:
+            load_cases = np.zeros(0, dtype=int)
+        self.load_cases = load_cases
+        no_of_load_cases = np.max(load_cases, initial=-1) + 1
+        if time_funcs is None:
+            time_funcs = [_const_func]*no_of_load_cases
+        if len(time_funcs) != no_of_load_cases:
+            raise ValueError('The number of time functions does not match '
+                             + 'the number of load cases.')
+        self.time_funcs = time_funcs
+        if neumann_mesh is not None:
+            for ele, load_case in zip(neumann_mesh.ele_obj, load_cases):
+                ele.time_func = time_funcs[load_case]
+        if proj_stack is not None:
+            self.X_stack, self.V_stack = sampled_mesh.element_stacks()
+        else:
+            self.X_stack, self.V_stack = None, None
+            if weights is None:
+                raise ValueError('Either the weights or the DEIM projectors '
+                                 + 'of the sampled elements are necessary.')
+
+    def K_and_f(self, u=None, t=0):
+        if u is None:
+            u = np.zeros(self.M_constr.shape[0])
+        if self.proj_stack is not None:
+            K, f_int = self.sampled_mesh.assemble_k_and_f_DEIM(
+                self.proj_stack, self.X_stack, self.V_stack, u_red=u, t=t,
+                symmetric=self.sym_flag)
+            K += self.K0_deim
+            f_int += self.K0_deim @ u
+        else:
+            K, f_int = self.sampled_mesh.assemble_k_and_f_hyper(self.weights,
+                                                                u, t)
+        return K, f_int
+
+    def K(self, u=None, t=0):
+        return self.K_and_f(u, t)[0]
+
+    def f_int(self, u, t=0):
+        return self.K_and_f(u, t)[1]
+
+    def f_ext(self, u, du, t):
+        f_ext = np.zeros(self.M_constr.shape[0])
+        if self.neumann_mesh is None:
+            return f_ext
+        neumann_mesh = self.neumann_mesh
+        u_local = neumann_mesh.V @ u
+        for ele, indices in zip(neumann_mesh.ele_obj,
+                                neumann_mesh.element_indices):
+            __, f = ele.k_and_f_int(neumann_mesh.nodes_voigt[indices],
+                                    u_local[indices], t)
+            f_ext += neumann_mesh.V[indices].T @ f
+        return f_ext
+
+    def M(self, u=None, t=0):
+        return self.M_constr
+
+    def D(self, u=None, t=0):
+        if self.D_constr is None:
+            return self.M_constr*0
+        return self.D_constr
+
+    def write_timestep(self, t, u):
+        self.T_output.append(t)
+        self.u_red_output.append(u.copy())
+        if self.V_unconstr is not None:
+            self.u_output.append(self.V_unconstr @ u)
+
+    def clear_timesteps(self):
+        MechanicalSystem.clear_timesteps(self)
+        self.u_red_output = []
+
+
+def _const_func(t):
+    return 1
+
+
+def _neumann_mesh(reduced_system):
+    '''
+    Mesh of the Neumann skin elements of the reduced system and the load case
+    of every skin element. Every distinct time function is a load case.
+    '''
+    mesh = reduced_system.mesh_class
+    ndpn = mesh.no_of_dofs_per_node
+    connectivity = mesh.neumann_connectivity
+    if connectivity:
+        node_ids = np.unique(np.concatenate(connectivity))
+    else:
+        node_ids = np.zeros(0, dtype=int)
+    local_node = np.zeros(mesh.no_of_nodes, dtype=int)
+    local_node[node_ids] = np.arange(len(node_ids))
+    dofs = (node_ids[:,None]*ndpn + np.arange(ndpn)).ravel()
+    neumann_mesh = SampledMesh.from_arrays(
+        np.arange(len(connectivity)), node_ids, mesh.nodes[node_ids],
+        [local_node[nodes] for nodes in connectivity], mesh.neumann_obj,
+        reduced_system.V_unconstr[dofs, :], ndpn)
+
+    time_funcs = []
+    load_cases = np.zeros(len(connectivity), dtype=int)
+    for i, ele in enumerate(mesh.neumann_obj):
+        if ele.time_func not in time_funcs:
+            time_funcs.append(ele.time_func)
+        load_cases[i] = time_funcs.index(ele.time_func)
+    return neumann_mesh, load_cases
+
+
+def _write_sampled_mesh(group, sampled_mesh):
+    '''
+    Write the arrays of a sampled mesh and the types of its elements to the
+    hdf5 group.
+    '''
+    group.attrs['no_of_dofs_per_node'] = sampled_mesh.no_of_dofs_per_node
+    group.create_dataset('element_ids', data=sampled_mesh.element_ids)
+    group.create_dataset('node_ids', data=sampled_mesh.node_ids)
+    group.create_dataset('nodes', data=sampled_mesh.nodes)
+    offsets = np.cumsum([0] + [len(nodes) for nodes
+                               in sampled_mesh.connectivity])
+    connectivity = np.concatenate(sampled_mesh.connectivity
+                                  + [np.zeros(0, dtype=int)])
+    group.create_dataset('connectivity', data=connectivity)
+    group.create_dataset('connectivity_offsets', data=offsets)
+    group.create_dataset('V', data=sampled_mesh.V)
+    element_types = []
+    type_idx = np.zeros(sampled_mesh.no_of_elements, dtype=int)
+    for i, ele in enumerate(sampled_mesh.ele_obj):
+        ele_type = ele.__class__.__name__
+        if ele_type not in element_types:
+            element_types.append(ele_type)
+        type_idx[i] = element_types.index(ele_type)
+    group.attrs['element_types'] = np.array(element_types,
+        dtype=h5py.special_dtype(vlen=str))
+    group.create_dataset('element_type_idx', data=type_idx)
+    return
+
+
+def _read_sampled_mesh(group, ele_obj_func):
+    '''
+    Read a sampled mesh from the hdf5 group. The element objects are built by
+    ele_obj_func(element_class, i) for the i-th element.
+    '''
+    element_types = list(group.attrs['element_types'])
+    type_idx = group['element_type_idx'][()]
+    ele_obj = [ele_obj_func(getattr(element_module, element_types[idx]), i)
+               for i, idx in enumerate(type_idx)]
+    offsets = group['connectivity_offsets'][()]
+    connectivity = np.split(group['connectivity'][()], offsets[1:-1])
+    return SampledMesh.from_arrays(
+        group['element_ids'][()], group['node_ids'][()], group['nodes'][()],
+        connectivity, ele_obj, group['V'][()],
+        int(group.attrs['no_of_dofs_per_node']))
+
+
+def save_rom_artifact(reduced_system, filename, store_basis=False):
+    '''
+    Write the data of a reduced system needed in the online phase to a
+    versioned hdf5 artifact.
+
+    Parameters
+    ----------
+    reduced_system : instance of ReducedSystem, ECSWSystem or DEIMSystem
+        Reduced system. Hyper-reduced systems have to be reduced with
+        reduce_mesh before.
+    filename : str
+        Filename of the hdf5 artifact.
+    store_basis : bool, optional
+        Flag for storing the full unconstrained reduction basis, which is only
+        needed for the export of full displacements. Default False.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    A plain ReducedSystem is stored with all elements of the mesh as sampled
+    mesh and unit weights. The Neumann skin elements are stored as a second
+    sampled mesh. Their time functions cannot be stored; every distinct time
+    function is a load case and the time functions are passed to
+    load_rom_artifact in the order the load cases appear in the skin elements.
+    '''
+    if isinstance(reduced_system, DEIMSystem):
+        system_type = 'deim'
+    elif isinstance(reduced_system, ECSWSystem):
+        system_type = 'ecsw'
+    elif isinstance(reduced_system, ReducedSystem):
+        system_type = 'reduced'
+    else:
+        raise ValueError('Only ReducedSystem, ECSWSystem and DEIMSystem can '
+                         + 'be stored in a reduced model artifact.')
+
+    if system_type == 'reduced':
+        sampled_mesh = SampledMesh(
+            reduced_system.mesh_class,
+            np.arange(reduced_system.mesh_class.no_of_elements),
+            reduced_system.V_unconstr)
+    elif reduced_system.sampled_mesh is None:
+        raise ValueError('The mesh of the hyper-reduced system is not reduced '
+                         + 'yet.')
+    else:
+        sampled_mesh = reduced_system.sampled_mesh
+    neumann_mesh, load_cases = _neumann_mesh(reduced_system)
+
+    materials = []
+    material_idx = np.zeros(sampled_mesh.no_of_elements, dtype=int)
+    for i, ele in enumerate(sampled_mesh.ele_obj):
+        if ele.material not in materials:
+            materials.append(ele.material)
+        material_idx[i] = materials.index(ele.material)
+
+    with h5py.File(filename, 'w') as f:
+        f.attrs['format'] = 'amfe-rom'
+        f.attrs['version'] = ROM_ARTIFACT_VERSION
+        f.attrs['system_type'] = system_type
+
+        f.create_dataset('operators/M_red',
+                         data=ReducedSystem.M(reduced_system))
+        f.create_dataset('operators/K0_red',
+                         data=ReducedSystem.K(reduced_system))
+        if reduced_system.D_constr is not None:
+            f.create_dataset('operators/D_red', data=reduced_system.D_constr)
+
+        for i, material in enumerate(materials):
+            material_name = material.__class__.__name__
+            if material_name not in _MATERIAL_PARAMETERS:
+                raise ValueError('The material ' + material_name
+                                 + ' cannot be stored in a reduced model '
+                                 + 'artifact.')
+            material_group = f.create_group('materials/' + str(i))
+            material_group.attrs['class'] = material_name
+            for parameter, attribute in _MATERIAL_PARAMETERS[material_name]:
+                material_group.attrs[parameter] = getattr(material, attribute)
+
+        mesh_group = f.create_group('sampled_mesh')
+        _write_sampled_mesh(mesh_group, sampled_mesh)
+        mesh_group.create_dataset('material_idx', data=material_idx)
+
+        neumann_group = f.create_group('neumann_mesh')
+        _write_sampled_mesh(neumann_group, neumann_mesh)
+        ndim = neumann_mesh.no_of_dofs_per_node
+        direct = np.full((neumann_mesh.no_of_elements, ndim), np.nan)
+        for i, ele in enumerate(neumann_mesh.ele_obj):
+            # nan marks follower loads acting normal to the surface
+            if not isinstance(ele.direct, str):
+                direct[i] = ele.direct
+        neumann_group.create_dataset('val', data=[ele.val for ele
+                                                  in neumann_mesh.ele_obj])
+        neumann_group.create_dataset('direct', data=direct)
+        neumann_group.create_dataset('shadow_area',
+                                     data=[ele.shadow_area for ele
+                                           in neumann_mesh.ele_obj])
+        neumann_group.create_dataset('load_cases', data=load_cases)
+
+        hyper_group = f.create_group('hyper_reduction')
+        if system_type == 'deim':
+            hyper_group.create_dataset('proj_stack',
+                                       data=np.array(reduced_system.proj_list))
+            hyper_group.create_dataset('K0_deim', data=reduced_system.K0_deim)
+            hyper_group.attrs['symmetric'] = bool(reduced_system.sym_flag)
+        elif system_type == 'ecsw':
+            hyper_group.create_dataset('weights', data=reduced_system.weights)
+        else:
+            hyper_group.create_dataset(
+                'weights', data=np.ones(sampled_mesh.no_of_elements))
+
+        if store_basis:
+            f.create_dataset('reduction/V_unconstr',
+                             data=reduced_system.V_unconstr)
+    return
+
+
+def load_rom_artifact(filename, time_funcs=None):
+    '''
+    Build a ready-to-integrate reduced system from a reduced model artifact.
+
+    Parameters
+    ----------
+    filename : str
+        Filename of the hdf5 artifact written with save_rom_artifact.
+    time_funcs : list, optional
+        Time functions of the load cases of the Neumann boundary conditions.
+        Default is a constant function for every load case.
+
+    Returns
+    -------
+    online_system : instance of OnlineReducedSystem
+        Reduced system running on the sampled sub-mesh.
+    '''
+    t1 = time.time()
+    with h5py.File(filename, 'r') as f:
+        if f.attrs.get('format') != 'amfe-rom':
+            raise ValueError('The file ' + filename + ' is no reduced model '
+                             + 'artifact.')
+        version = int(f.attrs['version'])
+        if version > ROM_ARTIFACT_VERSION:
+            raise ValueError('The reduced model artifact has version '
+                             + str(version) + ', but only versions up to '
+                             + str(ROM_ARTIFACT_VERSION) + ' are supported.')
+        system_type = f.attrs['system_type']
+
+        materials = {}
+        for key, material_group in f['materials'].items():
+            attrs = material_group.attrs
+            material_class = getattr(material_module, attrs['class'])
+            kwargs = {parameter: attrs[parameter].item() for parameter, __
+                      in _MATERIAL_PARAMETERS[attrs['class']]}
+            materials[int(key)] = material_class(**kwargs)
+
+        # the elements share the element objects per type and material like
+        # in the full mesh
+        mesh_group = f['sampled_mesh']
+        material_idx = mesh_group['material_idx'][()]
+        ele_obj_dict = {}
+        def ele_obj_func(element_class, i):
+            key = (element_class, material_idx[i])
+            if key not in ele_obj_dict:
+                ele_obj_dict[key] = element_class(
+                    material=materials[material_idx[i]])
+            return ele_obj_dict[key]
+        sampled_mesh = _read_sampled_mesh(mesh_group, ele_obj_func)
+
+        # the skin elements get their own objects, as their time functions
+        # are set by the online system
+        neumann_group = f['neumann_mesh']
+        val = neumann_group['val'][()]
+        direct = neumann_group['direct'][()]
+        shadow_area = neumann_group['shadow_area'][()]
+        def neumann_obj_func(element_class, i):
+            if np.isnan(direct[i]).any():
+                direct_i = 'normal'
+            else:
+                direct_i = direct[i]
+            return element_class(val=val[i], direct=direct_i,
+                                 shadow_area=bool(shadow_area[i]))
+        neumann_mesh = _read_sampled_mesh(neumann_group, neumann_obj_func)
+
+        operators = f['operators']
+        D_red = operators['D_red'][()] if 'D_red' in operators else None
+        hyper_group = f['hyper_reduction']
+        if system_type == 'deim':
+            hyper_kwargs = {'proj_stack' : hyper_group['proj_stack'][()],
+                            'K0_deim' : hyper_group['K0_deim'][()],
+                            'symmetric' : bool(hyper_group.attrs['symmetric'])}
+        else:
+            hyper_kwargs = {'weights' : hyper_group['weights'][()]}
+        if 'reduction/V_unconstr' in f:
+            V_unconstr = f['reduction/V_unconstr'][()]
+        else:
+            V_unconstr = None
+
+        online_system = OnlineReducedSystem(
+            sampled_mesh, operators['M_red'][()], operators['K0_red'][()],
+            D_red=D_red, neumann_mesh=neumann_mesh,
+            load_cases=neumann_group['load_cases'][()],
+            time_funcs=time_funcs, V_unconstr=V_unconstr,
+            system_type=system_type, **hyper_kwargs)
+    t2 = time.time()
+    print('Reduced model artifact loaded in {0:4.4f} seconds.'.format(t2-t1))
+    return online_system
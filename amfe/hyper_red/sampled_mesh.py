@@ -0,0 +1,202 @@
+"""
+Compact sub-mesh of the elements sampled by a hyper-reduction method.
+
+"""
+
+import numpy as np
+
+from ..assembly import k_and_f_deim_stacked
+
+__all__ = ['SampledMesh',
+          ]
+
+
+class SampledMesh():
+    '''
+    Standalone mesh consisting only of the sampled elements of a
+    hyper-reduced system and their nodes.
+
+    The nodes and dofs are renumbered, so that all arrays of the sampled mesh
+    scale with the number of sampled elements and not with the size of the
+    full model.
+
+    Attributes
+    ----------
+    element_ids : ndarray
+        Ids of the sampled elements in the full mesh. The i-th element of the
+        sampled mesh is the element element_ids[i] of the full mesh.
+    node_ids : ndarray
+        Ids of the nodes of the sampled elements in the full mesh.
+    dofs : ndarray
+        Unconstrained dofs of the full mesh belonging to the sampled mesh. The
+        local dof i of the sampled mesh is the dof dofs[i] of the full mesh.
+    nodes : ndarray, shape (no_of_nodes, no_of_dofs_per_node)
+        Coordinates of the nodes of the sampled mesh.
+    connectivity : list of ndarrays
+        Connectivity of the sampled elements with the local node numbering.
+    element_indices : list of ndarrays
+        Local dofs of the sampled elements.
+    ele_obj : list
+        Element objects of the sampled elements.
+    nodes_voigt : ndarray
+        Nodal coordinates in voigt notation, i.e. for every local dof.
+    V : ndarray, shape (no_of_dofs, n_red)
+        Rows of the unconstrained reduction basis belonging to the local dofs.
+    no_of_dofs_per_node : int
+        Number of dofs per node.
+
+    '''
+
+    def __init__(self, mesh, element_ids, V_unconstr):
+        '''
+        Extract the sampled mesh from the full mesh.
+
+        Parameters
+        ----------
+        mesh : instance of Mesh
+            Full mesh of the mechanical system.
+        element_ids : ndarray
+            Ids of the sampled elements. The order is kept.
+        V_unconstr : ndarray, shape (N_unconstr, n_red)
+            Unconstrained reduction basis of the full system.
+
+        '''
+        element_ids = np.array(element_ids, dtype=int)
+        ndpn = mesh.no_of_dofs_per_node
+        connectivity = [mesh.connectivity[ele] for ele in element_ids]
+        if connectivity:
+            node_ids = np.unique(np.concatenate(connectivity))
+        else:
+            node_ids = np.zeros(0, dtype=int)
+        local_node = np.zeros(mesh.no_of_nodes, dtype=int)
+        local_node[node_ids] = np.arange(len(node_ids))
+        dofs = (node_ids[:,None]*ndpn + np.arange(ndpn)).ravel()
+
+        self._set_arrays(element_ids, node_ids, mesh.nodes[node_ids],
+                         [local_node[nodes] for nodes in connectivity],
+                         [mesh.ele_obj[ele] for ele in element_ids],
+                         V_unconstr[dofs, :], ndpn)
+
+    @classmethod
+    def from_arrays(cls, element_ids, node_ids, nodes, connectivity, ele_obj,
+                    V, no_of_dofs_per_node):
+        '''
+        Build a sampled mesh from its stored arrays without a full mesh, e.g.
+        when a reduced model artifact is loaded.
+
+        Parameters
+        ----------
+        element_ids : ndarray
+            Ids of the sampled elements in the full mesh.
+        node_ids : ndarray
+            Ids of the nodes of the sampled mesh in the full mesh.
+        nodes : ndarray, shape (no_of_nodes, no_of_dofs_per_node)
+            Coordinates of the nodes of the sampled mesh.
+        connectivity : list of ndarrays
+            Connectivity of the sampled elements with the local node numbering.
+        ele_obj : list
+            Element objects of the sampled elements.
+        V : ndarray, shape (no_of_dofs, n_red)
+            Rows of the unconstrained reduction basis of the local dofs.
+        no_of_dofs_per_node : int
+            Number of dofs per node.
+
+        Returns
+        -------
+        sampled_mesh : instance of SampledMesh
+
+        '''
+        sampled_mesh = cls.__new__(cls)
+        sampled_mesh._set_arrays(np.array(element_ids, dtype=int),
+                                 np.array(node_ids, dtype=int),
+                                 np.array(nodes), list(connectivity),
+                                 list(ele_obj), np.array(V),
+                                 no_of_dofs_per_node)
+        return sampled_mesh
+
+    def _set_arrays(self, element_ids, node_ids, nodes, connectivity, ele_obj,
+                    V, no_of_dofs_per_node):
+        ndpn = no_of_dofs_per_node
+        self.element_ids = element_ids
+        self.node_ids = node_ids
+        self.nodes = nodes
+        self.connectivity = connectivity
+        self.ele_obj = ele_obj
+        self.V = V
+        self.no_of_dofs_per_node = ndpn
+        self.dofs = (node_ids[:,None]*ndpn + np.arange(ndpn)).ravel()
+        self.element_indices = [(nodes[:,None]*ndpn + np.arange(ndpn)).ravel()
+                                for nodes in connectivity]
+        self.nodes_voigt = nodes.reshape(-1)
+
+    @property
+    def no_of_elements(self):
+        return len(self.element_ids)
+
+    @property
+    def no_of_dofs(self):
+        return len(self.dofs)
+
+    def element_stacks(self):
+        '''
+        Return the nodal coordinates and the rows of V of the sampled elements
+        as contiguous 3-D arrays. All elements need the same number of dofs.
+
+        Returns
+        -------
+        X_stack : ndarray, shape (no_of_elements, ele_dofs)
+            Nodal coordinates of the elements in voigt notation.
+        V_stack : ndarray, shape (no_of_elements, ele_dofs, n_red)
+            Rows of V belonging to the element dofs.
+
+        '''
+        indices = np.array(self.element_indices, dtype=int).reshape(
+            (self.no_of_elements, -1))
+        return self.nodes_voigt[indices], self.V[indices, :]
+
+    def assemble_k_and_f_hyper(self, weights, u=None, t=0):
+        '''
+        Assemble the reduced stiffness matrix and internal force of an ECSW
+        system with the given element weights.
+
+        Parameters
+        ----------
+        weights : ndarray, shape (no_of_elements, )
+            Weights of the sampled elements.
+        u : ndarray, shape (n_red, ), optional
+            Reduced displacement. Default is `None`, i.e. zero displacement.
+        t : float, optional
+            Time. Default value 0.
+
+        Returns
+        -------
+        K : ndarray, shape (n_red, n_red)
+            Reduced stiffness matrix.
+        f_int : ndarray, shape (n_red, )
+            Reduced internal force vector.
+
+        '''
+        n_red = self.V.shape[1]
+        K_red = np.zeros((n_red, n_red))
+        f_red = np.zeros(n_red)
+        if u is None:
+            u = np.zeros(n_red)
+        u_local = self.V @ u
+
+        for i, indices in enumerate(self.element_indices):
+            X_ele = self.nodes_voigt[indices]
+            K_ele, f_ele = self.ele_obj[i].k_and_f_int(X_ele,
+                                                       u_local[indices], t)
+            V_ele = self.V[indices, :]
+            f_red += V_ele.T @ f_ele * weights[i]
+            K_red += V_ele.T @ K_ele @ V_ele * weights[i]
+        return K_red, f_red
+
+    def assemble_k_and_f_DEIM(self, proj_stack, X_stack, V_stack=None,
+                              u_red=None, t=0, symmetric=False):
+        '''
+        Assemble the reduced DEIM stiffness matrix and force vector of the
+        sampled elements. See Assembly.assemble_k_and_f_DEIM_stacked.
+        '''
+        return k_and_f_deim_stacked(self.ele_obj, proj_stack, X_stack,
+                                    V_stack, u_red, t, symmetric)
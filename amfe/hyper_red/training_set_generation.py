@@ -203,24 +203,30 @@ def krylov_force_subspace(M, K, b, omega=0, no_of_moments=3,
     sigmas = sp.linalg.svdvals(V)
 
     # mass-orthogonalization of V:
+    # The displacements U = inv(K) @ V are computed with one block solve and
+    # updated alongside V in the Gram-Schmid-process, as it is linear.
     if orth == 'impedance':
+        U = LU_object.solve(V).reshape(V.shape)
         # Gram-Schmid-process
         for i in range(no_of_moments*no_of_inputs):
-            v = V[:,i]
-            u = LU_object.solve(v)
-            v /= np.sqrt(u @ v)
-            V[:,i] = v
-            weights = u.T @ V[:,i+1:]
-            V[:,i+1:] -= v.reshape((-1,1)) * weights
+            scale = np.sqrt(U[:,i] @ V[:,i])
+            V[:,i] /= scale
+            U[:,i] /= scale
+            weights = U[:,i] @ V[:,i+1:]
+            V[:,i+1:] -= V[:,i:i+1] * weights
+            U[:,i+1:] -= U[:,i:i+1] * weights
     if orth == 'kinetic':
+        U = LU_object.solve(V).reshape(V.shape)
+        MU = M @ U
         for i in range(no_of_moments*no_of_inputs):
-            v = V[:,i]
-            u = LU_object.solve(v)
-            v /= np.sqrt(u.T @ M @ u)
-            V[:,i] = v
-            if i+1 < no_of_moments*no_of_inputs:
-                weights = u.T @ M @ LU_object.solve(V[:,i+1:])
-                V[:,i+1:] -= v.reshape((-1,1)) * weights
+            scale = np.sqrt(U[:,i] @ MU[:,i])
+            V[:,i] /= scale
+            U[:,i] /= scale
+            MU[:,i] /= scale
+            weights = MU[:,i] @ U[:,i+1:]
+            V[:,i+1:] -= V[:,i:i+1] * weights
+            U[:,i+1:] -= U[:,i:i+1] * weights
+            MU[:,i+1:] -= MU[:,i:i+1] * weights
 
 
     LU_object.clear()
@@ -256,14 +262,17 @@ def modal_force_subspace(M, K, no_of_modes=3, orth='euclidean'):
 #            V[:,i+1:] -= v.reshape((-1,1)) * weights
 
     elif orth == 'kinetic':
+        U = LU_object.solve(V).reshape(V.shape)
+        MU = M @ U
         for i in range(no_of_modes):
-            v = V[:,i]
-            u = LU_object.solve(v)
-            v /= np.sqrt(u.T @ M @ u)
-            V[:,i] = v
-            if i+1 < no_of_modes:
-                weights = u.T @ M @ LU_object.solve(V[:,i+1:])
-                V[:,i+1:] -= v.reshape((-1,1)) * weights
+            scale = np.sqrt(U[:,i] @ MU[:,i])
+            V[:,i] /= scale
+            U[:,i] /= scale
+            MU[:,i] /= scale
+            weights = MU[:,i] @ U[:,i+1:]
+            V[:,i+1:] -= V[:,i:i+1] * weights
+            U[:,i+1:] -= U[:,i:i+1] * weights
+            MU[:,i+1:] -= MU[:,i:i+1] * weights
 
     LU_object.clear()
     print('Modal force basis constructed with orth type {}.'.format(orth))
@@ -96,6 +96,61 @@ class HyperelasticMaterial():
         '''
         pass
 
+    def dC_SE(self, E, dE):
+        '''
+        Compute the directional derivative of the tangent moduli C_SE with
+        respect to the Green-Lagrange strain tensor in the direction dE.
+
+        The derivative is computed with the complex step method, i.e. the
+        material routine is evaluated once with the complex strain
+        E + i*h*dE. In contrast to finite differences, no subtraction is
+        involved and the result is exact up to machine precision.
+
+        Parameters
+        ----------
+        E : ndarray
+            Green-Lagrange strain tensor, shape: (3,3)
+        dE : ndarray
+            direction of the strain increment, shape: (3,3)
+
+        Returns
+        -------
+        dC_SE : ndarray
+            directional derivative of the tangent moduli, shape (6,6)
+        '''
+        h = 1E-30
+        S_Sv_and_C = getattr(self, '_S_Sv_and_C_python', self.S_Sv_and_C)
+        _, _, C_SE = S_Sv_and_C(E + 1j*h*dE)
+        return np.imag(C_SE) / h
+
+    def dC_SE_2d(self, E, dE):
+        '''
+        Compute the directional derivative of the tangent moduli C_SE with
+        respect to the Green-Lagrange strain tensor in the direction dE for
+        2D-Problems.
+
+        Parameters
+        ----------
+        E : ndarray
+            Green-Lagrange strain tensor, shape: (2,2)
+        dE : ndarray
+            direction of the strain increment, shape: (2,2)
+
+        Returns
+        -------
+        dC_SE : ndarray
+            directional derivative of the tangent moduli, shape (3,3)
+
+        See Also
+        --------
+        dC_SE
+        '''
+        h = 1E-30
+        S_Sv_and_C_2d = getattr(self, '_S_Sv_and_C_2d_python',
+                                self.S_Sv_and_C_2d)
+        _, _, C_SE = S_Sv_and_C_2d(E + 1j*h*dE)
+        return np.imag(C_SE) / h
+
 
 class KirchhoffMaterial(HyperelasticMaterial):
     r'''
@@ -198,6 +253,18 @@ class KirchhoffMaterial(HyperelasticMaterial):
         S = np.array([[S_v[0], S_v[2]], [S_v[2], S_v[1]]])
         return S, S_v, self.C_SE_2d
 
+    def dC_SE(self, E, dE):
+        '''
+        The tangent moduli of the Kirchhoff material are constant.
+        '''
+        return np.zeros((6,6))
+
+    def dC_SE_2d(self, E, dE):
+        '''
+        The tangent moduli of the Kirchhoff material are constant.
+        '''
+        return np.zeros((3,3))
+
 # For simplicity: rename KirchhoffMaterial
 LinearMaterial = KirchhoffMaterial
 
@@ -590,6 +657,11 @@ if use_fortran:
     def neo_hookean_S_Sv_and_C_2d(self, E):
         return f90_material.neo_hookean_s_sv_and_c_2d(E, self.mu, self.kappa)
 
+    # keep the python routines, as they are needed for the complex step
+    MooneyRivlin._S_Sv_and_C_python = MooneyRivlin.S_Sv_and_C
+    NeoHookean._S_Sv_and_C_python = NeoHookean.S_Sv_and_C
+    NeoHookean._S_Sv_and_C_2d_python = NeoHookean.S_Sv_and_C_2d
+
     # overloading the functions
     KirchhoffMaterial.S_Sv_and_C = kirchhoff_S_Sv_and_C
     KirchhoffMaterial.S_Sv_and_C_2d = kirchhoff_S_Sv_and_C_2d
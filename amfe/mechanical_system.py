@@ -415,6 +415,35 @@ class MechanicalSystem():
 
         return self.constrain_matrix(K_unconstr)
 
+    def dK_dv(self, u, v, t=0):
+        '''
+        Compute the directional derivative dK/du @ v of the stiffness matrix
+        of the mechanical system analytically on element level.
+
+        Parameters
+        ----------
+        u : ndarray or None
+            Displacement field in voigt notation. If None, the undeformed
+            configuration is used.
+        v : ndarray
+            Direction of the derivative in voigt notation
+        t : float, optional
+            Time
+
+        Returns
+        -------
+        dK : sp.sparse.sparse_matrix
+            directional derivative of the stiffness matrix with applied
+            constraints in sparse csr-format
+        '''
+        if u is None:
+            u = np.zeros(self.dirichlet_class.no_of_constrained_dofs)
+
+        dK_unconstr = self.assembly_class.assemble_dk_dv(
+            self.unconstrain_vec(u), self.unconstrain_vec(v), t)
+
+        return self.constrain_matrix(dK_unconstr)
+
     def D(self, u=None, t=0):
         '''
         Return the damping matrix of the mechanical system
@@ -663,6 +692,9 @@ class ReducedSystem(MechanicalSystem):
     The system runs without providing a V_basis when constructing the method
     only for the unreduced routines.
 
+    The reduced operators M_constr, D_constr and K0_red are dense and cached,
+    so the linear integrators run entirely on the dense projected operators.
+
 
     Attributes
     ----------
@@ -675,6 +707,13 @@ class ReducedSystem(MechanicalSystem):
         Stores the timeseries of the generalized coordinates (similar to u_output)
     assembly_type : {'indirect', 'direct'}
         Stores the type of assembly method how the reduced system is computed
+    M_constr : ndarray
+        Reduced mass matrix; computed once at the first evaluation of M
+    D_constr : ndarray or None
+        Reduced damping matrix
+    K0_red : ndarray
+        Reduced stiffness matrix of the undeformed configuration; computed
+        once at the first evaluation of K without displacement
     
     Examples
     --------
@@ -708,6 +747,7 @@ class ReducedSystem(MechanicalSystem):
         self.u_red_output = []
         self.V_unconstr = self.dirichlet_class.unconstrain_vec(V_basis)
         self.assembly_type = assembly
+        self.K0_red = None
 
     def K_and_f(self, u=None, t=0):
         if u is None:
@@ -728,7 +768,11 @@ class ReducedSystem(MechanicalSystem):
 
     def K(self, u=None, t=0):
         if u is None:
-            u = np.zeros(self.V.shape[1])
+            # the stiffness of the undeformed configuration is cached
+            if self.K0_red is None:
+                self.K0_red = ReducedSystem.K(self, np.zeros(self.V.shape[1]),
+                                              t)
+            return self.K0_red
 
         if self.assembly_type == 'direct':
             # this is really slow! So this is why the assembly is done diretly
@@ -743,8 +787,20 @@ class ReducedSystem(MechanicalSystem):
                              + 'is not valid.')
         return K
 
+    def dK_dv(self, u, v, t=0):
+        if u is None:
+            u = np.zeros(self.V.shape[1])
+        dK_raw = self.assembly_class.assemble_dk_dv(self.V_unconstr @ u,
+                                                    self.V_unconstr @ v, t)
+        return self.V_unconstr.T @ dK_raw @ self.V_unconstr
+
     def f_ext(self, u, du, t):
-        return self.V.T @ MechanicalSystem.f_ext(self, self.V @ u, du, t)
+        if '_f_ext_unconstr' in self.__dict__:
+            # the monkeypatched unconstrained external force is projected
+            if u is None:
+                u = np.zeros(self.V.shape[1])
+            return self.V.T @ MechanicalSystem.f_ext(self, self.V @ u, du, t)
+        return self.assembly_class.assemble_f_neumann_red(self.V_unconstr, u, t)
 
     def f_int(self, u, t=0):
 
@@ -763,21 +819,16 @@ class ReducedSystem(MechanicalSystem):
         return f_int
 
     def D(self, u=None, t=0):
-
-        if self.assembly_type == 'direct':
-            raise NotImplementedError('The direct method is note implemented yet for damping matrices')
-        elif self.assembly_type == 'indirect':
-            self.D_constr = self.V.T @ MechanicalSystem.D(self, self.V @ u, t) @ self.V
-        else:
-            raise ValueError('The given assembly type for a reduced system '
-                             + 'is not valid.')
-
+        # D_constr is already reduced by reduce_mechanical_system or by
+        # apply_rayleigh_damping
+        if self.D_constr is None:
+            return np.zeros((self.V.shape[1], self.V.shape[1]))
         return self.D_constr
 
     def M(self, u=None, t=0):
-        # Just a plain projection
-        # not so well but works...
-        self.M_constr = self.V.T @ MechanicalSystem.M(self, u, t) @ self.V
+        # the mass matrix is constant, so it is projected only once
+        if self.M_constr is None:
+            self.M_constr = self.V.T @ MechanicalSystem.M(self, None, t) @ self.V
         return self.M_constr
 
     def write_timestep(self, t, u):
@@ -895,6 +946,7 @@ def reduce_mechanical_system(mechanical_system, V, overwrite=False,
     reduced_sys.V_unconstr = reduced_sys.dirichlet_class.unconstrain_vec(V)
     reduced_sys.u_red_output = []
     reduced_sys.M_constr = None
+    reduced_sys.K0_red = None
     # reduce Rayleigh damping matrix
     if reduced_sys.D_constr is not None:
         reduced_sys.D_constr = V.T @ reduced_sys.D_constr @ V
@@ -4,9 +4,158 @@ Methods for the Quadratic Manifold approach.
 '''
 
 import numpy as np
+import scipy as sp
+from scipy import sparse
 
 
-__all__ = ['theta_orth_v']
+__all__ = ['theta_orth_v',
+           'pack_theta',
+           'unpack_theta',
+           'theta_dot',
+           'theta_quadratic',
+           'theta_transpose_dot',
+           ]
+
+
+def _theta_indices(no_of_packed):
+    '''
+    Return the number of modes n and the index arrays i, j of the upper
+    triangle (i <= j) for a packed Theta with no_of_packed columns.
+    '''
+    n = int(round((np.sqrt(8*no_of_packed + 1) - 1) / 2))
+    if n*(n+1)//2 != no_of_packed:
+        raise ValueError('The packed Theta has {} columns,'.format(no_of_packed)
+                         + ' which is not of the form n*(n+1)/2.')
+    i, j = np.triu_indices(n)
+    return n, i, j
+
+
+def pack_theta(Theta, check_symmetry=True):
+    '''
+    Pack the symmetric third order tensor Theta into its upper triangular
+    part.
+
+    Parameters
+    ----------
+    Theta : ndarray, shape (n_full, n, n)
+        Third order tensor which is symmetric in the last two indices
+    check_symmetry : bool, optional
+        flag for checking the symmetry of Theta. Default value: True.
+
+    Returns
+    -------
+    Theta_packed : ndarray, shape (n_full, n*(n+1)/2)
+        packed tensor with Theta_packed[:,k] = Theta[:,i,j] for the k-th pair
+        (i, j) of np.triu_indices(n), i.e. (0,0), (0,1), ..., (0,n-1), (1,1),
+        etc.
+
+    '''
+    n_full, n, m = Theta.shape
+    if n != m:
+        raise ValueError('Theta is not square in the last two indices.')
+    if check_symmetry and not np.allclose(Theta, Theta.transpose(0,2,1)):
+        raise ValueError('Theta is not symmetric in the last two indices.')
+    i, j = np.triu_indices(n)
+    return Theta[:,i,j].copy()
+
+
+def unpack_theta(Theta):
+    '''
+    Unpack the packed tensor Theta to the full third order tensor.
+
+    Parameters
+    ----------
+    Theta : ndarray, shape (n_full, n*(n+1)/2)
+        packed tensor as returned by pack_theta
+
+    Returns
+    -------
+    Theta_full : ndarray, shape (n_full, n, n)
+        third order tensor symmetric in the last two indices
+
+    '''
+    n, i, j = _theta_indices(Theta.shape[1])
+    Theta_full = np.zeros((Theta.shape[0], n, n))
+    Theta_full[:,i,j] = Theta
+    Theta_full[:,j,i] = Theta
+    return Theta_full
+
+
+def theta_dot(Theta, u):
+    '''
+    Contraction Theta @ u of the packed tensor Theta with the vector u.
+
+    Parameters
+    ----------
+    Theta : ndarray, shape (n_full, n*(n+1)/2)
+        packed tensor
+    u : ndarray, shape (n,)
+        reduced vector
+
+    Returns
+    -------
+    Theta_u : ndarray, shape (n_full, n)
+        matrix with Theta_u[:,i] = sum_j Theta[:,i,j] u[j]
+
+    '''
+    no_of_packed = Theta.shape[1]
+    n, i, j = _theta_indices(no_of_packed)
+    k = np.arange(no_of_packed)
+    off_diag = i != j
+    # sparse scatter matrix A with Theta_u = Theta @ A
+    rows = np.concatenate((k, k[off_diag]))
+    cols = np.concatenate((i, j[off_diag]))
+    vals = np.concatenate((u[j], u[i[off_diag]]))
+    A = sp.sparse.csc_matrix((vals, (rows, cols)), shape=(no_of_packed, n))
+    return (A.T @ Theta.T).T
+
+
+def theta_quadratic(Theta, u):
+    '''
+    Quadratic form (Theta @ u) @ u of the packed tensor Theta.
+
+    Parameters
+    ----------
+    Theta : ndarray, shape (n_full, n*(n+1)/2)
+        packed tensor
+    u : ndarray, shape (n,)
+        reduced vector
+
+    Returns
+    -------
+    Theta_u_u : ndarray, shape (n_full,)
+        vector sum_ij Theta[:,i,j] u[i] u[j]
+
+    '''
+    n, i, j = _theta_indices(Theta.shape[1])
+    w = u[i]*u[j]
+    w[i != j] *= 2
+    return Theta @ w
+
+
+def theta_transpose_dot(Theta, f):
+    '''
+    Contraction Theta.T @ f of the packed tensor Theta with the full vector f.
+
+    Parameters
+    ----------
+    Theta : ndarray, shape (n_full, n*(n+1)/2)
+        packed tensor
+    f : ndarray, shape (n_full,)
+        full vector
+
+    Returns
+    -------
+    Theta_T_f : ndarray, shape (n, n)
+        symmetric matrix with Theta_T_f[i,j] = Theta[:,i,j] @ f
+
+    '''
+    n, i, j = _theta_indices(Theta.shape[1])
+    g = Theta.T @ f
+    Theta_T_f = np.zeros((n, n))
+    Theta_T_f[i,j] = g
+    Theta_T_f[j,i] = g
+    return Theta_T_f
 
 
 def theta_orth_v(Theta, V, M, overwrite=False):
@@ -17,7 +166,8 @@ def theta_orth_v(Theta, V, M, overwrite=False):
     Parameters
     ----------
     Theta : ndarray
-        Third order Tensor describing the quadratic part of the basis
+        Third order Tensor describing the quadratic part of the basis. Can be
+        full (n_full, n, n) or packed (n_full, n*(n+1)/2).
     V : ndarray
         Linear Basis
     M : ndarray or scipy.sparse matrix
@@ -41,6 +191,10 @@ def theta_orth_v(Theta, V, M, overwrite=False):
         Theta_ret = Theta
     else:
         Theta_ret = Theta.copy()
+    if Theta_ret.ndim == 2:
+        # packed tensor: all columns are orthogonalized in one go
+        Theta_ret -= V @ (V_M_space.T @ Theta_ret)
+        return Theta_ret
     # inner product of Theta[:,j,k] with V[:,l] in the M-norm
     inner_prod = np.einsum('ijk, il -> jkl', Theta, V_M_space)
     for j in range(no_of_modes):
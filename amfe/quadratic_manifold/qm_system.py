@@ -10,6 +10,8 @@ import copy
 import numpy as np
 
 from ..mechanical_system import MechanicalSystem, ReducedSystem
+from .qm_methods import pack_theta, unpack_theta, theta_dot, \
+    theta_quadratic, theta_transpose_dot, _theta_indices
 
 __all__ = ['QMSystem',
            'reduce_mechanical_system_qm',
@@ -20,6 +22,26 @@ class QMSystem(MechanicalSystem):
     '''
     Quadratic Manifold Finite Element system.
 
+    The quadratic tensor Theta is stored packed, i.e. only the upper triangle
+    of the last two indices is stored as array of shape
+    (n_full, n_red*(n_red+1)/2). See pack_theta for the layout.
+
+    As the mass matrix is constant, all inertia terms are polynomials in the
+    reduced coordinates. Their coefficient tensors are computed once by
+    precompute_inertia_tensors, so that the inertia terms are evaluated
+    without full-dimensional operations:
+
+    - M_VV[a,b] = V[:,a] @ M @ V[:,b]
+    - M_TV[i,j,a] = Theta[:,i,j] @ M @ V[:,a]
+    - M_TT[p,q] = Theta[:,p] @ M @ Theta[:,q]
+
+    with the packed index pairs p, q of Theta, i.e. M_TT is stored packed in
+    both index pairs as array of shape (n_red*(n_red+1)/2, n_red*(n_red+1)/2).
+
+    The external force of the Neumann boundary conditions is evaluated on the
+    dofs of the skin elements only with the rows V_neumann and Theta_neumann
+    of the bases, which are extracted by precompute_neumann_basis.
+
     '''
 
     def __init__(self, **kwargs):
@@ -28,16 +50,77 @@ class QMSystem(MechanicalSystem):
         self.Theta = None
         self.no_of_red_dofs = None
         self.u_red_output = []
+        self.M_VV = None
+        self.M_TV = None
+        self.M_TT = None
+        self.V_neumann = None
+        self.Theta_neumann = None
+        self.neumann_local_indices = None
+
+    def precompute_neumann_basis(self):
+        '''
+        Extract the unconstrained rows of V and Theta belonging to the dofs of
+        the Neumann skin elements.
+
+        It is carried out automatically at the first evaluation of the
+        external force and has to be repeated, if Neumann boundary conditions
+        are applied afterwards.
+        '''
+        neumann_indices = self.assembly_class.neumann_indices
+        if neumann_indices:
+            dofs = np.unique(np.concatenate(neumann_indices))
+        else:
+            dofs = np.zeros(0, dtype=int)
+        self.V_neumann = self.unconstrain_vec(self.V)[dofs]
+        self.Theta_neumann = self.unconstrain_vec(self.Theta)[dofs]
+        self.neumann_local_indices = [np.searchsorted(dofs, indices)
+                                      for indices in neumann_indices]
+        return
+
+    def precompute_inertia_tensors(self):
+        '''
+        Compute the reduced tensors M_VV, M_TV and M_TT of the inertia terms.
+
+        This is the only step, where the full mass matrix is touched. It is
+        carried out automatically at the first evaluation of the mass matrix
+        or the residual.
+        '''
+        if self.M_constr is None:
+            MechanicalSystem.M(self)
+        n, i, j = _theta_indices(self.Theta.shape[1])
+        M_Theta = self.M_constr @ self.Theta
+        M_VT_packed = self.V.T @ M_Theta
+
+        self.M_VV = self.V.T @ self.M_constr @ self.V
+        self.M_TV = np.zeros((n, n, n))
+        self.M_TV[i,j,:] = M_VT_packed.T
+        self.M_TV[j,i,:] = M_VT_packed.T
+        self.M_TT = self.Theta.T @ M_Theta
+        return
+
+    def _theta_M_P(self, u):
+        '''
+        Return the tensor Q[i,j,a] = Theta[:,i,j] @ M @ P[:,a] with the
+        nonlinear projector P = V + Theta @ u.
+        '''
+        if self.M_VV is None:
+            self.precompute_inertia_tensors()
+        # M_TT_u[k,p] = sum_l M_TT[p,(k,l)] u[l] unpacked in p
+        M_TT_u = theta_dot(self.M_TT, u)
+        return self.M_TV + unpack_theta(M_TT_u.T).transpose(1,2,0)
+
+    def _P_M_P(self, u, Q):
+        '''
+        Return the reduced mass matrix P.T @ M @ P for the tensor Q of u.
+        '''
+        return self.M_VV + np.einsum('bka, k -> ab', self.M_TV, u) \
+               + np.einsum('akb, k -> ab', Q, u)
 
     def M(self, u=None, t=0):
         # checks, if u is there and M is already computed
         if u is None:
             u = np.zeros(self.no_of_red_dofs)
-        if self.M_constr is None:
-            MechanicalSystem.M(self)
-
-        P = self.V + self.Theta @ u
-        M_red = P.T @ self.M_constr @ P
+        M_red = self._P_M_P(u, self._theta_M_P(u))
         return M_red
 
     def K_and_f(self, u=None, t=0):
@@ -50,12 +133,11 @@ class QMSystem(MechanicalSystem):
         '''
         if u is None:
             u = np.zeros(self.no_of_red_dofs)
-        theta_u = self.Theta @ u
-        u_full = (self.V + 1/2*theta_u) @ u
-        P = self.V + theta_u
+        u_full = self.V @ u + 1/2*theta_quadratic(self.Theta, u)
+        P = self.V + theta_dot(self.Theta, u)
         K_unreduced, f_unreduced = MechanicalSystem.K_and_f(self, u_full, t)
         K1 = P.T @ K_unreduced @ P
-        K2 = self.Theta.T @ f_unreduced
+        K2 = theta_transpose_dot(self.Theta, f_unreduced)
         K = K1 + K2
         f = P.T @ f_unreduced
         return K, f
@@ -66,51 +148,68 @@ class QMSystem(MechanicalSystem):
         iteration matrix etc.
 
         '''
-        # checking out that constant unreduced M is built
-        if self.M_constr is None:
-            MechanicalSystem.M(self)
-        M_unreduced = self.M_constr
-
-        theta = self.Theta
-        theta_u = theta @ u
-        u_full = (self.V + 1/2*theta_u) @ u
-
-        K_unreduced, f_unreduced = MechanicalSystem.K_and_f(self, u_full, t)
-        f_ext_unred = MechanicalSystem.f_ext(self, u_full, None, t)
-        # nonlinear projector P
-        P = self.V + theta_u
+        # reduced elastic terms P.T @ K @ P + Theta.T @ f_int and P.T @ f_int
+        K_int, f_int = self.K_and_f(u, t)
+        f_ext, K_ext = self._f_ext_and_K_ext(u, t)
+        # the inertia terms are evaluated with the precomputed tensors;
+        # Q[i,j,a] = theta_ij @ M @ P_a
+        Q = self._theta_M_P(u)
+        M = self._P_M_P(u, Q)
 
         # computing the residual
-        res_accel = M_unreduced @ (P @ ddu)
-        res_gyro = M_unreduced @ (theta @ du) @ du
-        res_full = res_accel + res_gyro + f_unreduced - f_ext_unred
+        res_accel = M @ ddu
+        res_gyro = np.einsum('ija, i, j -> a', Q, du, du)
         # the different contributions to stiffness
-        K1 = theta.T @ res_full
-        K2 = P.T @ M_unreduced @ (theta @ ddu)
-        K3 = P.T @ K_unreduced @ P
-        K = K1 + K2 + K3
-        # gyroscopic matrix and reduced mass matrix
-        G = P.T @ M_unreduced @ (2*theta @ du)
-        M = P.T @ M_unreduced @ P
-
-        res = P.T @ res_full
-        f_ext = P.T @ f_ext_unred
+        K1 = np.einsum('ija, a -> ij', Q, ddu) \
+             + unpack_theta(theta_quadratic(self.M_TT, du)[None,:])[0]
+        K2 = np.einsum('iba, b -> ai', Q, ddu)
+        K = K1 + K2 + K_int - K_ext
+        # gyroscopic matrix
+        G = 2*np.einsum('iba, b -> ai', Q, du)
+
+        res = res_accel + res_gyro + f_int - f_ext
         S = 1/(dt**2 * beta) * M + gamma/(dt*beta) * G + K
         return S, res, f_ext
 
+    def _f_ext_and_K_ext(self, u, t):
+        '''
+        Return the reduced external force P.T @ f_ext and its contribution
+        Theta.T @ f_ext to the tangential stiffness matrix.
+
+        The displacements are lifted on the dofs of the Neumann skin elements
+        only.
+        '''
+        if '_f_ext_unconstr' in self.__dict__:
+            # the monkeypatched unconstrained external force needs the full
+            # displacement
+            u_full = self.V @ u + 1/2*theta_quadratic(self.Theta, u)
+            P = self.V + theta_dot(self.Theta, u)
+            f_ext_unred = MechanicalSystem.f_ext(self, u_full, None, t)
+            return P.T @ f_ext_unred, theta_transpose_dot(self.Theta,
+                                                          f_ext_unred)
+        if self.V_neumann is None:
+            self.precompute_neumann_basis()
+        u_neumann = self.V_neumann @ u \
+                    + 1/2*theta_quadratic(self.Theta_neumann, u)
+        P_neumann = self.V_neumann + theta_dot(self.Theta_neumann, u)
+        f_neumann = np.zeros(len(u_neumann))
+        nodes_voigt = self.assembly_class.nodes_voigt
+        for i, indices in enumerate(self.assembly_class.neumann_indices):
+            local = self.neumann_local_indices[i]
+            __, f = self.mesh_class.neumann_obj[i].k_and_f_int(
+                nodes_voigt[indices], u_neumann[local], t)
+            f_neumann[local] += f
+        return P_neumann.T @ f_neumann, \
+               theta_transpose_dot(self.Theta_neumann, f_neumann)
+
     def f_ext(self, u, du, t):
         '''
         Return the reduced external force. The velocity du is by now ignored.
         '''
-        theta_u = self.Theta @ u
-        u_full = (self.V + 1/2*theta_u) @ u
-        P = self.V + theta_u
-        f_ext_unred = MechanicalSystem.f_ext(self, u_full, None, t)
-        f_ext = P.T @ f_ext_unred
-        return f_ext
+        return self._f_ext_and_K_ext(u, t)[0]
 
     def write_timestep(self, t, u):
-        u_full = self.V @ u + (self.Theta @ u) @ u * 1/2
+        u_full = self.V @ u + theta_quadratic(self.Theta, u) * 1/2
         MechanicalSystem.write_timestep(self, t, u_full)
         # own reduced output
         self.u_red_output.append(u.copy())
@@ -123,9 +222,10 @@ class QMSystem(MechanicalSystem):
         ReducedSystem.export_paraview(self, filename, field_list)
         filename_no_ext, _ = os.path.splitext(filename)
 
-        # add Theta to the hdf5 file
+        # add the packed Theta to the hdf5 file
         with h5py.File(filename_no_ext + '.hdf5', 'r+') as f:
-            f.create_dataset('reduction/Theta', data=self.Theta)
+            dset = f.create_dataset('reduction/Theta', data=self.Theta)
+            dset.attrs['packed'] = True
 
         return
 
@@ -143,7 +243,8 @@ def reduce_mechanical_system_qm(mechanical_system, V, Theta, overwrite=False):
         Reduction Basis for the reduced system
     Theta : ndarray
         Quadratic tensor for the Quadratic manifold. Has to be symmetric with
-        respect to the last two indices and is of shape (n_full, n_red, n_red).
+        respect to the last two indices and is of shape (n_full, n_red, n_red)
+        or already packed with shape (n_full, n_red*(n_red+1)/2).
     overwrite : bool, optional
         switch, if mechanical system should be overwritten (is less memory
         intensive for large systems) or not.
@@ -158,12 +259,16 @@ def reduce_mechanical_system_qm(mechanical_system, V, Theta, overwrite=False):
     -------
 
     '''
+    no_of_red_dofs = V.shape[-1]
     # consistency check
-    assert V.shape[-1] == Theta.shape[-1]
-    assert Theta.shape[1] == Theta.shape[2]
     assert Theta.shape[0] == V.shape[0]
+    if Theta.ndim == 3:
+        assert Theta.shape[1] == Theta.shape[2] == no_of_red_dofs
+        Theta_packed = pack_theta(Theta)
+    else:
+        assert Theta.shape[1] == no_of_red_dofs*(no_of_red_dofs+1)//2
+        Theta_packed = Theta.copy()
 
-    no_of_red_dofs = V.shape[-1]
     if overwrite:
         reduced_sys = mechanical_system
     else:
@@ -171,7 +276,7 @@ def reduce_mechanical_system_qm(mechanical_system, V, Theta, overwrite=False):
 
     reduced_sys.__class__ = QMSystem
     reduced_sys.V = V.copy()
-    reduced_sys.Theta = Theta.copy()
+    reduced_sys.Theta = Theta_packed
 
     # reduce Rayleigh damping matrix
     if reduced_sys.D_constr is not None:
@@ -180,4 +285,8 @@ def reduce_mechanical_system_qm(mechanical_system, V, Theta, overwrite=False):
     # define internal variables
     reduced_sys.u_red_output = []
     reduced_sys.no_of_red_dofs = no_of_red_dofs
+
+    # offline stage of the inertia terms and the external force
+    reduced_sys.precompute_inertia_tensors()
+    reduced_sys.precompute_neumann_basis()
     return reduced_sys
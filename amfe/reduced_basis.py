@@ -2,17 +2,29 @@
 Reduced basis methods...
 '''
 
+import multiprocessing as mp
+import h5py
 import numpy as np
 import scipy as sp
 from scipy import linalg
+from scipy.sparse import linalg as sparse_linalg
 
-from .solver import solve_sparse, SpSolve
+from .quadratic_manifold.qm_methods import pack_theta
+from .solver import solve_sparse, SpSolve, use_pardiso, mtypes
+from .num_exp_toolbox import apply_async
+
+try:
+    from pyMKL import pardisoSolver
+except:
+    pass
 
 __all__ = ['krylov_subspace',
            'compute_modes_pardiso',
+           'track_vibration_modes',
            'vibration_modes',
            'craig_bampton',
            'pod',
+           'stiffness_derivatives',
            'modal_derivatives',
            'static_derivatives',
            'augment_with_derivatives',
@@ -87,11 +99,135 @@ def krylov_subspace(M, K, b, omega=0, no_of_moments=3, mass_orth=True):
     return V
 
 
+def _m_orthonormalize(S, M, X_lock=None, tol=1E-10):
+    '''
+    M-orthonormalize the columns of S against the columns of X_lock and among
+    each other. Linearly dependent directions are removed.
+
+    Parameters
+    ----------
+    S : ndarray, shape(ndim, m)
+        block of vectors
+    M : sparse matrix
+        mass matrix defining the inner product
+    X_lock : ndarray, shape(ndim, k), optional
+        M-orthonormal vectors, which S is orthogonalized against
+    tol : float, optional
+        relative tolerance for the removal of linearly dependent directions
+
+    Returns
+    -------
+    S : ndarray, shape(ndim, m_new)
+        M-orthonormal block with m_new <= m
+
+    '''
+    # two passes for numerical stability (twice is enough)
+    for i in range(2):
+        norms = np.sqrt(np.einsum('ij, ij->j', S, M @ S))
+        if X_lock is not None and X_lock.shape[1] > 0:
+            S = S - X_lock @ (X_lock.T @ (M @ S))
+        # scale every column separately, as the remainders of the
+        # projection may be small but nevertheless carry information
+        norms_proj = np.sqrt(np.einsum('ij, ij->j', S, M @ S))
+        keep = norms_proj > 1E-14 * norms
+        S = S[:, keep] / norms_proj[keep]
+        if S.shape[1] == 0:
+            break
+        w, U = linalg.eigh(S.T @ (M @ S))
+        keep = w > tol * w.max()
+        S = S @ (U[:, keep] / np.sqrt(w[keep]))
+    return S
+
+
+def _block_lanczos(K, M, K_mat, n, niter_max=40, rtol=1E-14,
+                   block_size=None, krylov_depth=3, V0=None):
+    '''
+    Restarted block Lanczos iteration in shift-invert mode with locking. See
+    compute_modes_pardiso for the description of the parameters.
+
+    Parameters
+    ----------
+    K : sparse matrix
+        stiffness matrix
+    M : sparse matrix
+        mass matrix
+    K_mat : SpSolve
+        factorization of K
+
+    Returns
+    -------
+    lambda_ : ndarray, shape(n)
+        eigenvalues in ascending order
+    V : ndarray, shape(ndim, n)
+        M-normalized eigenvectors
+    n_iter : int
+        index of the last restart
+
+    '''
+    k_diag = K.diagonal().sum()
+    n_dim = K.shape[0]
+    if block_size is None:
+        block_size = n + min(n, 10)
+    block_size = min(block_size, n_dim // krylov_depth)
+
+    X_lock = np.zeros((n_dim, 0))
+    lambda_lock = np.zeros(0)
+    if V0 is None:
+        Y = np.random.rand(n_dim, block_size)
+    else:
+        Y = np.concatenate((V0[:, :block_size], np.random.rand(
+            n_dim, max(block_size - V0.shape[1], 0))), axis=1)
+    for n_iter in range(niter_max):
+        print('Lanczos iteration # {}. '.format(n_iter), end='')
+        # Krylov sequence of the iterated block; every new block is
+        # M-orthonormalized against the locked modes and the previous blocks
+        W = _m_orthonormalize(Y, M, X_lock)
+        S = W
+        for j in range(krylov_depth - 1):
+            W = K_mat.solve(M @ W).reshape((n_dim, -1))
+            W = _m_orthonormalize(W, M, np.concatenate((X_lock, S), axis=1))
+            S = np.concatenate((S, W), axis=1)
+
+        # Rayleigh-Ritz step; S is M-orthonormal
+        lambda_r, Phi_r = linalg.eigh(S.T @ (K @ S))
+        n_active = min(block_size, S.shape[1])
+        X = S @ Phi_r[:, :n_active]
+        lambda_r = lambda_r[:n_active]
+
+        # block residual check
+        R = K @ X - (M @ X) * lambda_r
+        residual = np.sum(abs(R), axis=0) / k_diag
+
+        # lock the lowest converged modes
+        n_missing = n - X_lock.shape[1]
+        not_converged = np.nonzero(residual[:n_missing] >= rtol)[0]
+        n_conv = not_converged[0] if len(not_converged) else n_missing
+        X_lock = np.concatenate((X_lock, X[:, :n_conv]), axis=1)
+        lambda_lock = np.append(lambda_lock, lambda_r[:n_conv])
+        print('Res max: {:.2e}, locked modes: {}'.format(
+            np.max(residual[:n_missing]), X_lock.shape[1]))
+        if X_lock.shape[1] >= n:
+            break
+        # refill the block with the next Ritz vectors to keep its size
+        Y = S @ Phi_r[:, n_conv:n_conv+block_size]
+
+    if X_lock.shape[1] < n:
+        print('No convergence gained in the given iteration steps.')
+        X_lock = np.concatenate((X_lock, X[:, n_conv:n_conv+n_missing]),
+                                axis=1)
+        lambda_lock = np.append(lambda_lock, lambda_r[n_conv:n_conv+n_missing])
+
+    order = np.argsort(lambda_lock)[:n]
+    return lambda_lock[order], X_lock[:, order], n_iter
+
+
 def compute_modes_pardiso(mechanical_system, n=10, u_eq=None,
-                           save=False, niter_max=40,
-                           rtol=1E-14):
+                          save=False, niter_max=40,
+                          rtol=1E-14, block_size=None, krylov_depth=3,
+                          V0=None):
     '''
-    Make a modal analysis using a naive Lanczos iteration.
+    Make a modal analysis using a restarted block Lanczos iteration in
+    shift-invert mode.
 
     Parameters
     ----------
@@ -106,7 +242,20 @@ def compute_modes_pardiso(mechanical_system, n=10, u_eq=None,
         flat setting, if the modes should be saved in mechanical system.
         Default value: False
     niter_max : int, optional
-        Maximum number of Lanzcos iterations
+        Maximum number of restarts of the block Lanczos iteration
+    rtol : float, optional
+        Tolerance for the residual of the modes, which is
+        ``sum(abs(K @ phi - lambda * M @ phi)) / trace(K)``.
+    block_size : int, optional
+        Number of Ritz vectors which are iterated. A few more vectors than
+        modes accelerate the convergence. Default value: n + min(n, 10).
+    krylov_depth : int, optional
+        Number of blocks of the Krylov sequence built between two restarts.
+        The size of the search space is block_size * krylov_depth. Default
+        value: 3.
+    V0 : ndarray, shape(ndim, m), optional
+        Start vectors of the iteration, e.g. the modes of a similar system.
+        If None or m < block_size, (further) random vectors are used.
 
     Returns
     -------
@@ -118,58 +267,43 @@ def compute_modes_pardiso(mechanical_system, n=10, u_eq=None,
     Note
     ----
     In comparison to the modal_analysis method, this method uses the Pardiso
-    solver if available and a naive Lanczos iteration. The modal_analysis method
-    uses the arpack solver which is more accurate but takes also much longer for
-    large systems, since the factorization is very inefficient by using superLU.
+    solver if available and a block Lanczos iteration. The modal_analysis
+    method uses the arpack solver which is more accurate but takes also much
+    longer for large systems, since the factorization is very inefficient by
+    using superLU.
+
+    The stiffness matrix is factorized once. In every restart, a Krylov
+    sequence of the operator inv(K) @ M is built from the current Ritz
+    vectors, M-orthonormalized and used for a Rayleigh-Ritz step. Converged
+    modes are locked, i.e. they are removed from the iterated block and the
+    search space is kept M-orthogonal to them. The iterated block keeps its
+    size, so the buffer of not wanted Ritz vectors grows with every locked
+    mode. Hence, the memory is bounded by (n + block_size * krylov_depth)
+    vectors.
+
+    References
+    ----------
+    .. [1]  R. G. Grimes, J. G. Lewis and H. D. Simon: A shifted block Lanczos
+            algorithm for solving sparse symmetric generalized eigenproblems.
+            SIAM Journal on Matrix Analysis and Applications, 15(1):228-272,
+            1994.
+
     '''
     K = mechanical_system.K(u=u_eq)
     M = mechanical_system.M(u=u_eq)
-    k_diag = K.diagonal().sum()
 
     # factorizing
     K_mat = SpSolve(K)
-
-    # build up Krylov sequence
-    n_rand = n
-    n_dim = K.shape[0]
-
-    residual = np.zeros(n)
-    b = np.random.rand(n_dim, n_rand)
-    b, _ = sp.linalg.qr(b, mode='economic')
-    krylov_subspace = b
-    for n_iter in range(niter_max):
-        print('Lanczos iteration # {}. '.format(n_iter), end='')
-        new_directions = K_mat.solve(M @ b)
-        krylov_subspace = np.concatenate((krylov_subspace, new_directions), axis=1)
-        krylov_subspace, _ = sp.linalg.qr(krylov_subspace, mode='economic')
-        b = krylov_subspace[:,-n_rand:]
-
-        # check the modes
-        K_red = krylov_subspace.T @ K @ krylov_subspace
-        M_red = krylov_subspace.T @ M @ krylov_subspace
-        lambda_r, Phi_r = sp.linalg.eigh(K_red, M_red, overwrite_a=True,
-                                         overwrite_b=True)
-        Phi = krylov_subspace @ Phi_r[:,:n]
-
-        # check the tolerance to be below machine epsilon with some buffer...
-        for i in range(n):
-            residual[i] = np.sum(abs((-lambda_r[i] * M + K) @ Phi[:,i])) / k_diag
-
-        print('Res max: {:.2e}'.format(np.max(residual)))
-        if np.max(residual) < rtol:
-            break
-
-    if n_iter-1 == niter_max:
-        print('No convergence gained in the given iteration steps.')
-
+    lambda_r, V, n_iter = _block_lanczos(K, M, K_mat, n, niter_max=niter_max,
+                                         rtol=rtol, block_size=block_size,
+                                         krylov_depth=krylov_depth, V0=V0)
+    K_mat.clear()
     print('The Lanczos solver took ' +
           '{} iterations to solve for {} eigenvectors.'.format(n_iter+1, n))
-    omega = np.sqrt(abs(lambda_r[:n]))
-    V = Phi[:,:n]
-    K_mat.clear()
+    omega = np.sqrt(abs(lambda_r))
     # Little bit of sick hack: The negative sign is transferred to the
     # eigenfrequencies
-    omega[lambda_r[:n] < 0] *= -1
+    omega[lambda_r < 0] *= -1
 
     if save:
         mechanical_system.clear_timesteps()
@@ -181,7 +315,95 @@ def compute_modes_pardiso(mechanical_system, n=10, u_eq=None,
     return omega, V
 
 
-def vibration_modes(mechanical_system, n=10, save=False):
+def track_vibration_modes(mechanical_system, u_eq_list, n=10, niter_max=40,
+                          rtol=1E-14, block_size=None, krylov_depth=3):
+    '''
+    Compute the vibration modes around a sequence of equilibrium positions,
+    e.g. along a static load path, and track them by the modal assurance
+    criterion.
+
+    Parameters
+    ----------
+    mechanical_system : instance of amfe.MechanicalSystem
+        Mechanical system
+    u_eq_list : list of ndarrays or ndarray, shape(no_of_states, ndim)
+        equilibrium positions in constrained coordinates
+    n : int, optional
+        number of modes to be computed. Default value: 10.
+    niter_max : int, optional
+        Maximum number of restarts of the block Lanczos iteration per state.
+    rtol : float, optional
+        Tolerance for the residual of the modes; see compute_modes_pardiso.
+    block_size : int, optional
+        Number of iterated Ritz vectors; see compute_modes_pardiso.
+    krylov_depth : int, optional
+        Number of Krylov blocks per restart; see compute_modes_pardiso.
+
+    Returns
+    -------
+    omega : ndarray, shape(no_of_states, n)
+        eigenfrequencies; omega[k,i] belongs to the i-th tracked mode in the
+        k-th state.
+    Phi : ndarray, shape(no_of_states, ndim, n)
+        vibration modes; the modes are ordered and their signs are chosen
+        such, that Phi[k,:,i] corresponds to Phi[k-1,:,i].
+    mac : ndarray, shape(no_of_states, n)
+        MAC-value of every mode with the mode it is assigned to in the
+        previous state. The first row is one.
+
+    Notes
+    -----
+    The eigensolution of every state is started from the modes of the
+    previous state (warm start), so that only a few iterations are necessary
+    for small changes between the states. The fill reducing ordering of the
+    first factorization is reused for all states, as the sparsity pattern of
+    the stiffness matrix does not change.
+
+    '''
+    from scipy.optimize import linear_sum_assignment
+    from .structural_dynamics import modal_assurance
+
+    no_of_states = len(u_eq_list)
+    omega = np.zeros((no_of_states, n))
+    mac = np.ones((no_of_states, n))
+    Phi = None
+    ordering = None
+    V_prev = None
+    for k, u_eq in enumerate(u_eq_list):
+        print('Modal analysis of state # {}.'.format(k))
+        K = mechanical_system.K(u=u_eq)
+        M = mechanical_system.M(u=u_eq)
+        K_mat = SpSolve(K, ordering=ordering)
+        ordering = K_mat.ordering
+        lambda_, V, n_iter = _block_lanczos(K, M, K_mat, n,
+                                            niter_max=niter_max, rtol=rtol,
+                                            block_size=block_size,
+                                            krylov_depth=krylov_depth,
+                                            V0=V_prev)
+        K_mat.clear()
+        print('State # {} took {} iterations.'.format(k, n_iter+1))
+        if Phi is None:
+            Phi = np.zeros((no_of_states, V.shape[0], n))
+        if V_prev is not None:
+            # assignment of the modes maximizing the sum of the MAC-values
+            mac_k = modal_assurance(V_prev, V)
+            rows, cols = linear_sum_assignment(-mac_k)
+            lambda_, V = lambda_[cols], V[:, cols]
+            mac[k] = mac_k[rows, cols]
+            signs = np.sign(np.einsum('ij, ij->j', V_prev, V))
+            signs[signs == 0] = 1
+            V = V * signs
+        omega_k = np.sqrt(abs(lambda_))
+        omega_k[lambda_ < 0] *= -1
+        omega[k] = omega_k
+        Phi[k] = V
+        V_prev = V
+
+    return omega, Phi, mac
+
+
+def vibration_modes(mechanical_system, n=10, save=False,
+                    frequency_range=None, no_of_slices=4, no_of_processes=1):
     '''
     Compute the n first vibration modes of the given mechanical system using
     a power iteration method.
@@ -191,10 +413,19 @@ def vibration_modes(mechanical_system, n=10, save=False):
     mechanical_system : instance of MechanicalSystem
         Mechanical system to be analyzed.
     n : int
-        number of modes to be computed.
+        number of modes to be computed. Not used, if frequency_range is
+        given.
     save : bool
         Flag for saving the modes in mechanical_system for ParaView export.
         Default: False.
+    frequency_range : tuple, optional
+        (omega_min, omega_max) in rad/s. If given, all modes with
+        eigenfrequencies in this band are computed by spectrum slicing.
+        Default: None.
+    no_of_slices : int, optional
+        number of slices the frequency band is split into. Default: 4.
+    no_of_processes : int, optional
+        number of worker processes for the slices. Default: 1.
 
     Returns
     -------
@@ -218,12 +449,21 @@ def vibration_modes(mechanical_system, n=10, save=False):
     If the squared eigenvalue omega**2 is negative, as it might happen due to
     round-off errors with rigid body modes, the negative sign is traveled to
     the eigenfrequency omega, though this makes physically no sense...
+
+    For the spectrum slicing, the number of eigenvalues in every slice is
+    counted with the inertia of K - sigma*M at the slice boundaries
+    (Sylvester's law of inertia). Then, the modes of every slice are computed
+    with a shift in the center of the slice, until all modes are found.
     '''
     K = mechanical_system.K()
     M = mechanical_system.M()
 
-    lambda_, V = sp.sparse.linalg.eigsh(K, M=M, k=n, sigma=0, which='LM',
-                                        maxiter=100)
+    if frequency_range is None:
+        lambda_, V = sp.sparse.linalg.eigsh(K, M=M, k=n, sigma=0, which='LM',
+                                            maxiter=100)
+    else:
+        lambda_, V = _spectrum_slicing(K, M, frequency_range, no_of_slices,
+                                       no_of_processes)
     omega = np.sqrt(abs(lambda_))
     # Little bit of sick hack: The negative sign is transferred to the
     # eigenfrequencies
@@ -237,6 +477,175 @@ def vibration_modes(mechanical_system, n=10, save=False):
     return omega, V
 
 
+def _inertia_count_dense(A):
+    '''
+    Count the negative eigenvalues of the symmetric matrix A with the
+    pivots of a dense Bunch-Kaufman LDL^T-factorization.
+    '''
+    __, D, __ = linalg.ldl(A.toarray() if sp.sparse.issparse(A) else A)
+    # D is block diagonal with 1x1 and 2x2 blocks
+    return int(np.sum(linalg.eigvalsh(D) < 0))
+
+
+def _inertia_count(K, M, sigma, max_no_of_shifts=10):
+    '''
+    Count the eigenvalues of the problem (K - lambda M) phi = 0 below sigma
+    with the number of negative pivots of the LDL^T-factorization of
+    K - sigma*M (Sylvester's law of inertia).
+
+    If K - sigma*M is singular, i.e. sigma is an eigenvalue, the shift is
+    moved slightly below sigma. If SuperLU does not pivot symmetrically, the
+    count is done with a dense LDL^T-factorization.
+
+    Parameters
+    ----------
+    K : sparse matrix
+        stiffness matrix
+    M : sparse matrix
+        mass matrix
+    sigma : float
+        shift
+    max_no_of_shifts : int, optional
+        maximum number of attempts to move the shift off an eigenvalue.
+        Default value: 10.
+
+    Returns
+    -------
+    count : int
+        number of eigenvalues smaller than the shift
+    sigma : float
+        shift the count belongs to; differs from the given sigma, if it
+        had to be moved off an eigenvalue
+
+    '''
+    # scale of the eigenvalues for moving the shift
+    scale = max(abs(sigma), abs(K.diagonal()).max() / abs(M.diagonal()).max())
+    delta = 1E-10*scale
+    for i in range(max_no_of_shifts):
+        A = sp.sparse.csc_matrix(K - sigma*M)
+        if use_pardiso:
+            pSolve = pardisoSolver(sp.sparse.csr_matrix(A),
+                                   mtype=mtypes['symm'])
+            pSolve.run_pardiso(12)
+            # iparm(23) holds the number of negative eigenvalues
+            count = int(pSolve.iparm[22])
+            pSolve.clear()
+            return count, sigma
+        # SuperLU with symmetric pivoting yields a LDU-factorization with
+        # U = D L^T, so that the signs of the pivots are the signs of diag(U)
+        try:
+            LU_object = sparse_linalg.splu(A, permc_spec='MMD_AT_PLUS_A',
+                                           diag_pivot_thresh=0,
+                                           options=dict(SymmetricMode=True))
+        except RuntimeError: # exactly singular, sigma is an eigenvalue
+            print('The shift {:.4e} is an eigenvalue. '.format(sigma)
+                  + 'It is moved to {:.4e}.'.format(sigma - delta))
+            sigma -= delta
+            delta *= 10
+            continue
+        if not np.all(LU_object.perm_r == LU_object.perm_c):
+            print('No symmetric pivoting for the inertia count at',
+                  'sigma = {:.4e}. A dense LDL^T-factorization'.format(sigma),
+                  'is used.')
+            return _inertia_count_dense(A), sigma
+        return int(np.sum(LU_object.U.diagonal() < 0)), sigma
+    raise ValueError('The inertia of K - sigma*M could not be computed, '
+                     + 'as it is singular for all tried shifts.')
+
+
+def _slice_modes(K, M, lambda_lower, lambda_upper, no_of_modes):
+    '''
+    Compute the no_of_modes eigenpairs in the interval
+    [lambda_lower, lambda_upper) with a shift-invert Lanczos iteration around
+    the center of the interval.
+
+    Returns
+    -------
+    lambda_ : ndarray
+        eigenvalues in the interval
+    V : ndarray
+        corresponding eigenvectors
+    '''
+    ndim = K.shape[0]
+    sigma = (lambda_lower + lambda_upper) / 2
+    k = no_of_modes + max(5, no_of_modes // 5)
+    while True:
+        k = min(k, ndim - 1)
+        lambda_, V = sparse_linalg.eigsh(K, M=M, k=k, sigma=sigma,
+                                         which='LM')
+        in_slice = (lambda_ >= lambda_lower) & (lambda_ < lambda_upper)
+        if np.sum(in_slice) >= no_of_modes or k == ndim - 1:
+            break
+        k *= 2
+    return lambda_[in_slice], V[:, in_slice]
+
+
+def _spectrum_slicing(K, M, frequency_range, no_of_slices=4,
+                      no_of_processes=1):
+    '''
+    Compute all eigenpairs with eigenfrequencies in frequency_range by
+    spectrum slicing. See vibration_modes for details.
+
+    Returns
+    -------
+    lambda_ : ndarray
+        sorted eigenvalues omega**2
+    V : ndarray
+        corresponding M-normalized eigenvectors
+    '''
+    omega_min, omega_max = frequency_range
+    # slice boundaries in the eigenvalues; slices are equally spaced in
+    # the frequency
+    sigmas = np.linspace(omega_min, omega_max, no_of_slices + 1)**2
+    sigmas[0] = np.sign(omega_min)*omega_min**2
+    # the upper boundary is shifted slightly in order to include omega_max
+    sigmas[-1] *= 1 + 1E-10
+
+    if no_of_processes > 1:
+        pool = mp.Pool(no_of_processes)
+        count_jobs = [pool.apply_async(_inertia_count, (K, M, sigma))
+                      for sigma in sigmas]
+        counts_and_sigmas = [job.get() for job in count_jobs]
+    else:
+        counts_and_sigmas = [_inertia_count(K, M, sigma) for sigma in sigmas]
+    # the slice boundaries are the shifts the counts belong to
+    counts = np.array([count for count, __ in counts_and_sigmas])
+    sigmas = np.array([sigma for __, sigma in counts_and_sigmas])
+    modes_per_slice = np.diff(counts)
+    print('Number of modes per slice:', modes_per_slice)
+
+    args = [(K, M, sigmas[i], sigmas[i+1], modes_per_slice[i])
+            for i in range(no_of_slices) if modes_per_slice[i] > 0]
+    if no_of_processes > 1:
+        slice_jobs = [pool.apply_async(_slice_modes, arg) for arg in args]
+        results = [job.get() for job in slice_jobs]
+        pool.close()
+        pool.join()
+    else:
+        results = [_slice_modes(*arg) for arg in args]
+
+    if len(results) == 0:
+        return np.zeros(0), np.zeros((K.shape[0], 0))
+    lambda_ = np.concatenate([res[0] for res in results])
+    V = np.concatenate([res[1] for res in results], axis=1)
+    order = np.argsort(lambda_)
+    lambda_, V = lambda_[order], V[:, order]
+
+    # remove duplicates, i.e. nearly equal eigenvalues with parallel modes
+    keep = np.ones(len(lambda_), dtype=bool)
+    for i in range(1, len(lambda_)):
+        for j in range(i-1, -1, -1):
+            if abs(lambda_[i] - lambda_[j]) > 1E-8*max(abs(lambda_[i]), 1):
+                break
+            if keep[j] and abs(V[:,i] @ (M @ V[:,j])) > 0.99:
+                keep[i] = False
+                break
+    lambda_, V = lambda_[keep], V[:, keep]
+    if len(lambda_) != counts[-1] - counts[0]:
+        print('Warning: {} modes found, but {} modes expected in the band.'
+              .format(len(lambda_), counts[-1] - counts[0]))
+    return lambda_, V
+
 
 def craig_bampton(M, K, b, no_of_modes=5, one_basis=True):
     '''
@@ -245,9 +654,9 @@ def craig_bampton(M, K, b, no_of_modes=5, one_basis=True):
 
     Parameters
     ----------
-    M : ndarray
+    M : ndarray or sparse matrix
         Mass matrix of the system.
-    K : ndarray
+    K : ndarray or sparse matrix
         Stiffness matrix of the system.
     b : ndarray
         Input vector of the system
@@ -283,64 +692,260 @@ def craig_bampton(M, K, b, no_of_modes=5, one_basis=True):
 
     Notes
     -----
-    There is a filter-out command to remove the interface eigenvalues of the
-    system.
+    The dofs are partitioned into the boundary dofs, i.e. the dofs where b is
+    nonzero, and the interior dofs. The interior stiffness matrix K_ii is
+    factorized once; it is used for all constraint modes, which are solved
+    as one block, and for the shift-invert Lanczos iteration (ARPACK) of the
+    fixed interface modes. Hence, the matrices are never densified.
 
     References
     ----------
-    TODO
+    .. [1]  R. R. Craig and M. C. C. Bampton: Coupling of substructures for
+            dynamic analyses. AIAA Journal, 6(7):1313-1319, 1968.
 
     '''
-    # boundaries
     ndof = M.shape[0]
     b_internal = b.reshape((ndof, -1))
-    indices = sp.nonzero(b)
-    boundary_indices = list(set(indices[0])) # indices
+    if sp.sparse.issparse(b_internal):
+        b_internal = b_internal.toarray()
     no_of_inputs = b_internal.shape[-1]
+
+    # partitioning of the dofs
+    boundary_indices = np.unique(np.nonzero(b_internal)[0])
+    interior_indices = np.setdiff1d(np.arange(ndof), boundary_indices)
+    K = sp.sparse.csr_matrix(K)
+    M = sp.sparse.csr_matrix(M)
+    K_ii = sp.sparse.csc_matrix(K[interior_indices][:, interior_indices])
+    K_ib = K[interior_indices][:, boundary_indices]
+    M_ii = sp.sparse.csc_matrix(M[interior_indices][:, interior_indices])
+
+    # Static constraint modes with one factorization of K_ii
+    K_ii_inv = SpSolve(K_ii)
     V_static_tmp = np.zeros((ndof, len(boundary_indices)))
-    K_tmp = K.copy()
-    K_tmp[:, boundary_indices] *= 0
-    K_tmp[boundary_indices, :] *= 0
-    K_tmp[boundary_indices, boundary_indices] = 1
-    for i, index  in enumerate(boundary_indices):
-        f = - K[:,index]
-        f[boundary_indices] = 0
-        f[index] = 1
-        V_static_tmp[:,i] = solve_sparse(K_tmp, f, matrix_type='symm')
-    # Static Modes:
-    V_static = np.zeros((ndof, no_of_inputs))
-    for i in range(no_of_inputs):
-        V_static[:,i] = V_static_tmp.dot(b_internal[boundary_indices, [i,]])
-
-    # inner modes
-    M_tmp = M.copy()
-    # Attention: introducing eigenvalues of magnitude 1 into the system
-    M_tmp[:, boundary_indices] *= 0
-    M_tmp[boundary_indices, :] *= 0
-    M_tmp[boundary_indices, boundary_indices] = 1E0
-    K_tmp[boundary_indices, boundary_indices] = 1E0
-    omega, V_dynamic = linalg.eigh(K_tmp, M_tmp)
-    indexlist = np.nonzero(np.round(omega - 1, 3))[0]
-    omega = np.sqrt(omega[indexlist])
-    V_dynamic = V_dynamic[:, indexlist]
+    V_static_tmp[boundary_indices, np.arange(len(boundary_indices))] = 1
+    V_static_tmp[interior_indices, :] = - K_ii_inv.solve(K_ib).reshape(
+        (len(interior_indices), -1))
+    V_static = V_static_tmp @ b_internal[boundary_indices, :]
+
+    # Fixed interface modes with shift-invert around 0 using the
+    # factorization of K_ii
+    n_int = len(interior_indices)
+    if no_of_modes >= n_int - 1:
+        lambda_, Phi_i = linalg.eigh(K_ii.toarray(), M_ii.toarray())
+    else:
+        OPinv = sp.sparse.linalg.LinearOperator((n_int, n_int),
+                                                matvec=K_ii_inv.solve,
+                                                dtype=float)
+        lambda_, Phi_i = sp.sparse.linalg.eigsh(K_ii, M=M_ii, k=no_of_modes,
+                                                sigma=0, which='LM',
+                                                OPinv=OPinv)
+    K_ii_inv.clear()
+    order = np.argsort(lambda_)[:no_of_modes]
+    omega = np.sqrt(abs(lambda_[order]))
+    V_dynamic = np.zeros((ndof, len(order)))
+    V_dynamic[interior_indices, :] = Phi_i[:, order]
+
     if one_basis:
-        return sp.hstack((V_static, V_dynamic[:, :no_of_modes]))
+        return np.hstack((V_static, V_dynamic))
     else:
-        return V_static, V_dynamic[:, :no_of_modes], omega[:no_of_modes]
+        return V_static, V_dynamic, omega
 
 
-def pod(mechanical_system, n=None):
+def _snapshot_chunks(snapshots, chunk_size=100):
+    '''
+    Generator yielding the constrained snapshots block by block.
+
+    Parameters
+    ----------
+    snapshots : MechanicalSystem, str or ndarray
+        MechanicalSystem with displacements stored in u_output, filename of an
+        hdf5 file exported by AMfe or snapshot matrix with the snapshots as
+        columns.
+    chunk_size : int, optional
+        Maximum number of snapshots per block. Default value 100.
+
+    Yields
+    ------
+    S_chunk : ndarray
+        Block of constrained snapshots of shape (ndof, <= chunk_size).
+
+    '''
+    if isinstance(snapshots, str):
+        # Same layout as in tools.h5_read_u but only chunk_size columns of
+        # the displacement dataset are read at once
+        with h5py.File(snapshots, 'r') as f:
+            h5_mat = f['mesh/bmat']
+            csr_list = []
+            for par in ('data', 'indices', 'indptr', 'shape'):
+                csr_list.append(h5_mat[par][:])
+            bmat = sp.sparse.csr_matrix(tuple(csr_list[:3]),
+                                        shape=tuple(csr_list[3]))
+            u_h5 = f['time_vals/Displacement']
+            ndof_unconstr = bmat.shape[0]
+            # If the problem is 2D but exported to 3D, u_full has to be reduced.
+            mask = np.ones(u_h5.shape[0], dtype=bool)
+            if ndof_unconstr*3//2 == u_h5.shape[0] != ndof_unconstr:
+                mask[2::3] = False
+            for i in range(0, u_h5.shape[1], chunk_size):
+                u_full = u_h5[:, i:i+chunk_size][mask, :]
+                yield bmat.T @ u_full
+    elif hasattr(snapshots, 'u_output'):
+        u_output = snapshots.u_output
+        for i in range(0, len(u_output), chunk_size):
+            yield snapshots.constrain_vec(np.array(u_output[i:i+chunk_size]).T)
+    else:
+        S = np.asarray(snapshots)
+        for i in range(0, S.shape[1], chunk_size):
+            yield S[:, i:i+chunk_size]
+
+
+def _orthonormalize(R, M=None):
+    '''
+    Compute an (M-)orthonormal basis Q of the range of R with R = Q @ R_Q.
+
+    Without M a thin QR decomposition is used. With M, the columns are
+    orthonormalized via the eigendecomposition of the Gram matrix R.T @ M @ R
+    which is performed twice in order to restore the orthogonality lost in
+    the first pass. Directions with a vanishing M-norm are dropped.
+
+    '''
+    if M is None:
+        Q, R_Q = sp.linalg.qr(R, mode='economic')
+        return Q, R_Q
+    Q = R
+    R_Q = np.eye(R.shape[1])
+    for __ in range(2):
+        gram = Q.T @ (M @ Q)
+        lambda_, W = sp.linalg.eigh((gram + gram.T)/2)
+        keep = lambda_ > max(lambda_.max(initial=0), 0)*R.shape[0]*1E-15
+        lambda_, W = lambda_[keep], W[:, keep]
+        Q = (Q @ W) / np.sqrt(lambda_)
+        R_Q = (np.sqrt(lambda_)[:, None] * W.T) @ R_Q
+    return Q, R_Q
+
+
+def _truncation_rank(sigma, n=None, tol=None, energy=None):
+    '''
+    Return the number of singular values which are kept, either bounded by the
+    rank n or by the relative energy tolerance tol with respect to the total
+    energy (default: sum of sigma**2).
+
+    '''
+    r = len(sigma)
+    if tol is not None and r > 0:
+        if energy is None:
+            energy = np.sum(sigma**2)
+        r = min(r, np.searchsorted(np.cumsum(sigma**2), (1 - tol)*energy) + 1)
+    if n is not None:
+        r = min(r, n)
+    # discard numerically zero directions
+    if r > 0:
+        r = min(r, np.count_nonzero(sigma > sigma[0]*1E-14))
+    return r
+
+
+def _brand_svd_update(U, sigma, S_chunk, M=None):
+    '''
+    Update the thin SVD U @ diag(sigma) of the snapshots seen so far with the
+    new block S_chunk (Brand's incremental SVD). The right singular vectors
+    are not tracked.
+
+    Returns the updated, untruncated U and sigma.
+
+    '''
+    MS = S_chunk if M is None else M @ S_chunk
+    P = U.T @ MS
+    R = S_chunk - U @ P
+    # reorthogonalization against the existing basis
+    P_corr = U.T @ (R if M is None else M @ R)
+    R -= U @ P_corr
+    P += P_corr
+    Q, R_Q = _orthonormalize(R, M)
+    r, k = len(sigma), Q.shape[1]
+    K = np.zeros((r + k, r + S_chunk.shape[1]))
+    K[:r, :r] = np.diag(sigma)
+    K[:r, r:] = P
+    K[r:, r:] = R_Q
+    U_K, sigma_new, __ = sp.linalg.svd(K, full_matrices=False)
+    return np.hstack((U, Q)) @ U_K, sigma_new
+
+
+def _randomized_pod(snapshots, n, M=None, chunk_size=100, oversampling=10,
+                    no_of_power_iter=1):
+    '''
+    Randomized range finder on the snapshot matrix, accessed block wise.
+
+    Returns all n + oversampling singular values and (M-)orthonormal vectors
+    together with the total energy of the snapshots.
+
+    '''
+    k = n + oversampling
+    Y = 0
+    energy = 0
+    for S_chunk in _snapshot_chunks(snapshots, chunk_size):
+        Y = Y + S_chunk @ np.random.standard_normal((S_chunk.shape[1], k))
+        MS = S_chunk if M is None else M @ S_chunk
+        energy += np.sum(S_chunk * MS)
+    for __ in range(no_of_power_iter):
+        Q, __ = _orthonormalize(Y, M)
+        MQ = Q if M is None else M @ Q
+        Y = 0
+        for S_chunk in _snapshot_chunks(snapshots, chunk_size):
+            Y = Y + S_chunk @ (S_chunk.T @ MQ)
+    Q, __ = _orthonormalize(Y, M)
+    MQ = Q if M is None else M @ Q
+    # B @ B.T with B = Q.T @ M @ S is accumulated; only (k, k) is stored
+    BBt = np.zeros((Q.shape[1], Q.shape[1]))
+    for S_chunk in _snapshot_chunks(snapshots, chunk_size):
+        B_chunk = MQ.T @ S_chunk
+        BBt += B_chunk @ B_chunk.T
+    lambda_, W = sp.linalg.eigh(BBt)
+    order = np.argsort(lambda_)[::-1]
+    sigma = np.sqrt(np.maximum(lambda_[order], 0))
+    return Q @ W[:, order], sigma, energy
+
+
+def pod(mechanical_system, n=None, tol=None, method='svd', M=None,
+        chunk_size=100, oversampling=10, no_of_power_iter=1, verbose=False):
     '''
     Compute the POD basis of a mechanical system.
 
+    Besides the dense SVD of the full snapshot matrix, the snapshots can be
+    processed block wise with an incremental (Brand) or a randomized SVD. Then
+    the memory is bounded by chunk_size times the rank of the basis.
+
     Parameters
     ----------
-    mechanical_system : instance of MechanicalSystem
+    mechanical_system : instance of MechanicalSystem, str or ndarray
         MechanicalSystem which has run a time simulation and thus displacement
-        fields stored internally.
+        fields stored internally. Alternatively the filename of an hdf5 file
+        exported by AMfe (see tools.h5_read_u) or a matrix of constrained
+        snapshots, one snapshot per column.
     n : int, optional
         Number of POD basis vectors which should be returned. Default is `None`
-        returning all POD vectors.
+        returning all POD vectors. Required for method 'randomized'.
+    tol : float, optional
+        Relative energy tolerance. The smallest basis is returned whose
+        neglected energy sum(sigma[r:]**2) is below tol times the total energy
+        of the snapshots. Default is `None`.
+    method : {'svd', 'incremental', 'randomized'}, optional
+        'svd' computes the dense SVD of the full snapshot matrix, 'incremental'
+        updates a truncated SVD with every block of snapshots and
+        'randomized' uses a randomized range finder with a few passes over the
+        snapshots. Default 'svd'.
+    M : ndarray or sparse matrix, optional
+        Constrained mass matrix. If given, the POD is computed in the M-inner
+        product, i.e. V.T @ M @ V = eye. Default is `None`.
+    chunk_size : int, optional
+        Number of snapshots read at once. Default value 100.
+    oversampling : int, optional
+        Number of additional random samples for method 'randomized' and
+        number of additional directions kept during the updates for method
+        'incremental'. Default value 10.
+    no_of_power_iter : int, optional
+        Number of power iterations for method 'randomized'. Default value 1.
+    verbose : bool, optional
+        Flag for verbose output. Default False.
 
     Returns
     -------
@@ -355,14 +960,172 @@ def pod(mechanical_system, n=None):
     TODO
 
     '''
-    S = np.array(mechanical_system.u_output).T
-    U, sigma, __ = sp.linalg.svd(S, full_matrices=False)
-    U_return = mechanical_system.constrain_vec(U[:,:n])
-    return sigma[:n], U_return
+    energy = None
+    if method == 'svd':
+        if M is None and hasattr(mechanical_system, 'u_output'):
+            S = np.array(mechanical_system.u_output).T
+            U, sigma, __ = sp.linalg.svd(S, full_matrices=False)
+            U = mechanical_system.constrain_vec(U)
+        else:
+            S = np.hstack(list(_snapshot_chunks(mechanical_system,
+                                                chunk_size)))
+            Q, R_Q = _orthonormalize(S, M)
+            U_R, sigma, __ = sp.linalg.svd(R_Q, full_matrices=False)
+            U = Q @ U_R
+    elif method == 'incremental':
+        U, sigma, energy = None, np.zeros(0), 0
+        for S_chunk in _snapshot_chunks(mechanical_system, chunk_size):
+            if U is None:
+                U = np.zeros((S_chunk.shape[0], 0))
+            MS = S_chunk if M is None else M @ S_chunk
+            energy += np.sum(S_chunk * MS)
+            U, sigma = _brand_svd_update(U, sigma, S_chunk, M)
+            # a few additional directions are carried along in order to
+            # reduce the error of the truncation in every update
+            n_buffer = None if n is None else n + oversampling
+            tol_buffer = None if tol is None else tol/10
+            r = _truncation_rank(sigma, n_buffer, tol_buffer, energy)
+            U, sigma = U[:, :r], sigma[:r]
+            if verbose:
+                print('POD: rank', r, 'after', S_chunk.shape[1],
+                      'new snapshots.')
+    elif method == 'randomized':
+        if n is None:
+            raise ValueError('The target rank n is required for the '
+                             + 'randomized POD.')
+        U, sigma, energy = _randomized_pod(mechanical_system, n, M,
+                                           chunk_size, oversampling,
+                                           no_of_power_iter)
+    else:
+        raise ValueError('The method ' + str(method) + ' is not known. '
+                         + "Choose 'svd', 'incremental' or 'randomized'.")
+
+    if tol is None:
+        r = min(n, len(sigma)) if n is not None else len(sigma)
+    else:
+        r = _truncation_rank(sigma, n, tol, energy)
+    if verbose:
+        print('POD basis with', r, 'vectors computed.')
+    return sigma[:r], U[:, :r]
+
+
+def stiffness_derivatives(V, K_func, h=1.0, finite_diff='central',
+                          no_of_processes=1, verbose=True, K=None,
+                          dK_func=None):
+    '''
+    Compute the directional derivatives of the tangential stiffness matrix
+    dK/dx_j for all basis vectors x_j = V[:,j] with finite differences or,
+    if dK_func is given, analytically.
+
+    As dK/dx_j does not depend on the vibration mode x_i, the derivatives
+    can be computed once and passed to modal_derivatives and
+    static_derivatives via the dK_dx argument.
+
+    Parameters
+    ----------
+    V : ndarray
+        array containing the linear basis
+    K_func : function
+        function returning the tangential stiffness matrix for a given
+        displacement. Has to work like `K = K_func(u)`.
+    h : float, optional
+        step width for finite difference scheme. Default value is 1.0
+    finite_diff : str {'central', 'forward', 'upwind', 'backward'}
+        Method for finite difference scheme. 'upwind' is the same as
+        'forward'.
+    no_of_processes : int, optional
+        number of worker processes for the assemblies. Default value: 1.
+    verbose : bool, optional
+        flag for verbosity. Default value: True
+    K : sparse matrix, optional
+        stiffness matrix of the undeformed state, if already available.
+    dK_func : function, optional
+        function returning the exact directional derivative of the tangential
+        stiffness matrix. Has to work like `dK = dK_func(u, v)`, e.g.
+        MechanicalSystem.dK_dv. If given, the finite difference parameters
+        are ignored and one assembly per direction is performed.
+
+    Returns
+    -------
+    dK_dx : list
+        list of the stiffness derivatives; dK_dx[j] is the derivative in the
+        direction V[:,j].
+
+    '''
+    no_of_dofs, no_of_modes = V.shape
+    if dK_func is not None:
+        u = np.zeros(no_of_dofs)
+        if verbose:
+            print('Computing {} analytic stiffness derivatives.'.format(
+                no_of_modes))
+        if no_of_processes > 1:
+            pool = mp.Pool(no_of_processes)
+            jobs = [apply_async(pool, dK_func, [u, V[:,j]])
+                    for j in range(no_of_modes)]
+            dK_dx = [job.get() for job in jobs]
+            pool.close()
+            pool.join()
+        else:
+            dK_dx = [dK_func(u, V[:,j]) for j in range(no_of_modes)]
+        return dK_dx
+
+    if finite_diff == 'central':
+        directions = [(h*V[:,j], -h*V[:,j]) for j in range(no_of_modes)]
+        denominator = 2*h
+    elif finite_diff in ('forward', 'upwind'):
+        directions = [(h*V[:,j], None) for j in range(no_of_modes)]
+        denominator = h
+    elif finite_diff == 'backward':
+        directions = [(None, -h*V[:,j]) for j in range(no_of_modes)]
+        denominator = h
+    else:
+        raise ValueError('Finite difference scheme is not valid.')
+
+    # all displacements, at which K is evaluated; the undeformed state only
+    # once
+    u_list = []
+    if K is None:
+        u_list.append(np.zeros(no_of_dofs))
+    for u_plus, u_minus in directions:
+        u_list.extend([u for u in (u_plus, u_minus) if u is not None])
+    if verbose:
+        print('Computing {} stiffness matrices for the'.format(len(u_list)),
+              'finite difference scheme.')
+
+    if no_of_processes > 1:
+        pool = mp.Pool(no_of_processes)
+        jobs = [apply_async(pool, K_func, [u]) for u in u_list]
+        K_list = [job.get() for job in jobs]
+        pool.close()
+        pool.join()
+    else:
+        K_list = [K_func(u) for u in u_list]
+
+    if K is None:
+        K = K_list[0]
+        idx = 1
+    else:
+        idx = 0
+    dK_dx = []
+    for u_plus, u_minus in directions:
+        if u_plus is not None:
+            K_plus = K_list[idx]
+            idx += 1
+        else:
+            K_plus = K
+        if u_minus is not None:
+            K_minus = K_list[idx]
+            idx += 1
+        else:
+            K_minus = K
+        dK_dx.append((K_plus - K_minus)/denominator)
+    return dK_dx
 
 
 def modal_derivatives(V, omega, K_func, M, h=1.0, verbose=True,
-                           symmetric=True, finite_diff='central'):
+                           symmetric=True, finite_diff='central',
+                           dK_dx=None, no_of_processes=1, analytic=False,
+                           dK_func=None):
     r'''
     Compute the basis theta based on real modal derivatives.
 
@@ -388,6 +1151,19 @@ def modal_derivatives(V, omega, K_func, M, h=1.0, verbose=True,
         Method for finite difference scheme. 'central' computes the finite difference
         based on a central difference scheme, 'upwind' based on an upwind scheme. Note
         that the upwind scheme can cause severe distortions of the modal derivative.
+    dK_dx : list, optional
+        precomputed stiffness derivatives from stiffness_derivatives. If None,
+        they are computed with 2*n (central) or n+1 (upwind) assemblies.
+    no_of_processes : int, optional
+        number of worker processes for the assemblies of the stiffness
+        derivatives. Default value: 1.
+    analytic : bool, optional
+        flag for computing the stiffness derivatives exactly with dK_func
+        instead of finite differences. Default value: False.
+    dK_func : function, optional
+        function returning the directional derivative of the tangential
+        stiffness matrix like `dK = dK_func(u, v)`, e.g.
+        MechanicalSystem.dK_dv. Required if `analytic=True`.
 
     Returns
     -------
@@ -409,6 +1185,18 @@ def modal_derivatives(V, omega, K_func, M, h=1.0, verbose=True,
         Exception('The given modes are not mass normalized!')
 
     K = K_func(np.zeros(no_of_dofs))
+    if finite_diff not in ('central', 'upwind'):
+        raise ValueError('Finite difference scheme is not valid.')
+    if analytic and dK_func is None:
+        raise ValueError('The analytic stiffness derivatives need dK_func.')
+    if dK_dx is None:
+        dK_dx = stiffness_derivatives(V, K_func, h=h, finite_diff=finite_diff,
+                                      no_of_processes=no_of_processes,
+                                      verbose=verbose, K=K,
+                                      dK_func=dK_func if analytic else None)
+    # dK_V[j] = dK/dx_j @ V
+    dK_V = np.array([dK_dx_j @ V for dK_dx_j in dK_dx])
+    MV = M @ V
 
     for i in range(no_of_modes): # looping over the columns
         x_i = V[:,i]
@@ -424,31 +1212,25 @@ def modal_derivatives(V, omega, K_func, M, h=1.0, verbose=True,
                   '{0:d} with {1:4.2f} rad/s.'.format(i, omega[i]) )
         LU_object = SpSolve(K_dyn_i)
 
-        for j in range(no_of_modes): # looping over the rows
-            x_j = V[:,j]
-            # finite difference scheme
-            if finite_diff == 'central':
-                dK_dx_j = (K_func(h*x_j) - K_func(-h*x_j))/(2*h)
-            elif finite_diff == 'upwind':
-                dK_dx_j = (K_func(h*x_j) - K)/h
-            else:
-                raise ValueError('Finite difference scheme is not valid.')
-
-            d_omega_2_d_x_i = x_i @ dK_dx_j @ x_i
-            F_i = (d_omega_2_d_x_i*M - dK_dx_j) @ x_i
-            F_i[fix_idx] = 0
-            v_i = LU_object.solve(F_i)
-            c_i = - v_i @ M @ x_i
-            Theta[:,i,j] = v_i + c_i*x_i
+        # right hand sides for all directions j are solved as one block;
+        # F_i[:,j] = (x_i @ dK/dx_j @ x_i * M - dK/dx_j) @ x_i
+        dK_V_i = dK_V[:,:,i].T
+        d_omega_2_d_x_i = x_i @ dK_V_i
+        F_i = np.outer(MV[:,i], d_omega_2_d_x_i) - dK_V_i
+        F_i[fix_idx,:] = 0
+        v_i = LU_object.solve(F_i).reshape((no_of_dofs, no_of_modes))
+        c_i = - v_i.T @ MV[:,i]
+        Theta[:,i,:] = v_i + np.outer(x_i, c_i)
+        LU_object.clear()
 
-    LU_object.clear()
     if symmetric:
         Theta = 1/2*(Theta + Theta.transpose((0,2,1)))
     return Theta
 
 def static_derivatives(V, K_func, M=None, omega=0, h=1.0,
                             verbose=True, symmetric=True,
-                            finite_diff='central'):
+                            finite_diff='central', dK_dx=None,
+                            no_of_processes=1, analytic=False, dK_func=None):
     '''
     Compute the static correction derivatives for the given basis V.
 
@@ -476,6 +1258,19 @@ def static_derivatives(V, K_func, M=None, omega=0, h=1.0,
         difference based on a central difference scheme, 'forward' based on an
         forward scheme etc. Note that the upwind scheme can cause severe
         distortions of the static correction derivative.
+    dK_dx : list, optional
+        precomputed stiffness derivatives from stiffness_derivatives. If None,
+        they are computed.
+    no_of_processes : int, optional
+        number of worker processes for the assemblies of the stiffness
+        derivatives. Default value: 1.
+    analytic : bool, optional
+        flag for computing the stiffness derivatives exactly with dK_func
+        instead of finite differences. Default value: False.
+    dK_func : function, optional
+        function returning the directional derivative of the tangential
+        stiffness matrix like `dK = dK_func(u, v)`, e.g.
+        MechanicalSystem.dK_dv. Required if `analytic=True`.
 
     Returns
     -------
@@ -494,28 +1289,30 @@ def static_derivatives(V, K_func, M=None, omega=0, h=1.0,
     no_of_modes = V.shape[1]
     Theta = np.zeros((no_of_dofs, no_of_modes, no_of_modes))
     K = K_func(np.zeros(no_of_dofs))
-    if (omega > 0) and (M != None):
+    if (omega > 0) and (M is not None):
         K_dyn = K - omega**2 * M
     else:
         K_dyn = K
+    if finite_diff not in ('central', 'forward', 'backward'):
+        raise ValueError('Finite difference scheme is not valid.')
+    if analytic and dK_func is None:
+        raise ValueError('The analytic stiffness derivatives need dK_func.')
+    if dK_dx is None:
+        dK_dx = stiffness_derivatives(V, K_func, h=h, finite_diff=finite_diff,
+                                      no_of_processes=no_of_processes,
+                                      verbose=verbose, K=K,
+                                      dK_func=dK_func if analytic else None)
     LU_object = SpSolve(K_dyn)
+    # the right hand sides of all directions are gathered in one block
+    B = np.zeros((no_of_dofs, no_of_modes*no_of_modes))
     for i in range(no_of_modes):
-        if verbose:
-            print('Computing finite difference K-matrix')
-        if finite_diff == 'central':
-            dK_dx_i = (K_func(h*V[:,i]) - K_func(-h*V[:,i]))/(2*h)
-        elif finite_diff == 'forward':
-            dK_dx_i = (K_func(h*V[:,i]) - K)/h
-        elif finite_diff == 'backward':
-            dK_dx_i = (-K_func(-h*V[:,i]) + K)/h
-        else:
-            raise ValueError('Finite difference scheme is not valid.')
-        b = - dK_dx_i @ V
-        if verbose:
-            print('Solving linear system #', i)
-        Theta[:,:,i] = LU_object.solve(b)
-        if verbose:
-            print('Done solving linear system #', i)
+        B[:,i*no_of_modes:(i+1)*no_of_modes] = - dK_dx[i] @ V
+    if verbose:
+        print('Solving the linear system for',
+              '{} right hand sides.'.format(no_of_modes*no_of_modes))
+    X = LU_object.solve(B).reshape((no_of_dofs, no_of_modes, no_of_modes))
+    # X[:,i,j] is the solution for the direction i and the vector j
+    Theta[:,:,:] = X.transpose(0,2,1)
     if verbose:
         residual = np.linalg.norm(Theta - Theta.transpose(0,2,1)) / \
                    np.linalg.norm(Theta)
@@ -537,7 +1334,8 @@ def augment_with_derivatives(V, theta, M=None, tol=1E-8, symm=True):
     V : ndarray
         linear basis
     theta : ndarray
-        third order tensor filled with the modal derivatices associated with V
+        third order tensor filled with the modal derivatices associated with V.
+        Can be full (ndof, n, n) or packed (ndof, n*(n+1)/2), see pack_theta.
     M : ndarray, optional
         Mass matrix. If mass matrix is passed, the reduction basis augmentation
         will be M-normalized, otherwise it will just be normalized (2-norm)
@@ -546,7 +1344,8 @@ def augment_with_derivatives(V, theta, M=None, tol=1E-8, symm=True):
         at least smaller than the largest one multiplied with tol.
         Default value: 1E-8.
     symm : bool, optional
-        If set to true (default), theta will be assumed to be symmetric!
+        If set to true (default), theta will be assumed to be symmetric! A
+        packed theta is always symmetric.
 
     Returns
     -------
@@ -555,28 +1354,18 @@ def augment_with_derivatives(V, theta, M=None, tol=1E-8, symm=True):
 
     '''
     ndof, n = V.shape
-    if symm:
-        V_raw = np.zeros((ndof, n*(n+3)//2))
-        V_raw[:,:n] = V[:,:]
-        for i in range(n):
-            for j in range(i+1):
-                idx = n + i*(i+1)//2 + j
-                if M is None:
-                    theta_norm = np.sqrt(theta[:,i,j].T @ theta[:,i,j])
-                else:
-                    theta_norm = np.sqrt(theta[:,i,j].T @ M @ theta[:,i,j])
-                V_raw[:,idx] = theta[:,i,j] / theta_norm
+    if theta.ndim == 2:
+        theta_cols = theta
+    elif symm:
+        theta_cols = pack_theta(theta, check_symmetry=False)
+    else:
+        theta_cols = theta.reshape((ndof, n*n))
+    if M is None:
+        theta_norms = np.sqrt(np.einsum('ij, ij -> j', theta_cols, theta_cols))
     else:
-        V_raw = np.zeros((ndof, n*(n+1)))
-        V_raw[:,:n] = V[:,:]
-        for i in range(n):
-            for j in range(n):
-                idx = n*(i+1) + j
-                if M is None:
-                    theta_norm = np.sqrt(theta[:,i,j].T @ theta[:,i,j])
-                else:
-                    theta_norm = np.sqrt(theta[:,i,j].T @ M @ theta[:,i,j])
-                V_raw[:,idx] = theta[:,i,j] / theta_norm
+        theta_norms = np.sqrt(np.einsum('ij, ij -> j', theta_cols,
+                                        M @ theta_cols))
+    V_raw = np.hstack((V, theta_cols / theta_norms))
 
     # Deflation algorithm
     U, s, V_svd = sp.linalg.svd(V_raw, full_matrices=False)
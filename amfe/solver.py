@@ -12,13 +12,18 @@ __all__ = [
            'integrate_linear_gen_alpha',
            'solve_linear_displacement',
            'solve_nonlinear_displacement',
+           'solve_linear_load_cases',
            'integrate_linear_system',
            'integrate_nonlinear_system',
+           'integrate_linear_modal',
+           'solve_harmonic',
            'solve_sparse',
            'SpSolve',
+           'DenseSolve',
            ]
 
 import time
+import multiprocessing as mp
 import numpy as np
 import scipy as sp
 from scipy import sparse
@@ -65,7 +70,32 @@ abort_statement = '''
 
 mtypes = {'spd':2,
           'symm':-2,
-          'unsymm':11}
+          'unsymm':11,
+          'complex_symm':6}
+
+def _rhs_array(b):
+    '''
+    Convert the right hand side b of a linear system to a dense array which
+    can be passed to the sparse solvers in one call. Blocks of right hand
+    sides are stored column-major, as the column of every right hand side
+    has to be contiguous in memory for Pardiso.
+
+    Parameters
+    ----------
+    b : ndarray or sparse matrix, shape (n,) or shape (n, m)
+        right hand side or block of m right hand sides
+
+    Returns
+    -------
+    b : ndarray, shape (n,) or shape (n, m)
+        dense right hand side
+
+    '''
+    if sp.sparse.issparse(b):
+        b = b.toarray()
+    if b.ndim == 2:
+        b = np.asfortranarray(b)
+    return b
 
 def solve_sparse(A, b, matrix_type='symm', verbose=False):
     '''
@@ -76,18 +106,20 @@ def solve_sparse(A, b, matrix_type='symm', verbose=False):
     ----------
     A : sp.sparse.CSR
         sparse matrix in CSR-format
-    b : ndarray
-        right hand side of equation
+    b : ndarray, shape (n,) or shape (n, m)
+        right hand side of equation. If b is two dimensional, the system is
+        solved for all m columns of b with one factorization of A.
     matrixd_type : {'spd', 'symm', 'unsymm'}, optional
         Specifier for the matrix type:
 
         - 'spd' : symmetric positive definite
         - 'symm' : symmetric indefinite, default.
         - 'unsymm' : generally unsymmetric
+        - 'complex_symm' : complex symmetric
 
     Returns
     -------
-    x : ndarray
+    x : ndarray, shape (n,) or shape (n, m)
         solution of system Ax=b
 
     Notes
@@ -105,6 +137,7 @@ def solve_sparse(A, b, matrix_type='symm', verbose=False):
     1
 
     '''
+    b = _rhs_array(b)
     if sp.sparse.issparse(A):
         if use_pardiso:
             mtype = mtypes[matrix_type]
@@ -124,7 +157,7 @@ class SpSolve():
     sides b using the fastest solver available, i.e. the Intel MKL Pardiso, if
     available.
     '''
-    def __init__(self, A, matrix_type='symm', verbose=False):
+    def __init__(self, A, matrix_type='symm', verbose=False, ordering=None):
         '''
         Parameters
         ----------
@@ -136,16 +169,30 @@ class SpSolve():
         - 'spd' : symmetric positive definite
         - 'symm' : symmetric indefinite
         - 'unsymm' : generally unsymmetric
+        - 'complex_symm' : complex symmetric
 
         verbose : bool
             Flag for verbosity.
+        ordering : ndarray, optional
+            Fill reducing column ordering of a previous factorization of a
+            matrix with the same sparsity pattern, i.e. the attribute
+            ordering of another SpSolve instance. If given, the ordering is
+            not computed again. Only used without Pardiso.
         '''
+        self.ordering = None
+        self.reordered = False
         if use_pardiso:
             mtype = mtypes[matrix_type]
             self.pSolve = pardisoSolver(A, mtype=mtype, verbose=verbose)
             self.pSolve.run_pardiso(12) # Analysis and numerical factorization
-        else:
+        elif ordering is None:
             self.pSolve = sp.sparse.linalg.splu(A)
+            self.ordering = self.pSolve.perm_c
+        else:
+            A_perm = sp.sparse.csc_matrix(A)[:, np.argsort(ordering)]
+            self.pSolve = sp.sparse.linalg.splu(A_perm, permc_spec='NATURAL')
+            self.ordering = ordering
+            self.reordered = True
 
     def solve(self, b):
         '''
@@ -153,21 +200,55 @@ class SpSolve():
 
         Parameters
         ----------
-        b : ndarray
-            right hand side of equation
+        b : ndarray, shape (n,) or shape (n, m)
+            right hand side of equation. If b is two dimensional, all m
+            columns are solved in one call of the backend.
 
         Returns
         -------
-        x : ndarray
+        x : ndarray, shape (n,) or shape (n, m)
             solution of the sparse equation Ax=b
 
         '''
+        b = _rhs_array(b)
         if use_pardiso:
             x = self.pSolve.run_pardiso(33, b)
         else:
             x = self.pSolve.solve(b)
+            if self.reordered:
+                x = x[self.ordering]
         return x
 
+    def update(self, A):
+        '''
+        Factorize the matrix A, which has the same sparsity pattern as the
+        matrix the solver was built with, reusing the fill reducing ordering.
+
+        With Pardiso, the symbolic analysis is kept and only the numerical
+        factorization (phase 22) is run. Otherwise, SuperLU factorizes A with
+        the column ordering of the first factorization.
+
+        Parameters
+        ----------
+        A : sp.sparse.CSR
+            sparse matrix with the sparsity pattern of the initial matrix
+        '''
+        if use_pardiso:
+            # pardisoSolver passes its stored data array to every phase, so
+            # the values are replaced in place in its storage format
+            if self.pSolve.mtype in (2, -2, 4, -4, 6):
+                A = sp.sparse.triu(A, format='csr')
+            else:
+                A = sp.sparse.csr_matrix(A)
+            A.sort_indices()
+            self.pSolve.a[:] = A.data
+            self.pSolve.run_pardiso(22)
+            return
+        A_perm = sp.sparse.csc_matrix(A)[:, np.argsort(self.ordering)]
+        self.pSolve = sp.sparse.linalg.splu(A_perm, permc_spec='NATURAL')
+        self.reordered = True
+        return
+
     def clear(self):
         '''
         Clear the memory, if possible.
@@ -177,6 +258,81 @@ class SpSolve():
 
         return
 
+class DenseSolve():
+    '''
+    Solver class for solving the dense system Ax=b for multiple right hand
+    sides b with one factorization of A. It has the interface of SpSolve and
+    is used for the dense operators of reduced systems.
+
+    Symmetric matrices are factorized with a Cholesky factorization, if they
+    are positive definite, otherwise an LU factorization is used.
+    '''
+    def __init__(self, A, matrix_type='symm', verbose=False):
+        '''
+        Parameters
+        ----------
+        A : ndarray
+            dense matrix
+        matrixd_type : {'spd', 'symm', 'unsymm'}, optional
+            Specifier for the matrix type:
+
+        - 'spd' : symmetric positive definite
+        - 'symm' : symmetric indefinite
+        - 'unsymm' : generally unsymmetric
+        - 'complex_symm' : complex symmetric
+
+        verbose : bool
+            Flag for verbosity.
+        '''
+        self.cholesky = False
+        if matrix_type in ('spd', 'symm'):
+            try:
+                self.factor = sp.linalg.cho_factor(A)
+                self.cholesky = True
+            except np.linalg.LinAlgError:
+                pass
+        if not self.cholesky:
+            self.factor = sp.linalg.lu_factor(A)
+        if verbose:
+            print('Dense matrix factorized with',
+                  'Cholesky' if self.cholesky else 'LU', 'factorization.')
+
+    def solve(self, b):
+        '''
+        Solve the system for the given right hand side b.
+
+        Parameters
+        ----------
+        b : ndarray, shape (n,) or shape (n, m)
+            right hand side of equation.
+
+        Returns
+        -------
+        x : ndarray, shape (n,) or shape (n, m)
+            solution of the dense equation Ax=b
+
+        '''
+        b = _rhs_array(b)
+        if self.cholesky:
+            return sp.linalg.cho_solve(self.factor, b)
+        return sp.linalg.lu_solve(self.factor, b)
+
+    def clear(self):
+        '''
+        Clear the memory.
+        '''
+        self.factor = None
+        return
+
+def _factorize(A, matrix_type='symm'):
+    '''
+    Factorize A with SpSolve, if it is sparse, or with DenseSolve otherwise,
+    e.g. for the dense operators of a reduced system.
+    '''
+    if sp.sparse.issparse(A):
+        return SpSolve(A, matrix_type=matrix_type)
+    return DenseSolve(A, matrix_type=matrix_type)
+
 def integrate_nonlinear_gen_alpha(mechanical_system, q0, dq0, time_range, dt,
                                   rho_inf=0.9,
                                   rtol=1.0E-9,
@@ -416,6 +572,11 @@ def integrate_linear_gen_alpha(mechanical_system, q0, dq0, time_range, dt,
         high-frequency spectral radius
     ...
 
+    Notes
+    -----
+    For reduced systems, the dense reduced operators are factorized with
+    DenseSolve, so no sparse operations of the full size are done.
+
     TODO
 
     '''
@@ -449,7 +610,7 @@ def integrate_linear_gen_alpha(mechanical_system, q0, dq0, time_range, dt,
     time_index = 0
     h = dt
     S = (1-alpha_m)*M + h*gamma*(1-alpha_f)*D + h**2*beta*(1-alpha_f)*K
-    S_inv = SpSolve(S, matrix_type='symm')
+    S_inv = _factorize(S, matrix_type='symm')
 
     # time step loop
     while time_index < len(time_range):
@@ -722,6 +883,9 @@ def integrate_linear_system(mechanical_system, q0, dq0, time_range, dt, alpha=0)
     Due to round-off-errors, the internal time step width is h and is very
     close to dt, but adjusted to fit the steps exactly.
 
+    For reduced systems, the dense reduced operators are factorized with
+    DenseSolve, so no sparse operations of the full size are done.
+
     '''
     t_clock_1 = time.time()
     print('Starting linear time integration')
@@ -745,7 +909,7 @@ def integrate_linear_system(mechanical_system, q0, dq0, time_range, dt, alpha=0)
     D = mechanical_system.D()
     S = M + gamma * dt * D + beta * dt**2 * K
 #    S_inv = sp.sparse.linalg.splu(S)
-    S_inv = SpSolve(S, matrix_type='symm')
+    S_inv = _factorize(S, matrix_type='symm')
     # S_inv.solve(rhs_vec) # method to solve the system efficiently
     print('Iteration matrix successfully factorized. Starting time marching...')
     # initialization of the state variables
@@ -791,6 +955,404 @@ def integrate_linear_system(mechanical_system, q0, dq0, time_range, dt, alpha=0)
 
     return
 
+def _modal_propagators(omega, zeta, h):
+    r'''
+    Compute the exact discrete propagators of the decoupled modal equations
+
+    .. math::
+        \ddot x + 2 \zeta \omega \dot x + \omega^2 x = p(t)
+
+    for a load p varying linearly within the time step h.
+
+    Parameters
+    ----------
+    omega : ndarray, shape(n)
+        eigenfrequencies in rad/s
+    zeta : ndarray, shape(n)
+        modal damping ratios
+    h : float
+        time step size
+
+    Returns
+    -------
+    Phi : ndarray, shape(n, 2, 2)
+        transition matrices of the modal states [x, dx]
+    Gamma_0 : ndarray, shape(n, 2)
+        load vectors of the load at the beginning of the time step
+    Gamma_1 : ndarray, shape(n, 2)
+        load vectors of the load at the end of the time step
+
+    Notes
+    -----
+    The propagators are computed with the matrix exponential of the state
+    matrix augmented by the linear load p(tau) = p_0 + r*tau.
+
+    '''
+    n = len(omega)
+    Phi = np.zeros((n, 2, 2))
+    Gamma_0 = np.zeros((n, 2))
+    Gamma_1 = np.zeros((n, 2))
+    for i in range(n):
+        E = np.array([[0, 1, 0, 0],
+                      [-omega[i]**2, -2*zeta[i]*omega[i], 1, 0],
+                      [0, 0, 0, 1],
+                      [0, 0, 0, 0]])
+        exp_E = sp.linalg.expm(E*h)
+        Phi[i] = exp_E[:2, :2]
+        Gamma_0[i] = exp_E[:2, 2] - exp_E[:2, 3]/h
+        Gamma_1[i] = exp_E[:2, 3]/h
+    return Phi, Gamma_0, Gamma_1
+
+
+def integrate_linear_modal(mechanical_system, q0, dq0, time_range, dt, n=10,
+                           V=None, omega=None, zeta=None,
+                           mode_acceleration=False):
+    '''
+    Integrate the linearized system by modal superposition.
+
+    The decoupled modal equations are integrated exactly for an external
+    force which is linear between the sampling points of width dt. The
+    results are written to the mechanical system at the time steps given in
+    time_range.
+
+    Parameters
+    ----------
+    mechanical_system : instance of MechanicalSystem
+        Mechanical System which is linearized about the zero displacement.
+    q0 : ndarray
+        initial displacement
+    dq0 : ndarray
+        initial velocity
+    time_range : ndarray
+        array containing the time steps to be exported
+    dt : float
+        sampling interval of the external force.
+    n : int, optional
+        number of vibration modes computed with vibration_modes, if V is not
+        given. Default value: 10.
+    V : ndarray, optional
+        mass normalized vibration modes of the system, e.g. from
+        vibration_modes or compute_modes_pardiso. If None, the first n modes
+        are computed.
+    omega : ndarray, optional
+        eigenfrequencies in rad/s corresponding to V.
+    zeta : float or ndarray, optional
+        modal damping ratios. If None, the ratios are taken from the diagonal
+        of the modal damping matrix V.T @ D @ V, i.e. the damping is assumed
+        to be proportional. Default value: None.
+    mode_acceleration : bool, optional
+        Flag for the static correction of the truncated modes (mode
+        acceleration method). It requires one factorization of K and one
+        solve per exported time step. Default value: False.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    The external force is evaluated as ``f_ext(None, None, t)``, i.e. it
+    must not depend on the state of the system.
+
+    References
+    ----------
+    .. [1]  N. C. Nigam and P. C. Jennings: Calculation of response spectra
+            from strong-motion earthquake records. Bulletin of the
+            Seismological Society of America, 59(2):909-922, 1969.
+    .. [2]  M. Géradin and D. J. Rixen. Mechanical vibrations: theory and
+            application to structural dynamics. John Wiley & Sons, 2014.
+            pp. 150.
+
+    '''
+    t_clock_1 = time.time()
+    eps = 1E-12
+    mechanical_system.clear_timesteps()
+
+    if V is None:
+        from .reduced_basis import vibration_modes
+        omega, V = vibration_modes(mechanical_system, n=n)
+    elif omega is None:
+        raise ValueError('The eigenfrequencies omega have to be given with V.')
+    omega = abs(np.asarray(omega, dtype=float))
+    no_of_modes = V.shape[1]
+
+    M = mechanical_system.M()
+    if zeta is None:
+        D_modal = V.T @ (mechanical_system.D() @ V)
+        zeta = np.zeros(no_of_modes)
+        nonzero = omega > eps
+        zeta[nonzero] = np.diag(D_modal)[nonzero] / (2*omega[nonzero])
+    zeta = np.ones(no_of_modes)*zeta
+
+    if mode_acceleration:
+        K_inv = SpSolve(mechanical_system.K())
+        omega_inv_2 = np.zeros(no_of_modes)
+        omega_inv_2[omega > eps] = 1/omega[omega > eps]**2
+
+    # modal initial conditions
+    x = V.T @ (M @ q0)
+    dx = V.T @ (M @ dq0)
+    f_ext = mechanical_system.f_ext(None, None, 0)
+    p = V.T @ f_ext
+
+    propagators = dict()
+    t = 0
+    h = dt
+    time_index = 0
+    while time_index < len(time_range):
+
+        if t + eps >= time_range[time_index]:
+            q = V @ x
+            if mode_acceleration:
+                q += K_inv.solve(f_ext) - V @ (omega_inv_2 * p)
+            mechanical_system.write_timestep(t, q)
+            time_index += 1
+            if time_index == len(time_range):
+                break
+
+        # adjustment of dt
+        if t + eps + dt >= time_range[time_index]:
+            h = time_range[time_index] - t
+        else:
+            h = dt
+
+        # the propagators are computed once for every step size
+        key = round(h/eps)
+        if key not in propagators:
+            propagators[key] = _modal_propagators(omega, zeta, h)
+        Phi, Gamma_0, Gamma_1 = propagators[key]
+
+        t += h
+        f_ext = mechanical_system.f_ext(None, None, t)
+        p_old = p
+        p = V.T @ f_ext
+        x, dx = (Phi[:,0,0]*x + Phi[:,0,1]*dx
+                 + Gamma_0[:,0]*p_old + Gamma_1[:,0]*p,
+                 Phi[:,1,0]*x + Phi[:,1,1]*dx
+                 + Gamma_0[:,1]*p_old + Gamma_1[:,1]*p)
+
+    if mode_acceleration:
+        K_inv.clear()
+    t_clock_2 = time.time()
+    print('Time for modal time integration: {0:4.2f} seconds'.format(
+        t_clock_2 - t_clock_1))
+    return
+
+# system matrices of the worker processes of solve_harmonic
+_harmonic_matrices = None
+
+
+def _init_harmonic_worker(K, D, M, f, matrix_type):
+    '''
+    Initializer of the worker processes of solve_harmonic.
+    '''
+    global _harmonic_matrices
+    _harmonic_matrices = (K, D, M, f, matrix_type)
+
+
+def _harmonic_block_worker(omegas):
+    '''
+    Solve a block of frequencies with the matrices of the worker process.
+    '''
+    K, D, M, f, matrix_type = _harmonic_matrices
+    return _harmonic_block(K, D, M, f, omegas, matrix_type)
+
+
+def _harmonic_block(K, D, M, f, omegas, matrix_type='complex_symm'):
+    '''
+    Solve the harmonic problem (K + i*omega*D - omega**2*M) x = f for a block
+    of frequencies.
+
+    The dynamic stiffness matrices of all frequencies are built on the common
+    sparsity pattern of K, D and M. Hence, the fill reducing ordering of the
+    first factorization is reused for all other frequencies of the block:
+    With Pardiso, the symbolic analysis is run once per block and only the
+    numerical factorization is repeated per frequency.
+
+    Parameters
+    ----------
+    K, D, M : sparse matrices or ndarrays
+        stiffness, damping and mass matrix
+    f : ndarray
+        load amplitude
+    omegas : ndarray
+        frequencies in rad/s
+
+    Returns
+    -------
+    X : ndarray, shape(ndof, len(omegas))
+        complex amplitudes of the displacements
+    '''
+    f = f.astype(complex)
+    X = np.zeros((f.shape[0], len(omegas)), dtype=complex)
+    if not sp.sparse.issparse(K):
+        for k, omega in enumerate(omegas):
+            X[:,k] = sp.linalg.solve(K + 1j*omega*D - omega**2*M, f)
+        return X
+
+    # values of K, D and M on the common pattern; the pattern of the sum
+    # might change with omega otherwise, e.g. for omega = 0
+    pattern = sp.sparse.csr_matrix(abs(K) + abs(D) + abs(M))
+    pattern.sort_indices()
+    pattern_coo = pattern.tocoo()
+    K_data, D_data, M_data = [
+        np.asarray(sp.sparse.csr_matrix(A)[pattern_coo.row,
+                                           pattern_coo.col]).ravel()
+        for A in (K, D, M)]
+    LU_object = None
+    try:
+        for k, omega in enumerate(omegas):
+            A = sp.sparse.csr_matrix(
+                (K_data + 1j*omega*D_data - omega**2*M_data,
+                 pattern.indices, pattern.indptr), shape=pattern.shape)
+            if LU_object is None:
+                LU_object = SpSolve(A, matrix_type=matrix_type)
+            else:
+                LU_object.update(A)
+            X[:,k] = LU_object.solve(f)
+    finally:
+        if LU_object is not None:
+            LU_object.clear()
+    return X
+
+
+def solve_harmonic(mechanical_system, omegas, f=None, modal=False, n=20,
+                   V=None, omega=None, block_size=20, no_of_processes=1,
+                   h5filename=None, verbose=True):
+    r'''
+    Solve the frequency response of the linearized mechanical system
+
+    .. math::
+        (K + i \Omega D - \Omega^2 M) \hat x = \hat f
+
+    for a list of excitation frequencies.
+
+    K, M and D are assembled once. The frequencies are processed in blocks,
+    which can be solved in parallel processes, and the results can be
+    streamed block by block to a HDF5-file.
+
+    Parameters
+    ----------
+    mechanical_system : instance of MechanicalSystem
+        Mechanical System which is linearized about the zero displacement.
+    omegas : ndarray
+        excitation frequencies in rad/s
+    f : ndarray, optional
+        complex amplitude of the external force in constrained coordinates.
+        If None, ``f_ext(None, None, 1)`` of the mechanical system is taken.
+    modal : bool, optional
+        Flag for the solution in the modal subspace. The modal system with the
+        projected damping matrix V.T @ D @ V is solved densely, which is
+        efficient for dense frequency sweeps. Default value: False.
+    n : int, optional
+        number of vibration modes computed with vibration_modes for the modal
+        solution, if V is not given. Default value: 20.
+    V : ndarray, optional
+        mass normalized vibration modes for the modal solution.
+    omega : ndarray, optional
+        eigenfrequencies in rad/s corresponding to V.
+    block_size : int, optional
+        number of frequencies solved in one block. Default value: 20.
+    no_of_processes : int, optional
+        number of processes for the solution of the frequency blocks. Default
+        value: 1, i.e. no parallelization.
+    h5filename : str, optional
+        If given, the frequencies and the complex amplitudes are written to
+        the datasets 'harmonic/omega' and 'harmonic/x' of the HDF5-file and
+        not kept in memory. Default value: None.
+    verbose : bool, optional
+        Flag for verbose output. Default value: True.
+
+    Returns
+    -------
+    X : ndarray, shape(ndof, len(omegas))
+        complex amplitudes of the displacement in constrained coordinates.
+        If h5filename is given, None is returned.
+
+    '''
+    t_clock_1 = time.time()
+    omegas = np.atleast_1d(np.asarray(omegas, dtype=float))
+    if f is None:
+        f = mechanical_system.f_ext(None, None, 1)
+
+    if modal:
+        if V is None:
+            from .reduced_basis import vibration_modes
+            omega, V = vibration_modes(mechanical_system, n=n)
+        elif omega is None:
+            raise ValueError('The eigenfrequencies omega have to be given '
+                             + 'with V.')
+        K = np.diag(np.asarray(omega, dtype=float)**2)
+        M = np.eye(V.shape[1])
+        D = V.T @ (mechanical_system.D() @ V)
+        f_solve = V.T @ f
+    else:
+        K = mechanical_system.K()
+        M = mechanical_system.M()
+        D = mechanical_system.D()
+        f_solve = f
+    ndof = f.shape[0]
+
+    no_of_blocks = int(np.ceil(len(omegas) / block_size))
+    blocks = np.array_split(np.arange(len(omegas)), no_of_blocks)
+
+    h5file = None
+    pool = None
+    try:
+        if h5filename is not None:
+            import h5py
+            h5file = h5py.File(h5filename, 'w')
+            h5file.create_dataset('harmonic/omega', data=omegas)
+            X_out = h5file.create_dataset('harmonic/x', (ndof, len(omegas)),
+                                          dtype=complex)
+        else:
+            X_out = np.zeros((ndof, len(omegas)), dtype=complex)
+
+        if modal:
+            # all modal systems are solved in one vectorized dense call per
+            # block; the right hand sides are passed as stacked (n, 1)
+            # matrices
+            results = (np.linalg.solve(K + 1j*omegas[idx,None,None]*D
+                                       - omegas[idx,None,None]**2*M,
+                                       np.tile(f_solve,
+                                               (len(idx), 1))[...,None]
+                                      )[...,0].T
+                       for idx in blocks)
+        elif no_of_processes > 1:
+            # the matrices are sent once per process, the jobs only carry
+            # the frequencies
+            pool = mp.Pool(no_of_processes,
+                           initializer=_init_harmonic_worker,
+                           initargs=(K, D, M, f_solve, 'complex_symm'))
+            jobs = [pool.apply_async(_harmonic_block_worker, (omegas[idx],))
+                    for idx in blocks]
+            results = (job.get() for job in jobs)
+        else:
+            results = (_harmonic_block(K, D, M, f_solve, omegas[idx])
+                       for idx in blocks)
+
+        for idx, X_block in zip(blocks, results):
+            if modal:
+                X_block = V @ X_block
+            X_out[:, idx[0]:idx[-1]+1] = X_block
+            if verbose:
+                print('Harmonic solution for omega = {0:4.2f} to '
+                      .format(omegas[idx[0]])
+                      + '{0:4.2f} rad/s done.'.format(omegas[idx[-1]]))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if h5file is not None:
+            h5file.close()
+    if h5filename is not None:
+        X_out = None
+
+    t_clock_2 = time.time()
+    print('Time for harmonic solution of {0} frequencies: '.format(len(omegas))
+          + '{0:4.2f} seconds'.format(t_clock_2 - t_clock_1))
+    return X_out
+
 def solve_linear_displacement(mechanical_system, t=1, verbose=True):
     '''
     Solve the linear static problem of the mechanical system and print
@@ -826,6 +1388,101 @@ def solve_linear_displacement(mechanical_system, t=1, verbose=True):
     return u
 
 
+def solve_linear_load_cases(mechanical_system, F=None, t=None,
+                            block_size=100, save=False, h5filename=None,
+                            verbose=True):
+    '''
+    Solve the linear static problem of the mechanical system for many load
+    cases with one factorization of the stiffness matrix.
+
+    Parameters
+    ----------
+    mechanical_system : Instance of the class MechanicalSystem
+        Mechanical system to be solved.
+    F : ndarray, shape(ndof, no_of_load_cases), optional
+        external forces in constrained coordinates; every column is one load
+        case.
+    t : array_like, optional
+        times for the external force call ``f_ext(None, None, t)`` in the
+        mechanical system; every time is one load case, e.g. for several
+        Neumann boundary conditions switched on and off by their time
+        functions. Only used, if F is None.
+    block_size : int, optional
+        number of load cases solved as one block of right hand sides.
+        Default value: 100.
+    save : bool, optional
+        Flag for writing the load cases to the mechanical system with the
+        load case number as time (or the given times t). Default value: False.
+    h5filename : str, optional
+        If given, the displacements are written block by block to the dataset
+        'load_cases/u' of the HDF5-file and not kept in memory.
+        Default value: None.
+    verbose : bool, optional
+        Flag for verbose output.
+
+    Returns
+    -------
+    U : ndarray, shape(ndof, no_of_load_cases)
+        static displacements in constrained coordinates; U[:,i] is the
+        solution of the i-th load case. If h5filename is given, None is
+        returned.
+
+    '''
+    t_clock_1 = time.time()
+    if F is None and t is None:
+        raise ValueError('Either the forces F or the times t have to be given.')
+    if F is not None:
+        F = F.reshape((F.shape[0], -1))
+        no_of_load_cases = F.shape[1]
+        case_times = np.arange(no_of_load_cases)
+    else:
+        case_times = np.atleast_1d(t)
+        no_of_load_cases = len(case_times)
+
+    if verbose:
+        print('Assembling and factorizing the stiffness matrix')
+    K = mechanical_system.K()
+    ndof = K.shape[0]
+    K_inv = SpSolve(K)
+
+    if h5filename is not None:
+        import h5py
+        h5file = h5py.File(h5filename, 'w')
+        h5file.create_dataset('load_cases/time', data=case_times)
+        U = h5file.create_dataset('load_cases/u', (ndof, no_of_load_cases),
+                                  dtype=float, chunks=(ndof, min(block_size,
+                                                    no_of_load_cases)))
+    else:
+        U = np.zeros((ndof, no_of_load_cases))
+
+    if save:
+        mechanical_system.clear_timesteps()
+
+    for start in range(0, no_of_load_cases, block_size):
+        stop = min(start + block_size, no_of_load_cases)
+        if F is not None:
+            F_block = F[:, start:stop]
+        else:
+            F_block = np.array([mechanical_system.f_ext(None, None, t_case)
+                                for t_case in case_times[start:stop]]).T
+        U_block = K_inv.solve(F_block).reshape((ndof, -1))
+        U[:, start:stop] = U_block
+        if save:
+            for i, t_case in enumerate(case_times[start:stop]):
+                mechanical_system.write_timestep(t_case, U_block[:,i])
+        if verbose:
+            print('Load cases {0} to {1} solved.'.format(start, stop-1))
+
+    K_inv.clear()
+    if h5filename is not None:
+        h5file.close()
+        U = None
+    t_clock_2 = time.time()
+    print('Time for solving {0} linear load cases: '.format(no_of_load_cases)
+          + '{0:4.2f} seconds'.format(t_clock_2 - t_clock_1))
+    return U
+
+
 def solve_nonlinear_displacement(mechanical_system, no_of_load_steps=10,
                                  t=0, rtol=1E-8, atol=1E-14, newton_damping=1,
                                  n_max_iter=1000,
@@ -835,6 +1492,12 @@ def solve_nonlinear_displacement(mechanical_system, no_of_load_steps=10,
                                  write_iter=False,
                                  conv_abort=True,
                                  save=True,
+                                 adaptive=False,
+                                 arc_length=False,
+                                 predictor=False,
+                                 n_iter_opt=4,
+                                 min_stepwidth=1E-6,
+                                 max_stepwidth=0.5,
                                  ):
     '''
     Solver for the nonlinear system applied directly on the mechanical system.
@@ -847,7 +1510,8 @@ def solve_nonlinear_displacement(mechanical_system, no_of_load_steps=10,
         Instance of the class MechanicalSystem
     no_of_load_steps : int
         Number of equally spaced load steps which are applied in order to
-        receive the solution
+        receive the solution. If adaptive or arc_length is set, this is the
+        number of load steps the initial increment is chosen for.
     t : float, optional
         time for the external force call in mechanical_system
     rtol : float, optional
@@ -881,7 +1545,33 @@ def solve_nonlinear_displacement(mechanical_system, no_of_load_steps=10,
     save : bool, optional
         Write the resulting load steps to the MechanicalSystem to export
         it afterwards. Default value: True
-
+    adaptive : bool, optional
+        Flag for automatic load increment control. The load increment is
+        enlarged, when the Newton-Loop converges in less than n_iter_opt
+        iterations and diminished otherwise. If a load step does not converge
+        within min(n_max_iter, 3*n_iter_opt) iterations, it is cut back to
+        half of its size and repeated. Default value: False.
+    arc_length : bool, optional
+        Flag for arc-length continuation (Riks-method with updated normal
+        plane constraint). It allows to pass limit points of the load
+        displacement path. The external force has to be linear in the load
+        parameter t, i.e. ``f_ext(u, du, t) = t*f_ext(u, du, 1)``. The arc
+        length is controlled adaptively in the same way as the load
+        increment for the adaptive flag. Default value: False.
+    predictor : bool, optional
+        Flag for the extrapolation of the displacements of the previous two
+        converged load steps as start value for the Newton-Loop. Default
+        value: False.
+    n_iter_opt : int, optional
+        Desired number of Newton iterations per load step for the adaptive
+        step size control. Default value: 4.
+    min_stepwidth : float, optional
+        Minimum load increment for adaptive and arc_length. If the load
+        increment has to be cut back below this value, the computation is
+        aborted if conv_abort is True. Otherwise the unconverged load step
+        is accepted and the computation continues. Default value: 1E-6.
+    max_stepwidth : float, optional
+        Maximum load increment for adaptive and arc_length. Default value: 0.5.
 
     Returns
     -------
@@ -892,7 +1582,25 @@ def solve_nonlinear_displacement(mechanical_system, no_of_load_steps=10,
     ---------
     TODO
 
+    References
+    ----------
+    .. [1]  M. A. Crisfield: Non-linear Finite Element Analysis of Solids and
+            Structures. Volume 1. John Wiley & Sons, 1991. pp. 266.
+    .. [2]  E. Ramm: Strategies for tracing the nonlinear response near limit
+            points. Nonlinear Finite Element Analysis in Structural Mechanics,
+            Springer, 1981. pp. 63-89.
+
     '''
+    if adaptive or arc_length:
+        return _solve_nonlinear_displacement_adaptive(
+            mechanical_system, no_of_load_steps=no_of_load_steps, rtol=rtol,
+            atol=atol, newton_damping=newton_damping, n_max_iter=n_max_iter,
+            smplfd_nwtn_itr=smplfd_nwtn_itr, verbose=verbose,
+            track_niter=track_niter, write_iter=write_iter,
+            conv_abort=conv_abort, save=save, arc_length=arc_length,
+            predictor=predictor, n_iter_opt=n_iter_opt,
+            min_stepwidth=min_stepwidth, max_stepwidth=max_stepwidth)
+
     t_clock_1 = time.time()
     iteration_info = [] # List tracking the number of iterations
     mechanical_system.clear_timesteps()
@@ -905,11 +1613,14 @@ def solve_nonlinear_displacement(mechanical_system, no_of_load_steps=10,
 #     ndof = mechanical_system.dirichlet_class.no_of_constrained_dofs
     u = np.zeros(ndof)
     du = np.zeros(ndof)
+    u_old = np.zeros(ndof)
     mechanical_system.write_timestep(0, u) # initial write
 
     for t in np.arange(stepwidth, 1+stepwidth, stepwidth):
 
         # prediction
+        if predictor:
+            u, u_old = 2*u - u_old, u.copy()
         K, f_int= mechanical_system.K_and_f(u, t)
         f_ext = mechanical_system.f_ext(u, du, t)
         res = - f_int + f_ext
@@ -960,3 +1671,193 @@ def solve_nonlinear_displacement(mechanical_system, no_of_load_steps=10,
         t_clock_2 - t_clock_1))
     return u_output
 
+
+def _solve_nonlinear_displacement_adaptive(mechanical_system,
+                                           no_of_load_steps=10,
+                                           rtol=1E-8,
+                                           atol=1E-14,
+                                           newton_damping=1,
+                                           n_max_iter=1000,
+                                           smplfd_nwtn_itr=1,
+                                           verbose=True,
+                                           track_niter=False,
+                                           write_iter=False,
+                                           conv_abort=True,
+                                           save=True,
+                                           arc_length=False,
+                                           predictor=False,
+                                           n_iter_opt=4,
+                                           min_stepwidth=1E-6,
+                                           max_stepwidth=0.5):
+    '''
+    Static solver with adaptive load increment control and optional
+    arc-length continuation. See solve_nonlinear_displacement for the
+    description of the parameters.
+
+    The size of the next increment is scaled with sqrt(n_iter_opt/n_iter)
+    after every converged step (Crisfield); a step which does not converge is
+    cut back to half of its size and repeated. If the increment would drop
+    below min_stepwidth, the computation is aborted for conv_abort=True;
+    otherwise the unconverged step is accepted like in the solver with fixed
+    load steps.
+
+    Returns
+    -------
+    u : ndarray, shape(ndim, no_of_converged_load_steps)
+        Solution displacements; u[:,-1] is the last displacement
+
+    '''
+    t_clock_1 = time.time()
+    eps = 1E-12
+    iteration_info = [] # List tracking the number of iterations
+    mechanical_system.clear_timesteps()
+    n_iter_max_step = min(n_max_iter, 3*n_iter_opt)
+
+    u_output = []
+    stepwidth = min(1/no_of_load_steps, max_stepwidth)
+    K, f_int = mechanical_system.K_and_f()
+    ndof = K.shape[0]
+    u = np.zeros(ndof)
+    du = np.zeros(ndof)
+    mechanical_system.write_timestep(0, u) # initial write
+
+    if arc_length:
+        # reference load; f_ext is assumed to be linear in the load parameter
+        f_ref = mechanical_system.f_ext(u, du, 1)
+        u_t = solve_sparse(K, f_ref)
+        ds_scale = norm_of_vector(u_t)
+        delta_u_old = u_t
+        no_of_factorizations = 1
+    else:
+        no_of_factorizations = 0
+
+    lam = 0
+    # state of the last but one converged step for the predictor
+    lam_prev = 0
+    u_prev = u.copy()
+    no_of_assemblies = 1
+    no_of_cutbacks = 0
+
+    while lam < 1 - eps:
+        u_old = u.copy()
+        lam_old = lam
+        K_old = K
+
+        if arc_length:
+            # tangent predictor with the stiffness of the converged state
+            K_inv = SpSolve(K)
+            u_t = K_inv.solve(f_ref)
+            K_inv.clear()
+            no_of_factorizations += 1
+            dlam = stepwidth*ds_scale / norm_of_vector(u_t)
+            # keep the direction of the path (sign of the previous increment)
+            if u_t @ delta_u_old < 0:
+                dlam *= -1
+            load_control = lam + dlam > 1 - eps
+            if load_control:
+                dlam = 1 - lam
+            delta_u = dlam*u_t
+            delta_lam = dlam
+        else:
+            delta_lam = min(stepwidth, 1 - lam)
+            delta_u = np.zeros(ndof)
+            if predictor and lam_old > lam_prev:
+                delta_u = (u_old - u_prev) * delta_lam / (lam_old - lam_prev)
+
+        u = u_old + delta_u
+        lam = lam_old + delta_lam
+
+        # Newton-Loop
+        n_iter = 0
+        converged = False
+        while True:
+            K_new, f_int = mechanical_system.K_and_f(u, lam)
+            no_of_assemblies += 1
+            if arc_length or (n_iter % smplfd_nwtn_itr) == 0:
+                K = K_new
+            if arc_length:
+                f_ext = lam*f_ref
+            else:
+                f_ext = mechanical_system.f_ext(u, du, lam)
+            res = - f_int + f_ext
+            abs_res = norm_of_vector(res)
+            abs_f_ext = norm_of_vector(f_ext)
+
+            if verbose:
+                print('Step', lam, 'Iteration #', n_iter,
+                      'Residal: {0:4.2E}'.format(abs_res))
+            if write_iter:
+                mechanical_system.write_timestep(lam + n_iter*0.0001, u)
+
+            if abs_res <= rtol*abs_f_ext + atol:
+                converged = True
+                break
+            if n_iter >= n_iter_max_step or not np.isfinite(abs_res):
+                break
+
+            if arc_length:
+                K_inv = SpSolve(K)
+                du_r = K_inv.solve(res)
+                du_t = K_inv.solve(f_ref)
+                K_inv.clear()
+                no_of_factorizations += 1
+                if load_control:
+                    dlam = 0
+                else:
+                    # updated normal plane constraint: delta_u @ corr = 0
+                    dlam = - (delta_u @ du_r) / (delta_u @ du_t)
+                corr = du_r + dlam*du_t
+                delta_lam += dlam
+                lam = lam_old + delta_lam
+            else:
+                corr = solve_sparse(K, res)*newton_damping
+                no_of_factorizations += 1
+            delta_u += corr
+            u = u_old + delta_u
+            n_iter += 1
+
+        if not converged and stepwidth/2 >= min_stepwidth:
+            # cut back the load increment and repeat the step
+            u = u_old
+            lam = lam_old
+            stepwidth /= 2
+            no_of_cutbacks += 1
+            if verbose:
+                print('No convergence in load step. Cutting back the',
+                      'increment to {0:4.2E}.'.format(stepwidth))
+            K = K_old
+            continue
+        if not converged:
+            if conv_abort or not np.isfinite(abs_res):
+                print(abort_statement)
+                break
+            # accept the unconverged step as the fixed step solver does
+            if verbose:
+                print('No convergence in load step with the minimum',
+                      'increment. Continuing with residual',
+                      '{0:4.2E}.'.format(abs_res))
+
+        if save:
+            mechanical_system.write_timestep(lam, u)
+        u_output.append(u.copy())
+        if track_niter:
+            iteration_info.append((lam, n_iter, abs_res))
+
+        if arc_length:
+            delta_u_old = delta_u
+        u_prev = u_old
+        lam_prev = lam_old
+        # adapt the increment to the convergence behavior
+        stepwidth *= np.sqrt(n_iter_opt / max(n_iter, 1))
+        stepwidth = min(max(stepwidth, min_stepwidth), max_stepwidth)
+
+    # glue the array of the iterations on the mechanical system
+    mechanical_system.iteration_info = np.array(iteration_info)
+    print('Load steps: {0}, cutbacks: {1}, assemblies: {2}, '.format(
+        len(u_output), no_of_cutbacks, no_of_assemblies)
+          + 'factorizations: {0}'.format(no_of_factorizations))
+    u_output = np.array(u_output).T
+    t_clock_2 = time.time()
+    print('Time for solving nonlinear displacements: {0:4.2f} seconds'.format(
+        t_clock_2 - t_clock_1))
+    return u_output
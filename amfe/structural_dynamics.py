@@ -120,22 +120,23 @@ def force_norm(F, K, M, norm='euclidean'):
         norm of the given force vector or array. When F is an array with m
         columns, norm is a vector with the norm given for every column
     '''
-    # define diag operator which also works for floats
+    # column-wise inner product which also works for vectors; the
+    # displacements of all columns are computed with one block solve
     if len(F.shape) == 1:
-        diag = lambda x : x
+        inner = lambda x, y : x @ y
     elif len(F.shape) == 2:
-        diag = np.diag
+        inner = lambda x, y : np.einsum('ij, ij->j', x, y)
     else:
         raise ValueError('Dimension mismatch')
 
     if norm == 'euclidean':
-        output =  np.sqrt(diag(F.T @ F))
+        output =  np.sqrt(inner(F, F))
     elif norm == 'impedance':
-        u = solve_sparse(K, F)
-        output =  np.sqrt(diag(F.T @ u))
+        u = solve_sparse(K, F).reshape(F.shape)
+        output =  np.sqrt(inner(F, u))
     elif norm == 'kinetic':
-        u = solve_sparse(K, F)
-        output = np.sqrt(diag(u.T @ M @ u))
+        u = solve_sparse(K, F).reshape(F.shape)
+        output = np.sqrt(inner(u, M @ u))
 
     return output
 
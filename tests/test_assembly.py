@@ -24,3 +24,29 @@ def test_index_getter():
         #    print(val[i] - A.data[b])
         assert_equal(A.data[a], b)
 
+
+
+def test_f_nl_unassembled_snapshots():
+    mesh = amfe.Mesh()
+    mesh.import_msh(amfe.amfe_dir('meshes/test_meshes/bar_Quad4_simple.msh'))
+    material = amfe.KirchhoffMaterial(E=210E9, nu=0.3, rho=1E4,
+                                      plane_stress=True)
+    mesh.load_group_to_mesh(6, material, mesh_prop='geom_entity')
+    assembly = amfe.Assembly(mesh)
+    assembly.nodes_voigt = mesh.nodes.reshape(-1)
+    assembly.compute_element_indices()
+    rng = np.random.RandomState(5)
+    U = rng.rand(mesh.no_of_dofs, 5)*1E-2
+
+    F = assembly.f_nl_unassembled_snapshots(U)
+    for j, u in enumerate(U.T):
+        f_ref = []
+        for i, indices in enumerate(assembly.element_indices):
+            X_local = assembly.nodes_voigt[indices]
+            f_ele = mesh.ele_obj[i].f_int(X_local, u[indices]).copy()
+            K0_ele = mesh.ele_obj[i].k_int(X_local, 0*u[indices])
+            f_ref.append(f_ele - K0_ele @ u[indices])
+        f_ref = np.concatenate(f_ref)
+        np.testing.assert_allclose(F[:,j], f_ref, rtol=1E-10,
+                                   atol=1E-10*abs(f_ref).max())
+        np.testing.assert_allclose(assembly.f_nl_unassembled(u), F[:,j])
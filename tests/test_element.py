@@ -63,6 +63,16 @@ class ElementTest(unittest.TestCase):
         K_finite_diff = jacobian(self.my_element.f_int, self.X, self.u, t=0)
         np.testing.assert_allclose(K, K_finite_diff, rtol=rtol, atol=atol)
 
+    @nose.tools.nottest
+    def dk_dv_test_element(self, rtol=1E-5, atol=1E-6):
+        v = sp.rand(len(self.u))
+        h = 1E-6
+        dK = self.my_element.dk_dv_int(self.X, self.u, v, t=0)
+        K_plus = self.my_element.k_int(self.X, self.u + h*v, t=0).copy()
+        K_minus = self.my_element.k_int(self.X, self.u - h*v, t=0).copy()
+        dK_finite_diff = (K_plus - K_minus) / (2*h)
+        np.testing.assert_allclose(dK, dK_finite_diff, rtol=rtol, atol=atol)
+
     @nose.tools.nottest
     def check_python_vs_fortran(self):
         # python routine
@@ -87,6 +97,9 @@ class Tri3Test(ElementTest):
     def test_jacobi(self):
         self.jacobi_test_element()
 
+    def test_dk_dv(self):
+        self.dk_dv_test_element()
+
     def test_mass(self):
         X = np.array([0,0,3,1,2,2.])
         u = np.zeros(6)
@@ -100,6 +113,9 @@ class Tri6Test(ElementTest):
     def test_jacobi(self):
         self.jacobi_test_element(rtol=1E-3)
 
+    def test_dk_dv(self):
+        self.dk_dv_test_element()
+
 class Quad4Test(ElementTest):
     def setUp(self):
         self.initialize_element(Quad4, X_quad4)
@@ -107,6 +123,9 @@ class Quad4Test(ElementTest):
     def test_jacobi(self):
         self.jacobi_test_element()
 
+    def test_dk_dv(self):
+        self.dk_dv_test_element()
+
 
 class Quad8Test(ElementTest):
     def setUp(self):
@@ -115,6 +134,30 @@ class Quad8Test(ElementTest):
     def test_jacobi(self):
         self.jacobi_test_element(rtol=1E-3)
 
+    def test_dk_dv(self):
+        self.dk_dv_test_element()
+
+class DkDvFallbackTest(ElementTest):
+    def setUp(self):
+        self.initialize_element(Quad4, X_quad4)
+
+    def test_finite_difference_fallback(self):
+        v = sp.rand(len(self.u))
+        dK = self.my_element.dk_dv_int(self.X, self.u, v, t=0)
+        dK_fd = self.my_element._dk_dv_finite_difference(self.X, self.u, v,
+                                                          t=0)
+        np.testing.assert_allclose(dK_fd, dK, rtol=1E-5, atol=1E-6)
+
+    def test_elements_without_gauss_points(self):
+        prism = amfe.element.Prism6(self.my_material)
+        X = sp.rand(18)
+        dK = prism.dk_dv_int(X, sp.rand(18), sp.rand(18))
+        assert_allclose(dK, np.zeros((18, 18)))
+        bar = amfe.element.Bar2Dlumped(self.my_material)
+        dK = bar.dk_dv_int(sp.rand(4), sp.rand(4), sp.rand(4))
+        assert_allclose(dK, np.zeros((4, 4)))
+
+
 class Tet4Test(ElementTest):
     def setUp(self):
         self.initialize_element(Tet4, X_tet4)
@@ -122,6 +165,9 @@ class Tet4Test(ElementTest):
     def test_jacobi(self):
         self.jacobi_test_element()
 
+    def test_dk_dv(self):
+        self.dk_dv_test_element()
+
 class Tet10Test(ElementTest):
     def setUp(self):
         self.initialize_element(Tet10, X_tet10)
@@ -129,6 +175,9 @@ class Tet10Test(ElementTest):
     def test_jacobi(self):
         self.jacobi_test_element(rtol=2E-3)
 
+    def test_dk_dv(self):
+        self.dk_dv_test_element()
+
 class Hexa8Test(ElementTest):
     def setUp(self):
         self.initialize_element(Hexa8, X_hexa8)
@@ -136,6 +185,9 @@ class Hexa8Test(ElementTest):
     def test_jacobi(self):
         self.jacobi_test_element(rtol=2E-3)
 
+    def test_dk_dv(self):
+        self.dk_dv_test_element()
+
     def test_mass(self):
         my_material = material.KirchhoffMaterial(E=60, nu=1/4, rho=1, thickness=1)
         my_element = Hexa8(my_material)
@@ -149,6 +201,9 @@ class Hexa20Test(ElementTest):
     def test_jacobi(self):
         self.jacobi_test_element(rtol=5E-3)
 
+    def test_dk_dv(self):
+        self.dk_dv_test_element()
+
     def test_mass(self):
         my_material = material.KirchhoffMaterial(E=60, nu=1/4, rho=1, thickness=1)
         my_element = Hexa20(my_material)
@@ -173,6 +228,7 @@ class MaterialTest3D(ElementTest):
         my_material = material.MooneyRivlin(A10, A01, kappa, rho)
         self.my_element.material = my_material
         self.jacobi_test_element(rtol=1E-3)
+        self.dk_dv_test_element()
 
     def test_Neo(self):
         mu, kappa, rho = sp.rand(3)*1E3 + 100
@@ -181,6 +237,7 @@ class MaterialTest3D(ElementTest):
         my_material = material.NeoHookean(mu, kappa, rho)
         self.my_element.material = my_material
         self.jacobi_test_element(rtol=5E-4)
+        self.dk_dv_test_element()
 
 class MaterialTest2D(ElementTest):
     '''
@@ -196,6 +253,7 @@ class MaterialTest2D(ElementTest):
         my_material = material.MooneyRivlin(A10, A01, kappa, rho)
         self.my_element.material = my_material
         self.jacobi_test_element(rtol=5E-4)
+        self.dk_dv_test_element()
 
     def test_Neo(self):
         mu, kappa, rho = sp.rand(3)*1E3 + 100
@@ -204,6 +262,7 @@ class MaterialTest2D(ElementTest):
         my_material = material.NeoHookean(mu, kappa, rho)
         self.my_element.material = my_material
         self.jacobi_test_element()
+        self.dk_dv_test_element()
 
 
 
@@ -93,6 +93,48 @@ class IntegratorTest(unittest.TestCase):
         # np.testing.assert_allclose(q_nl, q_lin, rtol=1E-1, atol=1E-4)
         return q_nl, q_lin, t_lin
 
+    def test_modal_vs_linear_integrator(self):
+        dt = 1E-3
+        system1 = self.my_system
+        system2 = copy.deepcopy(self.my_system)
+        lambda_, V = sp.linalg.eigh(system1.K(), system1.M())
+        omega = np.sqrt(lambda_)
+
+        amfe.integrate_linear_system(system1, self.q_start, self.dq_start,
+                                     self.T, dt)
+        amfe.integrate_linear_modal(system2, self.q_start, self.dq_start,
+                                    self.T, dt, V=V, omega=omega)
+
+        np.testing.assert_allclose(np.array(system2.t), np.array(system1.t),
+                                   atol=1E-10)
+        np.testing.assert_allclose(np.array(system2.q), np.array(system1.q),
+                                   atol=1E-3)
+
+    def test_modal_mode_acceleration(self):
+        dt = 1E-2
+        # slowly varying force, where the truncated mode responds statically
+        def f_ext(q, dq, t):
+            return np.array([0, 0., 5*(1 - np.cos(0.2*t))])
+        system_full = DynamicalSystem(self.my_system.K(), self.my_system.M(),
+                                      f_ext)
+        system_trunc = copy.deepcopy(system_full)
+        system_ma = copy.deepcopy(system_full)
+        lambda_, V = sp.linalg.eigh(system_full.K(), system_full.M())
+        omega = np.sqrt(lambda_)
+
+        amfe.integrate_linear_modal(system_full, self.q_start, self.dq_start,
+                                    self.T, dt, V=V, omega=omega)
+        amfe.integrate_linear_modal(system_trunc, self.q_start,
+                                    self.dq_start, self.T, dt, V=V[:,:2],
+                                    omega=omega[:2])
+        amfe.integrate_linear_modal(system_ma, self.q_start, self.dq_start,
+                                    self.T, dt, V=V[:,:2], omega=omega[:2],
+                                    mode_acceleration=True)
+        q_full = np.array(system_full.q)
+        error_trunc = np.linalg.norm(np.array(system_trunc.q) - q_full)
+        error_ma = np.linalg.norm(np.array(system_ma.q) - q_full)
+        self.assertLess(error_ma, 0.1*error_trunc)
+
 if __name__ == '__main__':
     my_integrator_test = IntegratorTest()
     my_integrator_test.setUp()
@@ -2,9 +2,14 @@
 Test routine to test some of the model reduction routines
 """
 
+import os
+import tempfile
+import warnings
+import h5py
 import numpy as np
 import scipy as sp
 import nose
+import amfe
 from amfe import modal_assurance, principal_angles
 
 
@@ -59,3 +64,754 @@ def test_principal_angles():
     # test principal angle cosines of intersecting subspace
     np.testing.assert_almost_equal(gamma[:n_overlap], np.ones(n_overlap))
 
+
+def test_craig_bampton():
+    N = 60
+    K = sp.sparse.diags([-np.ones(N-1), 2*np.ones(N), -np.ones(N-1)],
+                        [-1, 0, 1], format='csr')
+    M = sp.sparse.diags(np.ones(N), format='csr')
+    b = np.zeros((N, 2))
+    b[0, 0] = 1
+    b[N-1, 1] = 1
+    no_of_modes = 4
+    V_static, V_dynamic, omega = amfe.craig_bampton(M, K, b, no_of_modes,
+                                                    one_basis=False)
+    # constraint modes are statically condensed, i.e. free of interior forces
+    interior = np.arange(1, N-1)
+    np.testing.assert_allclose((K @ V_static)[interior], 0, atol=1E-12)
+    np.testing.assert_allclose(V_static[[0, N-1]], np.eye(2))
+    # fixed interface modes
+    lambda_ref = sp.linalg.eigh(K.toarray()[1:-1, 1:-1],
+                                M.toarray()[1:-1, 1:-1], eigvals_only=True)
+    np.testing.assert_allclose(omega, np.sqrt(lambda_ref[:no_of_modes]))
+    np.testing.assert_allclose(V_dynamic[[0, N-1]], 0)
+    np.testing.assert_allclose(V_dynamic.T @ M @ V_dynamic,
+                               np.eye(no_of_modes), atol=1E-10)
+    V = amfe.craig_bampton(M, K, b, no_of_modes)
+    assert V.shape == (N, 2 + no_of_modes)
+
+class ChainSystem():
+    '''
+    Spring-mass chain with the interface of MechanicalSystem needed for the
+    modal analysis.
+    '''
+    def __init__(self, N=200):
+        self.K_lin = sp.sparse.diags([-np.ones(N-1), 2*np.ones(N),
+                                      -np.ones(N-1)], [-1, 0, 1],
+                                     format='csc')
+        self.M_lin = sp.sparse.diags(np.linspace(1, 2, N), format='csc')
+
+    def K(self, u=None, t=0):
+        return self.K_lin
+
+    def M(self, u=None, t=0):
+        return self.M_lin
+
+
+def test_compute_modes_pardiso():
+    system = ChainSystem()
+    n = 12
+    omega, V = amfe.compute_modes_pardiso(system, n=n, rtol=1E-10,
+                                          block_size=16)
+    lambda_ref = sp.linalg.eigh(system.K_lin.toarray(),
+                                system.M_lin.toarray(), eigvals_only=True)
+    np.testing.assert_allclose(omega**2, lambda_ref[:n], rtol=1E-8)
+    np.testing.assert_allclose(V.T @ system.M_lin @ V, np.eye(n), atol=1E-10)
+
+    # the iterated block keeps its size when modes are locked
+    block_sizes = []
+    m_orthonormalize = amfe.reduced_basis._m_orthonormalize
+    def m_orthonormalize_logged(S, M, X_lock=None, tol=1E-10):
+        block_sizes.append(S.shape[1])
+        return m_orthonormalize(S, M, X_lock, tol)
+    amfe.reduced_basis._m_orthonormalize = m_orthonormalize_logged
+    try:
+        amfe.compute_modes_pardiso(system, n=n, rtol=1E-10, block_size=16)
+    finally:
+        amfe.reduced_basis._m_orthonormalize = m_orthonormalize
+    # one iterated block and two Krylov blocks per restart
+    assert len(block_sizes) > 3
+    assert all(size == 16 for size in block_sizes[::3])
+
+def test_vibration_modes_spectrum_slicing():
+    system = ChainSystem(300)
+    lambda_ref = sp.linalg.eigh(system.K_lin.toarray(),
+                                system.M_lin.toarray(), eigvals_only=True)
+    omega_ref = np.sqrt(lambda_ref)
+    omega_range = (0.05, 0.6)
+    omega_ref = omega_ref[(omega_ref >= omega_range[0])
+                          & (omega_ref <= omega_range[1])]
+    for no_of_processes in (1, 2):
+        omega, V = amfe.vibration_modes(system, frequency_range=omega_range,
+                                        no_of_slices=3,
+                                        no_of_processes=no_of_processes)
+        np.testing.assert_allclose(omega, omega_ref, rtol=1E-8)
+        np.testing.assert_allclose(V.T @ system.M_lin @ V,
+                                   np.eye(len(omega)), atol=1E-8)
+
+def test_spectrum_slicing_rigid_body_mode():
+    # free chain; the lower boundary omega_min = 0 is an eigenvalue
+    system = ChainSystem(100)
+    K = system.K_lin.tolil()
+    K[0,0] = K[-1,-1] = 1
+    system.K_lin = K.tocsc()
+    lambda_ref = sp.linalg.eigh(system.K_lin.toarray(),
+                                system.M_lin.toarray(), eigvals_only=True)
+    count, sigma = amfe.reduced_basis._inertia_count(system.K_lin,
+                                                     system.M_lin, 0.)
+    assert count == 0 and sigma < 0
+    omega, V = amfe.vibration_modes(system, frequency_range=(0, 0.1),
+                                    no_of_slices=2)
+    omega_ref = np.sqrt(abs(lambda_ref[lambda_ref <= 0.01]))
+    np.testing.assert_allclose(omega, omega_ref, rtol=1E-8, atol=1E-6)
+    # dense LDL^T count
+    A = system.K_lin - 0.05*system.M_lin
+    assert amfe.reduced_basis._inertia_count_dense(A) \
+        == np.sum(lambda_ref < 0.05)
+
+class PrestressedChainSystem(ChainSystem):
+    '''
+    Chain with a stiffness depending on the (scalar) state u[0].
+    '''
+    def K(self, u=None, t=0):
+        if u is None:
+            u = np.zeros(self.K_lin.shape[0])
+        stiffening = sp.sparse.diags(u[0]*np.linspace(0, 1, self.K_lin.shape[0]))
+        return sp.sparse.csc_matrix(self.K_lin + stiffening)
+
+
+def test_track_vibration_modes():
+    system = PrestressedChainSystem(100)
+    n = 5
+    u_eq_list = [np.ones(100)*u for u in np.linspace(0, 1E-3, 4)]
+    omega, Phi, mac = amfe.track_vibration_modes(system, u_eq_list, n=n,
+                                                 rtol=1E-10)
+    for k, u_eq in enumerate(u_eq_list):
+        lambda_ref = sp.linalg.eigh(system.K(u_eq).toarray(),
+                                    system.M().toarray(), eigvals_only=True)
+        np.testing.assert_allclose(np.sort(omega[k]**2), lambda_ref[:n],
+                                   rtol=1E-8)
+    # small changes between the states: modes are tracked with high MAC
+    assert np.all(mac > 0.9)
+    for k in range(1, len(u_eq_list)):
+        assert np.all(np.einsum('ij, ij->j', Phi[k-1], Phi[k]) > 0)
+
+def test_stiffness_derivatives_cache():
+    N = 30
+    K0 = sp.sparse.diags([-np.ones(N-1), 2*np.ones(N), -np.ones(N-1)],
+                         [-1, 0, 1], format='csc')
+    M = sp.sparse.diags(np.ones(N), format='csc')
+    C = np.random.rand(N, N)
+    no_of_calls = [0]
+    def K_func(u):
+        no_of_calls[0] += 1
+        return sp.sparse.csc_matrix(K0 + sp.sparse.diags((C @ u)**2 + C @ u))
+    lambda_, V = sp.linalg.eigh(K0.toarray(), M.toarray())
+    n = 4
+    V = V[:,:n]
+    omega = np.sqrt(lambda_[:n])
+
+    Theta = amfe.modal_derivatives(V, omega, K_func, M, verbose=False)
+    # one assembly for K and two for every direction
+    assert no_of_calls[0] == 2*n + 1
+
+    dK_dx = amfe.stiffness_derivatives(V, K_func, verbose=False)
+    no_of_calls[0] = 0
+    Theta_cached = amfe.modal_derivatives(V, omega, K_func, M, verbose=False,
+                                          dK_dx=dK_dx)
+    Theta_static = amfe.static_derivatives(V, K_func, verbose=False,
+                                           dK_dx=dK_dx)
+    assert no_of_calls[0] == 2
+    np.testing.assert_allclose(Theta_cached, Theta)
+    # dK/dx_j for the quadratic term in u is exact with central differences
+    for j in range(n):
+        dK_ref = sp.sparse.diags(C @ V[:,j])
+        np.testing.assert_allclose(dK_dx[j].toarray(), dK_ref.toarray(),
+                                   atol=1E-12)
+    np.testing.assert_allclose(Theta_static, Theta_static.transpose(0,2,1))
+
+def test_analytic_stiffness_derivatives():
+    N = 30
+    K0 = sp.sparse.diags([-np.ones(N-1), 2*np.ones(N), -np.ones(N-1)],
+                         [-1, 0, 1], format='csc')
+    M = sp.sparse.diags(np.ones(N), format='csc')
+    C = np.random.rand(N, N)
+    def K_func(u):
+        return sp.sparse.csc_matrix(K0 + sp.sparse.diags((C @ u)**2 + C @ u))
+    def dK_func(u, v):
+        return sp.sparse.csc_matrix(sp.sparse.diags(2*(C @ u)*(C @ v) + C @ v))
+    lambda_, V = sp.linalg.eigh(K0.toarray(), M.toarray())
+    n = 4
+    V = V[:,:n]
+    omega = np.sqrt(lambda_[:n])
+
+    Theta = amfe.modal_derivatives(V, omega, K_func, M, verbose=False)
+    Theta_analytic = amfe.modal_derivatives(V, omega, K_func, M,
+                                            verbose=False, analytic=True,
+                                            dK_func=dK_func)
+    np.testing.assert_allclose(Theta_analytic, Theta, atol=1E-10)
+    Theta_static = amfe.static_derivatives(V, K_func, verbose=False)
+    Theta_static_analytic = amfe.static_derivatives(V, K_func, verbose=False,
+                                                    analytic=True,
+                                                    dK_func=dK_func)
+    np.testing.assert_allclose(Theta_static_analytic, Theta_static,
+                               atol=1E-10)
+    with np.testing.assert_raises(ValueError):
+        amfe.static_derivatives(V, K_func, verbose=False, analytic=True)
+
+def test_packed_theta():
+    N, n = 20, 4
+    Theta = np.random.rand(N, n, n)
+    Theta = Theta + Theta.transpose(0,2,1)
+    u = np.random.rand(n)
+    f = np.random.rand(N)
+    Theta_p = amfe.quadratic_manifold.pack_theta(Theta)
+    assert Theta_p.shape == (N, n*(n+1)//2)
+    np.testing.assert_allclose(amfe.quadratic_manifold.unpack_theta(Theta_p),
+                               Theta)
+    np.testing.assert_allclose(amfe.quadratic_manifold.theta_dot(Theta_p, u),
+                               Theta @ u)
+    np.testing.assert_allclose(
+        amfe.quadratic_manifold.theta_quadratic(Theta_p, u), (Theta @ u) @ u)
+    np.testing.assert_allclose(
+        amfe.quadratic_manifold.theta_transpose_dot(Theta_p, f),
+        np.einsum('ijk, i -> jk', Theta, f))
+    with np.testing.assert_raises(ValueError):
+        amfe.quadratic_manifold.pack_theta(np.random.rand(N, n, n))
+
+def test_augment_with_packed_derivatives():
+    N, n = 30, 3
+    V = np.linalg.qr(np.random.rand(N, n))[0]
+    Theta = np.random.rand(N, n, n)
+    Theta = Theta + Theta.transpose(0,2,1)
+    M = sp.sparse.diags(np.random.rand(N) + 1)
+    Theta_p = amfe.quadratic_manifold.pack_theta(Theta)
+    V_ext = amfe.augment_with_derivatives(V, Theta, M=M)
+    V_ext_p = amfe.augment_with_derivatives(V, Theta_p, M=M)
+    assert V_ext.shape == (N, n*(n+3)//2)
+    # same subspace
+    np.testing.assert_allclose(principal_angles(V_ext, V_ext_p),
+                               np.ones(V_ext.shape[1]), rtol=1E-8)
+    # mass orthogonalization of the packed tensor
+    lambda_, V_M = sp.linalg.eigh(np.diag(np.random.rand(N)), M.toarray())
+    V_M = V_M[:,:n]
+    Theta_orth = amfe.quadratic_manifold.theta_orth_v(Theta_p, V_M, M)
+    np.testing.assert_allclose(V_M.T @ M @ Theta_orth, 0, atol=1E-12)
+
+def test_qm_precomputed_inertia_tensors():
+    N, n = 25, 3
+    V = np.random.rand(N, n)
+    Theta = np.random.rand(N, n, n)
+    Theta = Theta + Theta.transpose(0,2,1)
+    M = sp.sparse.diags(np.random.rand(N) + 1, format='csr')
+    qm_system = amfe.quadratic_manifold.QMSystem()
+    qm_system.V = V
+    qm_system.Theta = amfe.quadratic_manifold.pack_theta(Theta)
+    qm_system.M_constr = M
+    qm_system.no_of_red_dofs = n
+    u = np.random.rand(n)
+    P = V + Theta @ u
+    np.testing.assert_allclose(qm_system.M(u), P.T @ M @ P)
+    M_Theta = (M @ Theta.reshape(N, -1)).reshape(N, n, n)
+    i, j = np.triu_indices(n)
+    M_TT = np.einsum('mij, mkl -> ijkl', Theta, M_Theta)
+    np.testing.assert_allclose(qm_system.M_TT, M_TT[i,j][:,i,j])
+
+class SnapshotSystem():
+    '''
+    Stores unconstrained snapshots in u_output like MechanicalSystem; the
+    first dof is fixed.
+    '''
+    def __init__(self, S):
+        self.u_output = [np.concatenate(([0.], s)) for s in S.T]
+
+    def constrain_vec(self, u):
+        return u[1:]
+
+def test_pod_streaming():
+    N, m, n = 120, 90, 6
+    S = np.random.rand(N, 10) @ np.random.rand(10, m) * np.logspace(0, -2, m)
+    U_ref, sigma_ref, __ = sp.linalg.svd(S, full_matrices=False)
+    M = sp.sparse.diags(np.linspace(1, 2, N), format='csc')
+    M_sqrt = np.sqrt(M.diagonal())
+    U_M_ref, sigma_M_ref, __ = sp.linalg.svd(M_sqrt[:,None]*S,
+                                              full_matrices=False)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # 2D problem exported in 3D with the bmat of tools.h5_read_u
+        h5filename = os.path.join(tmpdir, 'snapshots.hdf5')
+        u_3d = np.zeros((N*3//2, m))
+        mask = np.ones(N*3//2, dtype=bool)
+        mask[2::3] = False
+        u_3d[mask,:] = S
+        bmat = sp.sparse.eye(N, format='csr')
+        with h5py.File(h5filename, 'w') as f:
+            f.create_dataset('time_vals/Displacement', data=u_3d)
+            f.create_dataset('time', data=np.arange(m))
+            for par in ('data', 'indices', 'indptr'):
+                f.create_dataset('mesh/bmat/' + par, data=getattr(bmat, par))
+            f.create_dataset('mesh/bmat/shape', data=bmat.shape)
+
+        for source in (S, SnapshotSystem(S), h5filename):
+            for method in ('svd', 'incremental', 'randomized'):
+                sigma, V = amfe.pod(source, n=n, method=method, chunk_size=16)
+                np.testing.assert_allclose(sigma, sigma_ref[:n], rtol=1E-10)
+                np.testing.assert_allclose(abs(np.sum(V*U_ref[:,:n], 0)),
+                                           np.ones(n), rtol=1E-8)
+                sigma, V = amfe.pod(source, n=n, method=method, M=M,
+                                    chunk_size=16)
+                np.testing.assert_allclose(sigma, sigma_M_ref[:n], rtol=1E-10)
+                np.testing.assert_allclose(V.T @ M @ V, np.eye(n), atol=1E-10)
+
+    energy = np.cumsum(sigma_ref**2)/np.sum(sigma_ref**2)
+    r_ref = np.searchsorted(energy, 1 - 1E-4) + 1
+    for method in ('svd', 'incremental'):
+        sigma, V = amfe.pod(S, tol=1E-4, method=method, chunk_size=16)
+        assert len(sigma) == r_ref
+    nose.tools.assert_raises(ValueError, amfe.pod, S, method='randomized')
+
+def test_deim_selection():
+    U_f, __ = np.linalg.qr(np.random.rand(600, 30))
+    node = lambda p: (p // 3)*3 + np.arange(3)
+    for group in (None, node):
+        # reference: greedy DEIM with the normal equations
+        colloc_dofs = np.array([], dtype=int)
+        for l in range(U_f.shape[1]):
+            res = U_f[:,l]
+            if l > 0:
+                A = U_f[colloc_dofs,:l]
+                c = np.linalg.solve(A.T @ A, A.T @ U_f[colloc_dofs,l])
+                res = U_f[:,l] - U_f[:,:l] @ c
+            p = np.argmax(np.abs(res))
+            p = p if group is None else group(p)
+            colloc_dofs = np.unique(np.append(colloc_dofs, p))
+        np.testing.assert_equal(amfe.deim_selection(U_f, group), colloc_dofs)
+
+    colloc_dofs = amfe.deim_selection(U_f, method='qdeim')
+    assert len(colloc_dofs) == U_f.shape[1]
+    __, __, piv = sp.linalg.qr(U_f.T, pivoting=True)
+    np.testing.assert_equal(colloc_dofs, np.sort(piv[:U_f.shape[1]]))
+    nose.tools.assert_raises(ValueError, amfe.deim_selection, U_f,
+                             method='deim')
+
+def test_sparse_nnls():
+    G = np.random.rand(200, 500)
+    b = G @ np.ones(500)
+    norm_b = np.linalg.norm(b)
+    tau = 1E-4
+    for options in ({}, {'no_of_candidates': 4}):
+        indices, xi, stats = amfe.sparse_nnls(G, b, tau, verbose=False,
+                                              **options)
+        assert np.all(xi > 0)
+        res = np.linalg.norm(G[:,indices] @ xi - b)
+        assert res <= tau*norm_b
+        np.testing.assert_allclose(stats['residual'][-1], res)
+        assert stats['no_of_elements'][-1] == len(indices)
+
+    # warm start from the previous solution with a perturbed right hand side
+    xi0 = np.zeros(500)
+    xi0[indices] = xi
+    b_new = b + 1E-4*norm_b*np.random.rand(200)/10
+    indices, xi, stats_warm = amfe.sparse_nnls(G, b_new, tau, verbose=False,
+                                               xi0=xi0)
+    assert np.linalg.norm(G[:,indices] @ xi - b_new) <= tau*norm_b
+    assert len(stats_warm) < len(stats)
+
+    indices, xi, stats = amfe.sparse_nnls(G, b, tau, verbose=False,
+                                          max_no_of_elements=10)
+    assert len(indices) == 10
+
+    # elements are removed after the active set reached the number of rows
+    # of G, i.e. after the QR decomposition became square
+    rng = np.random.RandomState(0)
+    for i in range(10):
+        G = rng.rand(6, 40)
+        b = G @ rng.rand(40)
+        indices, xi, stats = amfe.sparse_nnls(G, b, 1E-8, verbose=False,
+                                              no_of_candidates=4)
+        assert np.all(xi > 0)
+        res = np.linalg.norm(G[:,indices] @ xi - b)
+        assert res <= 1E-8*np.linalg.norm(b)
+        np.testing.assert_allclose(stats['residual'][-1], res,
+                                   atol=1E-12*np.linalg.norm(b))
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        amfe.sparse_nnls(G, b, tau, conv_stats=True, verbose=False,
+                         max_no_of_elements=10)
+    assert any(issubclass(w.category, DeprecationWarning) for w in caught)
+
+def test_row_compression():
+    # low rank contribution matrix fed in column blocks
+    G = np.random.rand(300, 8) @ np.random.rand(8, 250)
+    b = np.sum(G, axis=1)
+    xi = np.random.rand(250)
+    res = np.linalg.norm(G @ xi - b)
+    for compression in (amfe.RowCompression(method='svd'),
+                        amfe.RowCompression(8, method='svd'),
+                        amfe.RowCompression(100, method='gaussian'),
+                        amfe.RowCompression(100, method='sparse_sign')):
+        for i in range(0, 250, 40):
+            compression.update(G[:,i:i+40])
+        G_c = compression.compressed_matrix()
+        np.testing.assert_allclose(compression.b_full, b)
+        res_c = np.linalg.norm(G_c @ xi - np.sum(G_c, axis=1))
+        if compression.method == 'svd':
+            assert G_c.shape == (8, 250)
+            np.testing.assert_allclose(res_c, res, rtol=1E-8)
+        else:
+            assert G_c.shape == (100, 250)
+            assert 0.5*res < res_c < 1.5*res
+    # reuse for a second matrix of another size
+    nose.tools.assert_raises(ValueError, compression.update, G[:10,:40])
+    compression.reset()
+    compression.update(G[:10,:40])
+    assert compression.compressed_matrix().shape == (100, 40)
+    np.testing.assert_allclose(compression.b_full, np.sum(G[:10,:40], axis=1))
+    # every column of the sparse sign sketch has distinct rows
+    Omega = compression.Omega.toarray()
+    assert np.all(np.sum(Omega != 0, axis=0) == 8)
+    Omega = amfe.RowCompression(10, method='sparse_sign',
+                                nnz_per_column=9)._build_sketch(500)
+    assert np.all(np.sum(Omega.toarray() != 0, axis=0) == 9)
+    nose.tools.assert_raises(ValueError, amfe.RowCompression, 10, 'random')
+    nose.tools.assert_raises(ValueError, amfe.RowCompression)
+
+def bar_system():
+    '''
+    Clamped plane stress bar of 100 Quad4 elements with Kirchhoff material.
+    '''
+    system = amfe.MechanicalSystem()
+    material = amfe.KirchhoffMaterial(E=210E9, nu=0.3, rho=1E4,
+                                      plane_stress=True)
+    system.mesh_class.import_msh(
+        amfe.amfe_dir('meshes/test_meshes/bar_Quad4_simple.msh'))
+    system.mesh_class.load_group_to_mesh(6, material, mesh_prop='geom_entity')
+    system.no_of_dofs_per_node = system.mesh_class.no_of_dofs_per_node
+    system.assembly_class.preallocate_csr()
+    system.dirichlet_class.no_of_unconstrained_dofs = \
+        system.mesh_class.no_of_dofs
+    system.dirichlet_class.update()
+    system.apply_dirichlet_boundaries(4, 'xy', mesh_prop='geom_entity')
+    return system
+
+def bar_modes(system, n):
+    K = system.K().toarray()
+    M = system.M().toarray()
+    __, V = sp.linalg.eigh(K, M)
+    return V[:,:n]
+
+def test_ecsw_incremental_training():
+    system = bar_system()
+    V = bar_modes(system, 4)
+    W_red = np.random.rand(4, 20)*5E-2
+    tau = 1E-3
+    ecsw_system = amfe.reduce_mechanical_system_ecsw(system, V)
+    no_of_elements = system.mesh_class.no_of_elements
+
+    ecsw_system.reduce_mesh(W_red, tau=tau, verbose=False)
+    assert ecsw_system.G_train is None
+    ecsw_system.reduce_mesh(W_red[:,:10], tau=tau, verbose=False,
+                            incremental=True)
+    assert ecsw_system.G_train.shape == (4*10, no_of_elements)
+    assert ecsw_system.training_error <= tau
+    xi_indices, xi, stats = ecsw_system.reduce_mesh(
+        W_red[:,10:], tau=tau, verbose=False, incremental=True)
+    assert ecsw_system.G_train.shape == (4*20, no_of_elements)
+    np.testing.assert_allclose(ecsw_system.W_train, W_red)
+    assert ecsw_system.training_error <= tau
+    G, b = system.assembly_class.assemble_g_and_b(ecsw_system.V_unconstr,
+                                                  ecsw_system.V_unconstr @ W_red)
+    assert np.linalg.norm(G[:,xi_indices] @ xi - b) <= tau*np.linalg.norm(b)
+    xi_indices, xi, stats_full = ecsw_system.reduce_mesh(W_red, tau=tau,
+                                                         verbose=False)
+    assert len(stats) < len(stats_full)
+    assert ecsw_system.G_train is None
+
+    # compressed training with the error on the uncompressed training set
+    ecsw_system.reduce_mesh(W_red[:,:10], tau=tau, verbose=False,
+                            incremental=True,
+                            row_compression=amfe.RowCompression(method='svd'))
+    xi_indices, xi, stats = ecsw_system.reduce_mesh(
+        W_red[:,10:], tau=tau, verbose=False, incremental=True,
+        row_compression=amfe.RowCompression(method='svd'))
+    np.testing.assert_allclose(ecsw_system.training_error,
+        np.linalg.norm(G[:,xi_indices] @ xi - b) / np.linalg.norm(b))
+    ecsw_system.release_training_data()
+    assert ecsw_system.G_train is None
+
+def test_deim_force_basis():
+    system = bar_system()
+    V = bar_modes(system, 4)
+    U = system.unconstrain_vec(V @ (np.random.rand(4, 30)*5E-2))
+    deim_system = amfe.reduce_mechanical_system_deim(system, V)
+    deim_system.preprocess_DEIM('unassem-deim-dof')
+    F = system.assembly_class.f_nl_unassembled_snapshots(U)
+    U_f_ref, __, __ = sp.linalg.svd(F, full_matrices=False)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'force_snapshots.npy')
+        # randomized SVD for few modes, full SVD for many modes
+        for n, options in ((5, {}), (20, {}),
+                           (5, {'no_of_processes': 2, 'chunk_size': 8}),
+                           (5, {'filename': filename})):
+            U_f = deim_system.force_basis(U, n, **options)
+            np.testing.assert_allclose(abs(np.sum(U_f*U_f_ref[:,:n], 0)),
+                                       np.ones(n), rtol=1E-8)
+        np.testing.assert_allclose(np.load(filename), F)
+
+def test_deim_online_assembly():
+    system = bar_system()
+    V = bar_modes(system, 4)
+    U = V @ (np.random.rand(4, 20)*5E-2)
+    assembly = system.assembly_class
+    u = np.random.rand(4)*2E-2
+    for DEIM_type in ('unassem-deim-dof', 'unassem-deim-node-symm'):
+        deim_system = amfe.reduce_mechanical_system_deim(system, V)
+        deim_system.reduce_mesh(U, no_of_force_modes=8, DEIM_type=DEIM_type)
+        symmetric = deim_system.sym_flag
+        # reference: loop over the sampled elements
+        K_ref = np.zeros((4, 4))
+        f_ref = np.zeros(4)
+        for proj, ele in zip(deim_system.proj_list, deim_system.E_tilde):
+            indices = assembly.element_indices[ele]
+            V_ele = deim_system.V_unconstr[indices]
+            u_local = proj.T @ u if symmetric else V_ele @ u
+            K_ele, f_ele = system.mesh_class.ele_obj[ele].k_and_f_int(
+                assembly.nodes_voigt[indices], u_local)
+            f_ref += proj @ f_ele
+            K_ref += proj @ K_ele @ (proj.T if symmetric else V_ele)
+        K, f = assembly.assemble_k_and_f_DEIM(
+            deim_system.E_tilde, deim_system.proj_list,
+            deim_system.V_unconstr, u_red=u, symmetric=symmetric)
+        np.testing.assert_allclose(K, K_ref, rtol=1E-10)
+        np.testing.assert_allclose(f, f_ref, rtol=1E-10)
+        K, f = deim_system.K_and_f(u)
+        np.testing.assert_allclose(K - deim_system.K0_deim, K_ref, rtol=1E-10)
+        K0, f0 = deim_system.K_and_f()
+        K0_ref = V.T @ system.K() @ V
+        np.testing.assert_allclose(K0, K0_ref, atol=1E-10*abs(K0_ref).max())
+
+def test_sampled_mesh():
+    system = bar_system()
+    V = bar_modes(system, 4)
+    Q = np.random.rand(4, 10)*5E-2
+    U = V @ Q
+    u = np.random.rand(4)*2E-2
+    assembly = system.assembly_class
+
+    ecsw_system = amfe.reduce_mechanical_system_ecsw(system, V)
+    ecsw_system.reduce_mesh(Q, tau=0.01, verbose=False)
+    sampled_mesh = ecsw_system.sampled_mesh
+    # renumbered dofs and rows of V
+    no_of_elements = len(ecsw_system.weight_idx)
+    np.testing.assert_equal(sampled_mesh.no_of_elements, no_of_elements)
+    np.testing.assert_equal(sampled_mesh.no_of_dofs, 2*len(sampled_mesh.node_ids))
+    np.testing.assert_equal(sampled_mesh.V.shape, (sampled_mesh.no_of_dofs, 4))
+    np.testing.assert_equal(len(sampled_mesh.nodes), len(sampled_mesh.node_ids))
+    for i, ele in enumerate(ecsw_system.weight_idx):
+        local_dofs = sampled_mesh.element_indices[i]
+        np.testing.assert_equal(sampled_mesh.dofs[local_dofs],
+                                assembly.element_indices[ele])
+    np.testing.assert_equal(sampled_mesh.V,
+                            ecsw_system.V_unconstr[sampled_mesh.dofs])
+    K, f = ecsw_system.K_and_f(u)
+    K_ref, f_ref = assembly.assemble_k_and_f_hyper(
+        ecsw_system.V_unconstr, ecsw_system.weight_idx, ecsw_system.weights,
+        u, 0)
+    np.testing.assert_allclose(K, K_ref, rtol=1E-10)
+    np.testing.assert_allclose(f, f_ref, rtol=1E-10)
+
+    deim_system = amfe.reduce_mechanical_system_deim(system, V)
+    deim_system.reduce_mesh(U, no_of_force_modes=8,
+                            DEIM_type='unassem-deim-dof')
+    K, f = deim_system.K_and_f(u)
+    K_ref, f_ref = assembly.assemble_k_and_f_DEIM(
+        deim_system.E_tilde, deim_system.proj_list, deim_system.V_unconstr,
+        u_red=u)
+    np.testing.assert_allclose(K - deim_system.K0_deim, K_ref, rtol=1E-10)
+    np.testing.assert_allclose(f - deim_system.K0_deim @ u, f_ref,
+                               rtol=1E-10)
+
+def test_rom_artifact():
+    system = bar_system()
+    system.apply_neumann_boundaries('straight_line', 1E8, np.array([0, -1]),
+                                    time_func=np.sin, mesh_prop='el_type')
+    system.apply_rayleigh_damping(1E-2, 1E-5)
+    V = bar_modes(system, 4)
+    Q = np.random.rand(4, 10)*5E-2
+    u = np.random.rand(4)*2E-2
+    du = np.random.rand(4)
+    t = 0.3
+    filename = os.path.join(tempfile.mkdtemp(), 'rom.hdf5')
+
+    reduced_system = amfe.reduce_mechanical_system(system, V)
+    ecsw_system = amfe.reduce_mechanical_system_ecsw(system, V)
+    ecsw_system.reduce_mesh(Q, tau=0.01, verbose=False)
+    deim_system = amfe.reduce_mechanical_system_deim(system, V)
+    deim_system.reduce_mesh(V @ Q, no_of_force_modes=8,
+                            DEIM_type='unassem-deim-node-symm')
+    for rom in (reduced_system, ecsw_system, deim_system):
+        amfe.save_rom_artifact(rom, filename, store_basis=True)
+        online_system = amfe.load_rom_artifact(filename, time_funcs=[np.sin])
+        K, f = online_system.K_and_f(u, t)
+        K_ref, f_ref = rom.K_and_f(u, t)
+        np.testing.assert_allclose(K, K_ref, rtol=1E-10,
+                                   atol=1E-10*abs(K_ref).max())
+        np.testing.assert_allclose(f, f_ref, rtol=1E-10,
+                                   atol=1E-10*abs(f_ref).max())
+        np.testing.assert_allclose(online_system.M(), rom.M(), rtol=1E-12)
+        np.testing.assert_allclose(online_system.D(), rom.D_constr,
+                                   rtol=1E-12)
+        np.testing.assert_allclose(online_system.f_ext(u, du, t),
+                                   rom.f_ext(u, du, t), rtol=1E-10)
+        online_system.write_timestep(t, u)
+        np.testing.assert_allclose(online_system.u_output[0],
+                                   rom.V_unconstr @ u)
+
+def test_polynomial_system():
+    system = bar_system()
+    V = bar_modes(system, 4)
+    reduced_system = amfe.reduce_mechanical_system(system, V)
+    poly_system = amfe.reduce_mechanical_system_polynomial(system, V)
+    poly_system.compute_step_tensors(verbose=False)
+    n = 4
+    assert poly_system.K2.shape == (n, n*(n+1)//2)
+    assert poly_system.K3.shape == (n, n, n*(n+1)//2)
+    for scale in (1E-3, 1E-1, 1):
+        u = (np.random.rand(n) - 0.5)*scale / abs(V).max()
+        K, f = poly_system.K_and_f(u)
+        K_ref, f_ref = reduced_system.K_and_f(u)
+        np.testing.assert_allclose(K, K_ref, rtol=1E-7,
+                                   atol=1E-7*abs(K_ref).max())
+        np.testing.assert_allclose(f, f_ref, rtol=1E-7,
+                                   atol=1E-7*abs(f_ref).max())
+
+class SparseOperatorSystem():
+    '''
+    Linear system with the operators of a reduced system as sparse matrices.
+    '''
+    def __init__(self, reduced_system):
+        self.reduced_system = reduced_system
+        self.q = []
+
+    def K(self):
+        return sp.sparse.csr_matrix(self.reduced_system.K())
+
+    def M(self):
+        return sp.sparse.csr_matrix(self.reduced_system.M())
+
+    def D(self):
+        return sp.sparse.csr_matrix(self.reduced_system.D())
+
+    def f_ext(self, q, dq, t):
+        return self.reduced_system.f_ext(q, dq, t)
+
+    def write_timestep(self, t, q):
+        self.q.append(q)
+
+    def clear_timesteps(self):
+        self.q = []
+
+def test_reduced_system_linear_operators():
+    system = bar_system()
+    system.apply_neumann_boundaries('straight_line', 1E8, np.array([0, -1]),
+                                    time_func=np.sin, mesh_prop='el_type')
+    system.apply_rayleigh_damping(1E-2, 1E-5)
+    V = bar_modes(system, 4)
+    reduced_system = amfe.reduce_mechanical_system(system, V)
+    u = np.random.rand(4)*1E-2
+    t = 0.3
+
+    M = system.M()
+    K = system.K()
+    np.testing.assert_allclose(reduced_system.M(), V.T @ M @ V, rtol=1E-12)
+    np.testing.assert_allclose(reduced_system.K(), V.T @ K @ V, rtol=1E-10,
+                               atol=1E-10*abs(K).max())
+    np.testing.assert_allclose(reduced_system.D(), V.T @ system.D() @ V,
+                               rtol=1E-12)
+    np.testing.assert_allclose(reduced_system.f_ext(u, None, t),
+                               V.T @ system.f_ext(V @ u, None, t), rtol=1E-10)
+
+    # the linear integrators only use the cached dense operators
+    def no_full_assembly(*args, **kwargs):
+        raise AssertionError('The full system must not be assembled.')
+    reduced_system.assembly_class.assemble_m = no_full_assembly
+    reduced_system.assembly_class.assemble_k_and_f = no_full_assembly
+    T = np.arange(0, 0.05, 1E-3)
+    for integrator in (amfe.integrate_linear_system,
+                       amfe.integrate_linear_gen_alpha):
+        sparse_system = SparseOperatorSystem(reduced_system)
+        integrator(reduced_system, np.zeros(4), np.zeros(4), T, 1E-3)
+        integrator(sparse_system, np.zeros(4), np.zeros(4), T, 1E-3)
+        q_ref = np.array(sparse_system.q)
+        np.testing.assert_allclose(np.array(reduced_system.u_red_output), q_ref,
+                                   rtol=1E-8, atol=1E-8*abs(q_ref).max())
+
+def test_qm_ecsw():
+    system = bar_system()
+    system.apply_neumann_boundaries('straight_line', 1E8, np.array([0, -1]),
+                                    time_func=np.sin, mesh_prop='el_type')
+    n = 3
+    V = bar_modes(system, n)
+    N = V.shape[0]
+    Theta = np.random.rand(N, n, n)*abs(V).max()
+    Theta = Theta + Theta.transpose(0,2,1)
+    U_red = (np.random.rand(n, 5) - 0.5)*2E-2
+    u = U_red[:,0]
+    t = 0.3
+    qm_system = amfe.quadratic_manifold.reduce_mechanical_system_qm(system, V,
+                                                                    Theta)
+
+    # external force lifted on the Neumann dofs only
+    u_full = V @ u + 1/2*np.einsum('mij, i, j -> m', Theta, u, u)
+    P = V + Theta @ u
+    f_ext_full = amfe.MechanicalSystem.f_ext(qm_system, u_full, None, t)
+    f_ext, K_ext = qm_system._f_ext_and_K_ext(u, t)
+    np.testing.assert_allclose(f_ext, P.T @ f_ext_full, rtol=1E-10)
+    np.testing.assert_allclose(K_ext,
+                               np.einsum('mij, m -> ij', Theta, f_ext_full),
+                               rtol=1E-10, atol=1E-10*abs(K_ext).max())
+
+    # iteration matrix and residual with the precomputed inertia tensors
+    # against the evaluation with the full mass matrix
+    du, ddu = U_red[:,1], U_red[:,2]*1E3
+    dt, beta, gamma = 1E-4, 1/4, 1/2
+    S, res, f_ext = qm_system.S_and_res(u, du, ddu, dt, t, beta, gamma)
+    M = qm_system.M_constr
+    K_full, f_int_full = amfe.MechanicalSystem.K_and_f(qm_system, u_full, t)
+    res_full = M @ (P @ ddu) + M @ np.einsum('mij, i, j -> m', Theta, du, du) \
+               + f_int_full - f_ext_full
+    K = np.einsum('mij, m -> ij', Theta, res_full) \
+        + P.T @ M @ (Theta @ ddu) + P.T @ K_full @ P
+    G = P.T @ M @ (2*Theta @ du)
+    S_ref = 1/(dt**2*beta) * P.T @ M @ P + gamma/(dt*beta) * G + K
+    np.testing.assert_allclose(res, P.T @ res_full, rtol=1E-8,
+                               atol=1E-10*abs(res).max())
+    np.testing.assert_allclose(S, S_ref, rtol=1E-8, atol=1E-10*abs(S).max())
+
+    # hyper reduction with all elements and unit weights is exact
+    qm_ecsw_system = amfe.reduce_mechanical_system_qm_ecsw(system, V, Theta)
+    no_of_elements = system.mesh_class.no_of_elements
+    qm_ecsw_system.weight_idx = np.arange(no_of_elements)
+    qm_ecsw_system.weights = np.ones(no_of_elements)
+    K_ref, f_ref = qm_system.K_and_f(u, t)
+    K, f = qm_ecsw_system.K_and_f(u, t)
+    np.testing.assert_allclose(K, K_ref, rtol=1E-10,
+                               atol=1E-10*abs(K_ref).max())
+    np.testing.assert_allclose(f, f_ref, rtol=1E-10,
+                               atol=1E-10*abs(f_ref).max())
+
+    # G contains the element contributions of the reduced internal force
+    G, b = system.assembly_class.assemble_g_and_b_qm(
+        qm_ecsw_system.V_unconstr, qm_ecsw_system.Theta_unconstr, U_red)
+    for j, u_j in enumerate(U_red.T):
+        f_ref = qm_system.K_and_f(u_j)[1]
+        np.testing.assert_allclose(b[j*n:(j+1)*n], f_ref, rtol=1E-10,
+                                   atol=1E-10*abs(f_ref).max())
+    tau = 1E-3
+    xi_indices, xi, stats = qm_ecsw_system.reduce_mesh(U_red, tau=tau,
+                                                       verbose=False)
+    f_ecsw = np.concatenate([qm_ecsw_system.K_and_f(u_j)[1]
+                             for u_j in U_red.T])
+    np.testing.assert_allclose(f_ecsw, G[:,xi_indices] @ xi, rtol=1E-10,
+                               atol=1E-10*abs(b).max())
+    assert np.linalg.norm(f_ecsw - b) <= tau*np.linalg.norm(b)
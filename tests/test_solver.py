@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+'''
+Test routines for the static solvers in amfe.solver.
+'''
+
+import unittest
+import os
+import tempfile
+import h5py
+import numpy as np
+import scipy as sp
+from scipy import sparse
+
+import amfe
+
+
+class NonlinearSpringSystem():
+    '''
+    Simple static system with the internal force
+    f_int = K @ u + c * u**3 - c2 * u**2 and the external force t*f.
+    '''
+
+    def __init__(self, K, f, c=0., c2=0.):
+        self.K_lin = sp.sparse.csr_matrix(K)
+        self.f = f
+        self.c = c
+        self.c2 = c2
+        self.clear_timesteps()
+
+    def K_and_f(self, u=None, t=0):
+        if u is None:
+            u = np.zeros_like(self.f)
+        f_int = self.K_lin @ u + self.c*u**3 - self.c2*u**2
+        K = self.K_lin + sp.sparse.diags(3*self.c*u**2 - 2*self.c2*u)
+        return sp.sparse.csr_matrix(K), f_int
+
+    def f_ext(self, u, du, t):
+        return t*self.f
+
+    def write_timestep(self, t, u):
+        self.T_output.append(t)
+        self.u_output.append(u.copy())
+
+    def clear_timesteps(self):
+        self.T_output = []
+        self.u_output = []
+
+
+class NonlinearStaticSolverTest(unittest.TestCase):
+    def setUp(self):
+        K = np.array([[2., -1, 0],
+                      [-1, 2, -1],
+                      [0, -1, 1]])
+        f = np.array([0, 0, 10.])
+        self.system = NonlinearSpringSystem(K, f, c=1.)
+
+    def test_adaptive_vs_fixed_steps(self):
+        u_fixed = amfe.solve_nonlinear_displacement(self.system,
+                                                    no_of_load_steps=50,
+                                                    verbose=False)
+        u_adaptive = amfe.solve_nonlinear_displacement(self.system,
+                                                       no_of_load_steps=2,
+                                                       adaptive=True,
+                                                       predictor=True,
+                                                       verbose=False)
+        np.testing.assert_allclose(u_adaptive[:,-1], u_fixed[:,-1],
+                                   rtol=1E-7)
+        np.testing.assert_almost_equal(self.system.T_output[-1], 1)
+        self.assertLess(u_adaptive.shape[1], u_fixed.shape[1])
+
+    def test_predictor(self):
+        u_ref = amfe.solve_nonlinear_displacement(self.system,
+                                                  no_of_load_steps=10,
+                                                  verbose=False)
+        u_pred = amfe.solve_nonlinear_displacement(self.system,
+                                                   no_of_load_steps=10,
+                                                   predictor=True,
+                                                   verbose=False)
+        np.testing.assert_allclose(u_pred, u_ref, rtol=1E-7)
+
+    def test_cutback(self):
+        # one single step fails; the load increment has to be cut back
+        u = amfe.solve_nonlinear_displacement(self.system, no_of_load_steps=1,
+                                              max_stepwidth=1., n_iter_opt=2,
+                                              adaptive=True, verbose=False,
+                                              track_niter=True)
+        K, f_int = self.system.K_and_f(u[:,-1])
+        np.testing.assert_allclose(f_int, self.system.f, atol=1E-6)
+        self.assertGreater(u.shape[1], 1)
+
+    def test_conv_abort(self):
+        # no step converges within a single Newton iteration
+        options = dict(no_of_load_steps=2, n_max_iter=1, n_iter_opt=1,
+                       min_stepwidth=0.1, adaptive=True, verbose=False)
+        u = amfe.solve_nonlinear_displacement(self.system, **options)
+        self.assertEqual(u.size, 0)
+        u = amfe.solve_nonlinear_displacement(self.system, conv_abort=False,
+                                              **options)
+        np.testing.assert_almost_equal(self.system.T_output[-1], 1)
+        self.assertTrue(np.all(np.isfinite(u)))
+
+    def test_arc_length_limit_point(self):
+        # snap-through of a single spring with a limit point at
+        # u = 1 - 1/sqrt(3) and the load 0.385
+        system = NonlinearSpringSystem(np.eye(1), np.array([1.]),
+                                       c=0.5, c2=1.5)
+        u = amfe.solve_nonlinear_displacement(system, no_of_load_steps=10,
+                                              arc_length=True, verbose=False)
+        u_end = u[0,-1]
+        np.testing.assert_almost_equal(system.T_output[-1], 1)
+        np.testing.assert_almost_equal(0.5*u_end**3 - 1.5*u_end**2 + u_end,
+                                       1)
+        # the equilibrium path passes the unstable branch
+        self.assertGreater(u_end, 2)
+        self.assertTrue(np.any(np.diff(system.T_output) < 0))
+
+
+class MultipleRhsTest(unittest.TestCase):
+    def setUp(self):
+        N = 50
+        A = sp.sparse.random(N, N, density=0.1) + 10*sp.sparse.eye(N)
+        self.A = sp.sparse.csc_matrix(A + A.T)
+        self.B = np.random.rand(N, 4)
+
+    def test_solve_sparse_block(self):
+        X = amfe.solve_sparse(self.A, self.B)
+        for i in range(self.B.shape[1]):
+            x = amfe.solve_sparse(self.A, self.B[:,i])
+            np.testing.assert_allclose(X[:,i], x)
+
+    def test_spsolve_block(self):
+        LU_object = amfe.SpSolve(self.A)
+        X = LU_object.solve(self.B)
+        X_sparse_rhs = LU_object.solve(sp.sparse.csr_matrix(self.B))
+        LU_object.clear()
+        np.testing.assert_allclose(self.A @ X, self.B, atol=1E-12)
+        np.testing.assert_allclose(X_sparse_rhs, X)
+
+    def test_spsolve_update(self):
+        LU_object = amfe.SpSolve(self.A)
+        A_new = self.A.copy()
+        A_new.data *= np.random.rand(len(A_new.data)) + 0.5
+        A_new = A_new + A_new.T
+        LU_object.update(A_new)
+        X = LU_object.solve(self.B)
+        LU_object.clear()
+        np.testing.assert_allclose(A_new @ X, self.B, atol=1E-10)
+
+    def test_force_norm_block(self):
+        M = sp.sparse.eye(self.A.shape[0])
+        for norm in ('euclidean', 'impedance', 'kinetic'):
+            norms = amfe.force_norm(self.B, self.A, M, norm=norm)
+            for i in range(self.B.shape[1]):
+                norm_i = amfe.force_norm(self.B[:,i], self.A, M, norm=norm)
+                np.testing.assert_allclose(norms[i], norm_i)
+
+
+class LinearSystem():
+    '''
+    Linear system with sparse matrices K, M and D and constant force f.
+    '''
+
+    def __init__(self, K, M, D, f):
+        self.K_lin = K
+        self.M_lin = M
+        self.D_lin = D
+        self.f = f
+
+    def K(self, u=None, t=0):
+        return self.K_lin
+
+    def M(self, u=None, t=0):
+        return self.M_lin
+
+    def D(self, u=None, t=0):
+        return self.D_lin
+
+    def f_ext(self, u, du, t):
+        return t*self.f
+
+
+class HarmonicSolverTest(unittest.TestCase):
+    def setUp(self):
+        N = 30
+        K = sp.sparse.diags([-np.ones(N-1), 2*np.ones(N), -np.ones(N-1)],
+                            [-1, 0, 1])
+        M = sp.sparse.diags(np.ones(N)*0.1)
+        D = 0.01*K + 0.1*M
+        f = np.zeros(N)
+        f[-1] = 1.
+        self.system = LinearSystem(sp.sparse.csc_matrix(K),
+                                   sp.sparse.csc_matrix(M),
+                                   sp.sparse.csc_matrix(D), f)
+        self.omegas = np.linspace(0.1, 3, 25)
+        self.X_ref = np.array([np.linalg.solve((K + 1j*om*D
+                                                - om**2*M).toarray(), f)
+                               for om in self.omegas]).T
+
+    def test_harmonic(self):
+        X = amfe.solve_harmonic(self.system, self.omegas, block_size=10,
+                                verbose=False)
+        np.testing.assert_allclose(X, self.X_ref, rtol=1E-10)
+
+    def test_harmonic_parallel_h5(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'harmonic.hdf5')
+            X = amfe.solve_harmonic(self.system, self.omegas, block_size=5,
+                                    no_of_processes=2, h5filename=filename,
+                                    verbose=False)
+            self.assertIsNone(X)
+            with h5py.File(filename, 'r') as h5file:
+                np.testing.assert_allclose(h5file['harmonic/omega'][()],
+                                           self.omegas)
+                np.testing.assert_allclose(h5file['harmonic/x'][()],
+                                           self.X_ref, rtol=1E-10)
+
+    def test_harmonic_zero_frequency(self):
+        # the dynamic stiffness at omega = 0 lacks the pattern of M
+        N = self.system.K_lin.shape[0]
+        M = self.system.M_lin.tolil()
+        M[0,N-1] = M[N-1,0] = 0.01
+        system = LinearSystem(self.system.K_lin, M.tocsc(),
+                              self.system.D_lin, self.system.f)
+        omegas = np.concatenate(([0.], self.omegas))
+        X_ref = np.array([np.linalg.solve((system.K_lin + 1j*om*system.D_lin
+                                           - om**2*system.M_lin).toarray(),
+                                          system.f)
+                          for om in omegas]).T
+        X = amfe.solve_harmonic(system, omegas, block_size=10, verbose=False)
+        np.testing.assert_allclose(X, X_ref, rtol=1E-10)
+
+    def test_harmonic_modal(self):
+        K = self.system.K().toarray()
+        M = self.system.M().toarray()
+        lambda_, V = sp.linalg.eigh(K, M)
+        X = amfe.solve_harmonic(self.system, self.omegas, modal=True, V=V,
+                                omega=np.sqrt(lambda_), verbose=False)
+        np.testing.assert_allclose(X, self.X_ref, rtol=1E-8)
+
+
+class LoadCaseTest(unittest.TestCase):
+    def setUp(self):
+        N = 20
+        K = sp.sparse.diags([-np.ones(N-1), 2*np.ones(N), -np.ones(N-1)],
+                            [-1, 0, 1])
+        self.system = LinearSystem(sp.sparse.csc_matrix(K), None, None,
+                                   np.ones(N))
+        self.F = np.random.rand(N, 7)
+        self.U_ref = np.linalg.solve(K.toarray(), self.F)
+
+    def test_load_cases(self):
+        U = amfe.solve_linear_load_cases(self.system, self.F, block_size=3,
+                                         verbose=False)
+        np.testing.assert_allclose(U, self.U_ref, rtol=1E-10)
+
+    def test_load_cases_times(self):
+        t = np.array([0.5, 1., 2.])
+        U = amfe.solve_linear_load_cases(self.system, t=t, verbose=False)
+        np.testing.assert_allclose(U[:,2], 4*U[:,0])
+        np.testing.assert_allclose(self.system.K() @ U[:,1], self.system.f)
+
+    def test_load_cases_h5(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'load_cases.hdf5')
+            U = amfe.solve_linear_load_cases(self.system, self.F,
+                                             block_size=4,
+                                             h5filename=filename,
+                                             verbose=False)
+            self.assertIsNone(U)
+            with h5py.File(filename, 'r') as h5file:
+                np.testing.assert_allclose(h5file['load_cases/u'][()],
+                                           self.U_ref, rtol=1E-10)
+
+
+if __name__ == '__main__':
+    unittest.main()